@@ -1,9 +1,13 @@
 from datetime import datetime, timedelta
+from ..utils.as_path_table import get_path_table
 
 def analyze_route_flaps(historical_updates, time_window_minutes=5, min_transitions_for_flap=4, rapid_flap_interval_seconds=60):
     """
     Analyze BGP updates for route flapping patterns with improved detection logic.
     
+    AS paths are compared by their id in the shared path table, so path changes
+    between consecutive announcements are integer comparisons.
+    
     Args:
         historical_updates: List of update dictionaries with timestamp, type (A/W), as_path
         time_window_minutes: Time window to analyze for flaps (default: 5 minutes)
@@ -50,10 +54,20 @@ def analyze_route_flaps(historical_updates, time_window_minutes=5, min_transitio
     last_state = relevant_updates[0]["type"]
     announcement_count = 0
     withdrawal_count = 0
+    paths = get_path_table()
+    seen_paths = set()
+    last_path = None
+    path_changes = 0
     
     for update in relevant_updates:
         if update["type"] == "A":
             announcement_count += 1
+            path_id = paths.intern_str(update.get("as_path"))
+            if path_id is not None:
+                if last_path is not None and path_id != last_path:
+                    path_changes += 1
+                last_path = path_id
+                seen_paths.add(path_id)
         else:
             withdrawal_count += 1
             
@@ -125,7 +139,9 @@ def analyze_route_flaps(historical_updates, time_window_minutes=5, min_transitio
         "stats": {
             "announcements": announcement_count,
             "withdrawals": withdrawal_count,
-            "total_updates": len(relevant_updates)
+            "total_updates": len(relevant_updates),
+            "unique_as_paths": len(seen_paths),
+            "path_changes": path_changes
         }
     }
 
@@ -145,21 +145,85 @@ def format_context_data(context_data: Dict[str, Any]) -> str:
     
     if "live_bgp" in context_data and context_data["live_bgp"].get("routes"):
         parts.append("=== CURRENT BGP STATE ===")
+        if context_data["live_bgp"].get("collector"):
+            parts.append(f"View: routes seen through collector {context_data['live_bgp']['collector']}")
         for route in context_data["live_bgp"]["routes"]:
             if route["type"] == "exact_match":
                 parts.append(f"Exact Match for Prefix: {route['prefix']}")
             elif route["type"] == "longest_prefix_match":
                 parts.append(f"Longest Prefix Match for IP: {route['ip']}")
                 parts.append(f"Matching Prefix: {route['matching_prefix']}")
+            elif route["type"] in ("more_specific_match", "less_specific_match", "sibling_match"):
+                relation = {
+                    "more_specific_match": "More-Specific Prefixes of",
+                    "less_specific_match": "Less-Specific (Covering) Prefixes of",
+                    "sibling_match": "Sibling Prefixes of",
+                }[route["type"]]
+                count = route["count"] if route["count"] is not None else f"more than {len(route['matches'])}"
+                parts.append(f"{relation} {route['prefix']}: {count} found")
+                for match in route["matches"]:
+                    data = match["data"]
+                    parts.append(f"- {match['prefix']} Origin AS: {data.get('origin_as', 'Unknown')} "
+                                 f"AS Path: {data.get('as_path', 'Unknown')}")
+                if route["count"] is None or route["count"] > len(route["matches"]):
+                    parts.append(f"(showing first {len(route['matches'])})")
+            elif route["type"] == "origin_match":
+                space = route["address_space"]
+                parts.append(f"Prefixes Originated by AS{route['asn']}: {route['prefix_count']} "
+                             f"({route['ipv4_prefixes']} IPv4, {route['ipv6_prefixes']} IPv6)")
+                parts.append(f"Address Space: {space['ipv4_addresses']} IPv4 addresses, "
+                             f"{space['ipv6_slash48s']:g} IPv6 /48s")
+                if route["prefixes"]:
+                    parts.append(f"Prefixes: {', '.join(route['prefixes'])}")
+                if route["prefix_count"] > len(route["prefixes"]):
+                    parts.append(f"(showing first {len(route['prefixes'])})")
+            elif route["type"] in ("transit_match", "adjacency_match"):
+                if route["type"] == "transit_match":
+                    parts.append(f"Routes Transiting AS{route['asns'][0]}: {route['route_count']}")
+                else:
+                    parts.append(f"Routes Crossing the AS{route['asns'][0]}-AS{route['asns'][1]} Adjacency: "
+                                 f"{route['route_count']}")
+                parts.append(f"Affected Prefixes: {route['prefix_count']}")
+                if route["prefixes"]:
+                    parts.append(f"Prefixes: {', '.join(route['prefixes'])}")
+                if route["prefix_count"] > len(route["prefixes"]):
+                    parts.append(f"(showing first {len(route['prefixes'])})")
             
             if "data" in route and route["data"]:
                 data = route["data"]
                 parts.append(f"Origin AS: {data.get('origin_as', 'Unknown')}")
                 parts.append(f"AS Path: {data.get('as_path', 'Unknown')}")
+                if "peer_count" in data:
+                    parts.append(f"Visibility: seen by {data['peer_count']} peers")
+                    parts.append(f"Origin ASes: {', '.join(map(str, data.get('origin_ases', [])))}")
+                    parts.append(f"Distinct AS Paths: {data.get('path_count', 0)}")
+                if data.get("collectors"):
+                    parts.append(f"Seen by Collectors: {', '.join(data['collectors'])}")
             parts.append("")
     
+    if context_data.get("historical_summary"):
+        summary = context_data["historical_summary"]
+        parts.append("=== HISTORICAL BGP UPDATE SUMMARY ===")
+        parts.append(f"Window: {summary['start']} to {summary['end']}")
+        parts.append(f"Updates: {summary['total']} ({summary['announcements']} announcements, "
+                     f"{summary['withdrawals']} withdrawals)")
+        parts.append(f"Prefixes: {summary['prefix_count']}, Peers: {summary['peer_count']}, "
+                     f"Distinct AS Paths: {summary['distinct_paths']}")
+        parts.append(f"First Seen: {summary['first_seen']}, Last Seen: {summary['last_seen']}")
+        parts.append(f"Origin Changes: {summary['origin_changes']}")
+        for origin in summary["origins"]:
+            parts.append(f"- Origin AS {origin['origin_as']}: {origin['announcements']} announcements "
+                         f"({origin['first_seen']} to {origin['last_seen']})")
+        if summary["prefix_count"] > 1:
+            parts.append("Most active prefixes: " +
+                         ", ".join(f"{p['prefix']} ({p['updates']})" for p in summary["prefixes"]))
+        parts.append("")
+    
     if "historical" in context_data and context_data["historical"]:
         parts.append("=== HISTORICAL BGP UPDATES ===")
+        if context_data.get("historical_summary"):
+            parts.append(f"(showing the latest {len(context_data['historical'])} of "
+                         f"{context_data['historical_summary']['total']})")
         for update in context_data["historical"]:
             parts.append(f"Timestamp: {update.get('timestamp', 'Unknown')}")
             parts.append(f"Type: {update.get('type', 'Unknown')} (A=Announcement, W=Withdrawal)")
@@ -168,6 +232,71 @@ def format_context_data(context_data: Dict[str, Any]) -> str:
             parts.append(f"AS Path: {update.get('as_path', 'Unknown')}")
             parts.append("")
     
+    if "state_at" in context_data and context_data["state_at"]:
+        state = context_data["state_at"]
+        parts.append("=== ROUTING STATE AT A POINT IN TIME ===")
+        parts.append(f"Time: {state['time']}")
+        parts.append(f"Query: {state['query']}")
+        if state.get("status") != "success":
+            parts.append("No RIB dump or checkpoint covers this time")
+        elif not state["routes"]:
+            parts.append("No route covered it at that time")
+        else:
+            parts.append(f"Matching Prefix: {state['prefix']}")
+            parts.append(f"Routes: {len(state['routes'])} (replayed from state at {state['base_time']})")
+            for route in state["routes"]:
+                parts.append(f"- Peer AS{route['peer_asn']} ({route['peer_address']}) "
+                             f"AS Path: {route['as_path']} Origin AS: {route['origin_as']} "
+                             f"since {route['since']}")
+        parts.append("")
+    
+    if "path_history" in context_data and context_data["path_history"]:
+        history = context_data["path_history"]
+        parts.append("=== AS PATH HISTORY ===")
+        parts.append(f"Window: {history['start']} to {history['end']}")
+        for asn, updates in history.get("transit", {}).items():
+            parts.append(f"Announcements through AS{asn} in transit: {len(updates)}")
+            for update in updates:
+                parts.append(f"- {update['timestamp']} {update['prefix']} via peer AS{update['peer_asn']} "
+                             f"AS Path: {update['as_path']}")
+        if "path_length_changes" in history:
+            parts.append(f"Path Length Changes: {len(history['path_length_changes'])}")
+            for change in history["path_length_changes"]:
+                parts.append(f"- {change['timestamp']} {change['prefix']} peer AS{change['peer_asn']}: "
+                             f"{change['previous_length']} -> {change['path_length']} hops "
+                             f"({change['previous_path']} -> {change['as_path']})")
+        if "prepending" in history:
+            parts.append(f"Prepended Announcements: {len(history['prepending'])}")
+            for entry in history["prepending"]:
+                origin = " (by the origin)" if entry["origin_prepended"] else ""
+                parts.append(f"- {entry['prefix']} origin AS{entry['origin_as']}: {entry['prepends']} prepends"
+                             f"{origin}, {entry['updates']} updates, last path {entry['last_path']}")
+        parts.append("")
+    
+    if "flaps" in context_data and context_data["flaps"]:
+        flaps = context_data["flaps"]
+        parts.append("=== ROUTE FLAP ACTIVITY ===")
+        if "prefix" in flaps:
+            summary = flaps["prefix"]
+            parts.append(f"Prefix: {summary['prefix']}")
+            if not summary["minutes"]:
+                parts.append("No updates in the analyzed window")
+            else:
+                parts.append(f"Window: {summary['start']} to {summary['end']}")
+                parts.append(f"Flapping: {'yes' if summary['flap_detected'] else 'no'} "
+                             f"({summary['transitions']} state transitions, {summary['path_changes']} path changes, "
+                             f"{summary['announcements']} announcements, {summary['withdrawals']} withdrawals)")
+                for minute in summary["minutes"]:
+                    parts.append(f"- {minute['minute']}: {minute['announcements']} A, {minute['withdrawals']} W, "
+                                 f"{minute['transitions']} transitions, {minute['distinct_paths']} paths")
+        else:
+            parts.append(f"Flapping Prefixes: {len(flaps['flapping_prefixes'])}")
+            for entry in flaps["flapping_prefixes"]:
+                parts.append(f"- {entry['prefix']}: {entry['transitions']} transitions, "
+                             f"{entry['path_changes']} path changes, {entry['distinct_paths']} paths, "
+                             f"active {entry['active_minutes']} minutes, last at {entry['last_minute']}")
+        parts.append("")
+    
     if "validation" in context_data and context_data["validation"]:
         validation = context_data["validation"]
         parts.append("=== RPKI & IRR VALIDATION ===")
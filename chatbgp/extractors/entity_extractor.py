@@ -10,6 +10,7 @@ class RegexEntityExtractor:
         self.ip_pattern = re.compile(r'\b(?:\d{1,3}\.){3}\d{1,3}\b')
         self.prefix_pattern = re.compile(r'\b(?:\d{1,3}\.){3}\d{1,3}/\d{1,2}\b')
         self.asn_pattern = re.compile(r'\bAS\s*(\d+)\b', re.IGNORECASE)
+        self.clock_pattern = re.compile(r'\b\d{1,2}:\d{2}(?::\d{2})?\b')
         
         self.keywords = {
             "route", "prefix", "path", "bgp", "origin", "as", "rpki", "roa", 
@@ -33,6 +34,7 @@ class RegexEntityExtractor:
         query_lower = query.lower()
         keywords = [kw for kw in self.keywords if kw in query_lower]
         time_references = [tw for tw in self.time_words if tw in query_lower]
+        time_references += self.clock_pattern.findall(query)
         
         return {
             "ip_addresses": list(set(ip_addresses)),
@@ -1,7 +1,7 @@
 
 import os
-from dataclasses import dataclass
-from typing import Optional
+from dataclasses import dataclass, field
+from typing import List, Optional
 
 @dataclass
 class ChatBGPConfig:
@@ -15,7 +15,39 @@ class ChatBGPConfig:
     bgp_database_path: str = "data/bgp_data/bgp_rib_snapshot.duckdb"
     radix_v4_path: str = "data/bgp_data/radix_v4_obj.pkl.gz"
     radix_v6_path: str = "data/bgp_data/radix_v6_obj.pkl.gz"
+    rib_snapshot_path: str = "data/bgp_data/rib_snapshot.bin"
     rfc_documents_path: str = "data/rfc_documents"
+    update_archive_path: str = "data/bgp_data/archive"
+    
+    # Read the database replicas published by the ingest process (bgp_database_path until the first one is;
+    # None always opens bgp_database_path, which DuckDB's file lock only allows while no ingest process runs)
+    # and interrupt slower queries
+    database_replica_dir: Optional[str] = "data/bgp_data/replica"
+    database_read_only: bool = True
+    query_timeout_seconds: float = 30.0
+    
+    # Hours of updates read for historical queries, ending at the time the query names (or the latest update)
+    historical_window_hours: float = 24.0
+    # Most recent updates listed for historical queries; beyond that the window is summarized instead
+    max_historical_updates: int = 50
+    
+    # Maximum prefixes listed for more-specific, less-specific and sibling queries
+    max_related_prefixes: int = 50
+    # Maximum prefixes listed for an origin AS
+    max_origin_prefixes: int = 200
+    # Maximum rows returned by AS path history queries (transit, path length changes, prepending)
+    max_path_history_rows: int = 50
+    # Minutes of update rollups read for route flap queries, and the transitions that count as flapping
+    flap_window_minutes: float = 60.0
+    min_flap_transitions: int = 4
+    
+    # Seconds between checks for a newly published RIB snapshot (0 disables reloading)
+    snapshot_watch_interval: float = 5.0
+    
+    # In-process live updates applied to the RIB snapshot
+    live_updates: bool = False
+    live_collectors: List[str] = field(default_factory=lambda: ["rrc03"])
+    live_publish_interval: float = 30.0  # seconds between published RIB generations
     
     # LLM settings
     model_name: str = "gpt-4.1-mini"
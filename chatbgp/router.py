@@ -1,12 +1,13 @@
 #!/usr/bin/env python3
 import os
+import re
 import sys
 import time
-from typing import Dict, Any, List, Optional
-from datetime import datetime
-import duckdb
+from typing import Dict, Any, List, Optional, Tuple
+from datetime import datetime, timedelta
 import gzip
 import pickle
+from itertools import islice
 
 from .models.config import ChatBGPConfig, QueryType
 from .retrievers.document_retriever import BGPRetriever
@@ -15,6 +16,17 @@ from .extractors.llm_entity_extractor import LLMEntityExtractor
 from .extractors.entity_extractor import RegexEntityExtractor
 from .analyzers.heuristic_analyzer import analyze_bgp_discrepancies
 from .utils.external_data import fetch_rpki_validation, fetch_whois_data
+from .utils.rib_snapshot import RibSnapshot
+from .utils.rib_table import RibTable
+from .utils.bgp_to_duckdb import UPDATES_TABLE_NAME
+from .utils.bgp_history import state_at
+from .utils.update_archive import archive_files, updates_relation
+from .utils.update_history import stream_updates, summarize_updates
+from .utils.path_history import path_length_changes, prepended_paths, transit_updates
+from .utils.update_rollup import flapping_prefixes, prefix_flap_summary
+from .utils.db_connection import DatabaseManager
+from .utils.live_rib import (LiveRibUpdater, RibGenerations, SnapshotWatcher,
+                             generation_status, resume_time)
 
 
 class ChatBGPRouter:
@@ -43,10 +55,30 @@ class ChatBGPRouter:
         self._connect_database()
     
     def _load_radix_trees(self):
-        """Load radix trees for BGP routing data"""
+        """Load routing data, preferring the memory-mapped RIB snapshot over radix pickles"""
+        self.rib_generations = RibGenerations()
+        self.snapshot_watcher = SnapshotWatcher(self.config.rib_snapshot_path, self.rib_generations,
+                                                interval=self.config.snapshot_watch_interval)
+        self.live_updater = None
         self.rtree_v4 = None
         self.rtree_v6 = None
         
+        if os.path.exists(self.config.rib_snapshot_path):
+            try:
+                self.snapshot_watcher.check()
+                snapshot = self.rib_snapshot
+                if self.config.verbose:
+                    print(f"Mapped RIB snapshot from {self.config.rib_snapshot_path} ({len(snapshot)} prefixes)")
+                # Live updates own the generations; otherwise follow snapshots published by the ingest process
+                if self.config.live_updates:
+                    self._start_live_updates(snapshot)
+                elif self.config.snapshot_watch_interval > 0:
+                    self.snapshot_watcher.start()
+                return
+            except Exception as e:
+                if self.config.verbose:
+                    print(f"Failed to map RIB snapshot: {e}")
+        
         try:
             if os.path.exists(self.config.radix_v4_path) and os.path.exists(self.config.radix_v6_path):
                 with gzip.open(self.config.radix_v4_path, "rb") as f:
@@ -62,23 +94,71 @@ class ChatBGPRouter:
         if not self.rtree_v4 and self.config.verbose:
             print("Warning: No radix trees loaded. BGP lookups will not work.")
     
+    @property
+    def rib_snapshot(self) -> Optional[RibSnapshot]:
+        """Snapshot of the current RIB generation"""
+        generation = self.rib_generations.current()
+        return generation.snapshot if generation else None
+    
+    def _start_live_updates(self, snapshot: RibSnapshot):
+        """Apply live updates in a background thread, publishing new RIB generations"""
+        try:
+            self.live_updater = LiveRibUpdater(
+                RibTable.from_snapshot(snapshot),
+                self.rib_generations,
+                start_time=resume_time(snapshot),
+                collectors=self.config.live_collectors,
+                publish_interval=self.config.live_publish_interval,
+                verbose=self.config.verbose
+            )
+            self.live_updater.start()
+        except Exception as e:
+            self.live_updater = None
+            if self.config.verbose:
+                print(f"Failed to start live updates: {e}")
+    
+    def get_rib_status(self) -> Dict[str, Any]:
+        """Version and freshness of the RIB generation serving queries"""
+        status = generation_status(self.rib_generations.current())
+        status["snapshot_reloads"] = self.snapshot_watcher.reloads
+        if self.snapshot_watcher.last_error:
+            status["snapshot_error"] = self.snapshot_watcher.last_error
+        if self.live_updater is not None:
+            status["live_cursor"] = self.live_updater.cursor.isoformat()
+            status["live_pending_updates"] = self.live_updater.pending
+            status["live_publish_interval"] = self.live_updater.effective_publish_interval
+            if self.live_updater.last_error:
+                status["live_error"] = self.live_updater.last_error
+                status["live_error_at"] = datetime.utcfromtimestamp(self.live_updater.last_error_at).isoformat()
+        return status
+    
+    def close(self):
+        """Stop snapshot reloading and live updates and close the database"""
+        self.snapshot_watcher.stop()
+        if self.live_updater is not None:
+            self.live_updater.stop()
+            self.live_updater = None
+        self.db.close()
+    
     def _connect_database(self):
         """Connect to DuckDB for historical data"""
-        self.db_con = None
+        self.db = DatabaseManager(self.config.bgp_database_path,
+                                  read_only=self.config.database_read_only,
+                                  replica_dir=self.config.database_replica_dir,
+                                  query_timeout=self.config.query_timeout_seconds,
+                                  verbose=self.config.verbose)
         
-        if os.path.exists(self.config.bgp_database_path):
-            try:
-                self.db_con = duckdb.connect(self.config.bgp_database_path)
-                self.db_con.execute('INSTALL inet; LOAD inet;')
-                if self.config.verbose:
-                    print(f"Connected to database: {self.config.bgp_database_path}")
-            except Exception as e:
-                if self.config.verbose:
-                    print(f"Failed to connect to database: {e}")
+        if self.config.database_replica_dir or os.path.exists(self.config.bgp_database_path):
+            self.db.connect()
         
-        if not self.db_con and self.config.verbose:
+        if not self.db.connected and self.config.verbose:
             print("Warning: No database connection. Historical queries will not work.")
     
+    @property
+    def db_con(self):
+        """The calling thread's database cursor (None without a database)"""
+        return self.db.cursor()
+    
     def determine_query_type(self, query: str, entities: Dict[str, Any]) -> List[str]:
         """Determine what types of data sources are needed"""
         query_lower = query.lower()
@@ -131,8 +211,15 @@ class ChatBGPRouter:
                 print(f"Error retrieving static docs: {e}")
             return []
     
-    def get_live_bgp_state(self, entities: Dict[str, Any]) -> Dict[str, Any]:
-        """Get current BGP state from radix trees"""
+    def get_live_bgp_state(self, entities: Dict[str, Any], query: str = "") -> Dict[str, Any]:
+        """Get current BGP state from the current RIB generation, or from radix trees"""
+        # One generation per query: every lookup sees the same RIB
+        generation = self.rib_generations.current()
+        if generation is not None:
+            result = self._get_snapshot_state(generation.snapshot, entities, query)
+            result["generation"] = generation.number
+            return result
+        
         if not self.rtree_v4 and not self.rtree_v6:
             return {"status": "no_data", "message": "No radix trees available"}
         
@@ -165,42 +252,353 @@ class ChatBGPRouter:
         
         return result
     
-    def get_historical_data(self, entities: Dict[str, Any], prefix: str = None) -> List[Dict[str, Any]]:
-        """Get historical BGP data from database"""
+    def _related_prefix_types(self, query: str) -> List[str]:
+        """Which related lookups (more/less specifics, siblings, transit, adjacency) a query asks for"""
+        query_lower = query.lower()
+        more_keywords = ["more specific", "more-specific", "covered", "subnet", "sub-prefix", "deaggregat"]
+        less_keywords = ["less specific", "less-specific", "covering", "covers", "supernet"]
+        sibling_keywords = ["sibling", "neighboring prefix", "neighbouring prefix", "adjacent prefix"]
+        transit_keywords = ["transit", "through as", "via as", "traverse", "upstream"]
+        adjacency_keywords = ["adjacency", "adjacent", "link between", "peering between", "interconnect"]
+        
+        types = []
+        if any(keyword in query_lower for keyword in more_keywords):
+            types.append("more_specific_match")
+        if any(keyword in query_lower for keyword in less_keywords):
+            types.append("less_specific_match")
+        if any(keyword in query_lower for keyword in sibling_keywords):
+            types.append("sibling_match")
+        if any(keyword in query_lower for keyword in transit_keywords):
+            types.append("transit_match")
+        if any(keyword in query_lower for keyword in adjacency_keywords):
+            types.append("adjacency_match")
+        return types
+    
+    def _query_collector(self, snapshot: RibSnapshot, query: str) -> Optional[str]:
+        """A collector of the snapshot named in the query (e.g. "as seen from rrc00"), for its per-collector view"""
+        words = set(re.findall(r"[\w.-]+", query.lower()))
+        for collector in snapshot.collectors:
+            if collector.lower() in words:
+                return collector
+        return None
+    
+    @staticmethod
+    def _collector_prefixes(snapshot: RibSnapshot, pids, collector: Optional[str] = None,
+                            limit: Optional[int] = None) -> Tuple[List[int], Optional[int]]:
+        """
+        The first limit prefix ids a collector has routes for (all of them
+        without a collector) and their count, None for "more than limit":
+        enumeration stops one match past the limit.
+        """
+        if collector is None and isinstance(pids, (range, list)):
+            return list(pids[:limit]), len(pids)
+        if collector is not None:
+            pids = (pid for pid in pids if len(snapshot.collector_routes(pid, collector)))
+        pids = list(islice(pids, None if limit is None else limit + 1))
+        if limit is not None and len(pids) > limit:
+            return pids[:limit], None
+        return pids, len(pids)
+    
+    def _get_snapshot_state(self, snapshot: RibSnapshot, entities: Dict[str, Any], query: str = "") -> Dict[str, Any]:
+        """Exact, longest prefix and related-prefix match lookups against a RIB snapshot"""
+        result = {"status": "success", "routes": []}
+        related_types = self._related_prefix_types(query)
+        limit = self.config.max_related_prefixes
+        collector = self._query_collector(snapshot, query)
+        if collector:
+            result["collector"] = collector
+        
+        for prefix in entities.get("prefixes", []):
+            try:
+                pid = snapshot.search_exact(prefix)
+            except ValueError:
+                continue
+            data = snapshot.route_data(pid, collector) if pid is not None else None
+            if data:
+                result["routes"].append({
+                    "type": "exact_match",
+                    "prefix": prefix,
+                    "data": data
+                })
+        
+        for prefix in entities.get("prefixes", []):
+            for route_type in related_types:
+                if route_type not in ("more_specific_match", "less_specific_match", "sibling_match"):
+                    continue
+                try:
+                    if route_type == "more_specific_match":
+                        pids, count = self._collector_prefixes(snapshot, snapshot.more_specifics(prefix),
+                                                               collector, limit)
+                    elif route_type == "less_specific_match":
+                        pids, count = self._collector_prefixes(snapshot, snapshot.less_specifics(prefix), collector)
+                    else:
+                        # Counting every sibling would mean walking them all; stop one past the limit
+                        pids, count = self._collector_prefixes(snapshot, snapshot.iter_siblings(prefix),
+                                                               collector, limit)
+                except ValueError:
+                    continue
+                result["routes"].append({
+                    "type": route_type,
+                    "prefix": prefix,
+                    "count": count,
+                    "matches": [{"prefix": snapshot.prefix(pid), "data": snapshot.route_data(pid, collector)}
+                                for pid in pids]
+                })
+        
+        for ip in entities.get("ip_addresses", []):
+            try:
+                pid = snapshot.search_best(ip, collector)
+            except ValueError:
+                continue
+            if pid is not None:
+                result["routes"].append({
+                    "type": "longest_prefix_match",
+                    "ip": ip,
+                    "matching_prefix": snapshot.prefix(pid),
+                    "data": snapshot.route_data(pid, collector)
+                })
+        
+        asns = []
+        for asn in entities.get("asns", []):
+            try:
+                asn = int(str(asn).upper().replace("AS", ""))
+            except ValueError:
+                continue
+            if 0 <= asn <= 0xFFFFFFFF:
+                asns.append(asn)
+        
+        for asn in asns:
+            pids = snapshot.origin_prefixes(asn)
+            n_v4 = int((pids < snapshot.n_v4).sum())
+            result["routes"].append({
+                "type": "origin_match",
+                "asn": asn,
+                "prefix_count": len(pids),
+                "ipv4_prefixes": n_v4,
+                "ipv6_prefixes": len(pids) - n_v4,
+                "address_space": snapshot.address_space(pids),
+                "prefixes": [snapshot.prefix(pid) for pid in pids[:self.config.max_origin_prefixes].tolist()]
+            })
+        
+        if "transit_match" in related_types:
+            for asn in asns:
+                result["routes"].append(self._path_match(snapshot, "transit_match", [asn],
+                                                         snapshot.routes_through(asn)))
+        if "adjacency_match" in related_types and len(set(asns)) >= 2:
+            # The first two ASes the query names; the link is looked up in both directions
+            left, right = self._query_order(list(dict.fromkeys(asns)), query)[:2]
+            result["routes"].append(self._path_match(snapshot, "adjacency_match", [left, right],
+                                                     snapshot.routes_via_adjacency(left, right)))
+        
+        return result
+    
+    @staticmethod
+    def _query_order(asns: List[int], query: str) -> List[int]:
+        """ASNs ordered by where the query first names them (extractors may not keep that order)"""
+        def position(asn):
+            match = re.search(rf"\b(?:AS\s*)?{asn}\b", query, re.IGNORECASE)
+            return match.start() if match else len(query)
+        return sorted(asns, key=position)
+    
+    def _path_match(self, snapshot: RibSnapshot, route_type: str, asns: List[int], route_ids) -> Dict[str, Any]:
+        """Summarize the routes whose AS paths go through an AS or an AS adjacency"""
+        pids = snapshot.route_prefixes(route_ids)
+        return {
+            "type": route_type,
+            "asns": asns,
+            "route_count": len(route_ids),
+            "prefix_count": len(pids),
+            "prefixes": [snapshot.prefix(pid) for pid in pids[:self.config.max_origin_prefixes].tolist()]
+        }
+    
+    def _latest_update_time(self) -> Optional[datetime]:
+        """Time of the newest stored update, in the live table or else the archive"""
+        latest = self.db_con.execute(f"SELECT max(timestamp) FROM {UPDATES_TABLE_NAME}").fetchone()[0]
+        if latest is None:
+            files = archive_files(archive_dir=self.config.update_archive_path)
+            if files:
+                sql, params = updates_relation(archive_dir=self.config.update_archive_path)
+                latest = self.db_con.execute(f"SELECT max(timestamp) FROM {sql}", params).fetchone()[0]
+        return latest
+    
+    def _historical_scope(self, entities: Dict[str, Any], prefix: str = None, query: str = ""):
+        """The prefix, time window and prefix match of a historical query, or None"""
+        target_prefix = prefix
+        if not target_prefix and entities.get("prefixes"):
+            target_prefix = entities["prefixes"][0]
+        if not target_prefix:
+            return None
+        
+        end = self._parse_query_time(query) or self._latest_update_time()
+        if end is None:
+            return None
+        start = end - timedelta(hours=self.config.historical_window_hours)
+        related_types = self._related_prefix_types(query)
+        more = "more_specific_match" in related_types
+        less = "less_specific_match" in related_types
+        prefix_match = "related" if more and less else "covered" if more else "covering" if less else "exact"
+        return dict(start=start, end=end, prefixes=[target_prefix], prefix_match=prefix_match,
+                    archive_dir=self.config.update_archive_path)
+    
+    def get_historical_data(self, entities: Dict[str, Any], prefix: str = None, query: str = "") -> List[Dict[str, Any]]:
+        """
+        Get the most recent historical BGP updates (at most
+        max_historical_updates) for a prefix from the live table and the
+        archive, within historical_window_hours before the time the query
+        names (or the latest update). Queries about more/less specifics also
+        get the updates of every prefix covered by/covering it.
+        """
         if not self.db_con:
             return []
         
         try:
-            target_prefix = prefix
-            if not target_prefix and entities.get("prefixes"):
-                target_prefix = entities["prefixes"][0]
-            
-            if not target_prefix:
+            scope = self._historical_scope(entities, prefix, query)
+            if scope is None:
                 return []
             
-            query = """
-                SELECT prefix, origin_as, timestamp, type, as_path 
-                FROM bgp_updates 
-                WHERE prefix = ? 
-                ORDER BY timestamp DESC 
-            """
-            
-            result = self.db_con.execute(query, [target_prefix]).fetchall()
             return [
                 {
-                    "prefix": row[0],
-                    "origin_as": row[1], 
-                    "timestamp": row[2],
-                    "type": row[3],
-                    "as_path": row[4]
+                    "prefix": row["prefix"],
+                    "origin_as": row["origin_as"],
+                    "timestamp": row["timestamp"],
+                    "type": row["update_type"],
+                    "as_path": row["as_path"]
                 }
-                for row in result
+                for row in stream_updates(self.db_con, limit=self.config.max_historical_updates, **scope)
             ]
         except Exception as e:
             if self.config.verbose:
                 print(f"Error retrieving historical data: {e}")
             return []
     
+    def get_historical_summary(self, entities: Dict[str, Any], prefix: str = None, query: str = "") -> Dict[str, Any]:
+        """
+        Aggregates over all historical updates in the same window as
+        get_historical_data (counts per type, distinct paths, first/last
+        seen, origins and origin changes), for when the raw rows were cut off
+        """
+        if not self.db_con:
+            return {}
+        
+        try:
+            scope = self._historical_scope(entities, prefix, query)
+            if scope is None:
+                return {}
+            return summarize_updates(self.db_con, **scope)
+        except Exception as e:
+            if self.config.verbose:
+                print(f"Error summarizing historical data: {e}")
+            return {}
+    
+    def get_path_history(self, entities: Dict[str, Any], query: str = "") -> Dict[str, Any]:
+        """
+        AS path questions over the updates in the historical window: which
+        announcements went through an AS, which paths changed length and
+        which prefixes were prepended (for the query's prefixes, if any)
+        """
+        if not self.db_con:
+            return {}
+        
+        query_lower = query.lower()
+        wants_transit = "transit_match" in self._related_prefix_types(query)
+        wants_length = any(k in query_lower for k in ["path length", "longer path", "shorter path", "path change"])
+        wants_prepend = "prepend" in query_lower
+        if not (wants_transit or wants_length or wants_prepend):
+            return {}
+        
+        try:
+            end = self._parse_query_time(query) or self._latest_update_time()
+            if end is None:
+                return {}
+            start = end - timedelta(hours=self.config.historical_window_hours)
+            prefixes = entities.get("prefixes") or None
+            options = dict(prefixes=prefixes, archive_dir=self.config.update_archive_path,
+                           limit=self.config.max_path_history_rows)
+            
+            result = {"start": start, "end": end}
+            if wants_transit:
+                for asn in entities.get("asns", []):
+                    try:
+                        asn = int(str(asn).upper().replace("AS", ""))
+                    except ValueError:
+                        continue
+                    result.setdefault("transit", {})[asn] = transit_updates(self.db_con, asn, start, end, **options)
+            if wants_length:
+                result["path_length_changes"] = path_length_changes(self.db_con, start, end, **options)
+            if wants_prepend:
+                result["prepending"] = prepended_paths(self.db_con, start, end, **options)
+            return result
+        except Exception as e:
+            if self.config.verbose:
+                print(f"Error retrieving AS path history: {e}")
+            return {}
+    
+    def get_flap_data(self, entities: Dict[str, Any], query: str = "") -> Dict[str, Any]:
+        """
+        Route flap activity from the per-minute update rollups: for the query's
+        prefix, or the most unstable prefixes across the table
+        """
+        if not self.db_con:
+            return {}
+        
+        query_lower = query.lower()
+        if not any(k in query_lower for k in ["flap", "unstable", "instability", "oscillat"]):
+            return {}
+        
+        try:
+            options = dict(end=self._parse_query_time(query),
+                           window=timedelta(minutes=self.config.flap_window_minutes),
+                           min_transitions=self.config.min_flap_transitions)
+            if entities.get("prefixes"):
+                return {"prefix": prefix_flap_summary(self.db_con, entities["prefixes"][0], **options)}
+            return {"flapping_prefixes": flapping_prefixes(self.db_con, limit=self.config.max_related_prefixes,
+                                                           **options)}
+        except Exception as e:
+            if self.config.verbose:
+                print(f"Error retrieving flap rollups: {e}")
+            return {}
+    
+    def _parse_query_time(self, query: str) -> Optional[datetime]:
+        """
+        An explicit time in the query: "YYYY-MM-DD HH:MM[:SS]", or "HH:MM[:SS]"
+        on the day of the latest stored update.
+        """
+        match = re.search(r"\b(\d{4}-\d{2}-\d{2})[ T](\d{1,2}:\d{2}(?::\d{2})?)\b", query)
+        if match:
+            day, clock = match.group(1), match.group(2)
+        else:
+            match = re.search(r"\b(\d{1,2}:\d{2}(?::\d{2})?)\b", query)
+            if not match:
+                return None
+            latest = self._latest_update_time()
+            if latest is None:
+                return None
+            day, clock = latest.strftime("%Y-%m-%d"), match.group(1)
+        if clock.count(":") == 1:
+            clock += ":00"
+        try:
+            return datetime.strptime(f"{day} {clock}", "%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            return None
+    
+    def get_state_at(self, entities: Dict[str, Any], query: str) -> Optional[Dict[str, Any]]:
+        """Routing state of the first prefix or IP in the query at the time it names"""
+        if not self.db_con:
+            return None
+        target = (entities.get("prefixes") or entities.get("ip_addresses") or [None])[0]
+        if not target:
+            return None
+        
+        try:
+            at = self._parse_query_time(query)
+            if at is None:
+                return None
+            return state_at(self.db_con, target, at, archive_dir=self.config.update_archive_path)
+        except Exception as e:
+            if self.config.verbose:
+                print(f"Error reconstructing routing state: {e}")
+            return None
+    
     def get_validation_data(self, prefix: str, origin_as: str) -> Dict[str, Any]:
         """Get RPKI and IRR validation data"""
         validation_data = {"rpki": {}, "irr": {}}
@@ -236,10 +634,27 @@ class ChatBGPRouter:
             context_data["static_docs"] = self.get_static_docs(query)
         
         if QueryType.LIVE_BGP in query_types:
-            context_data["live_bgp"] = self.get_live_bgp_state(entities)
-        
-        if QueryType.HISTORICAL in query_types:
-            context_data["historical"] = self.get_historical_data(entities)
+            context_data["live_bgp"] = self.get_live_bgp_state(entities, query)
+        
+        # All database reads of a query see the same committed state
+        with self.db.snapshot():
+            if QueryType.HISTORICAL in query_types:
+                historical = self.get_historical_data(entities, query=query)
+                context_data["historical"] = historical
+                if len(historical) >= self.config.max_historical_updates:
+                    summary = self.get_historical_summary(entities, query=query)
+                    if summary:
+                        context_data["historical_summary"] = summary
+                state = self.get_state_at(entities, query)
+                if state:
+                    context_data["state_at"] = state
+                path_history = self.get_path_history(entities, query)
+                if path_history:
+                    context_data["path_history"] = path_history
+            
+            flaps = self.get_flap_data(entities, query)
+            if flaps:
+                context_data["flaps"] = flaps
         
         validation_data = None
         if (QueryType.RPKI_VALIDATION in query_types or QueryType.LIVE_BGP in query_types) and \
@@ -275,6 +690,9 @@ class ChatBGPRouter:
             query_types=query_types
         )
         
+        if "generation" in context_data.get("live_bgp", {}):
+            response["rib_generation"] = context_data["live_bgp"]["generation"]
+        
         # add timing
         if self.config.enable_timing and start_time:
             response["timing"] = {
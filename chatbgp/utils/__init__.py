@@ -1,7 +1,20 @@
 from .bgp_stream_wrapper import BGPStreamWrapper, BGPUpdate
-from .bgp_to_duckdb import create_rib_table, create_live_updates_table, store_live_update
+from .bgp_to_duckdb import create_rib_table, create_live_updates_table, store_live_update, UpdateWriter, prefix_range_filter
 from .bgp_radix import load_or_create_trees_OPTIMIZED, save_trees_OPTIMIZED
 from .external_data import fetch_rpki_validation, fetch_whois_data
+from .rib_snapshot import RibSnapshot, save_snapshot_from_trees
+from .rib_table import RibTable, load_rib_table
+from .as_path_table import ASPathTable, get_path_table
+from .rib_journal import RibJournal, JournalCompactor, recover_rib
+from .live_rib import RibGenerations, LiveRibUpdater, SnapshotWatcher
+from .bgp_history import materialize_checkpoint, state_at
+from .update_archive import archive_closed_hours, updates_relation
+from .update_history import stream_updates, summarize_updates
+from .path_history import transit_updates, path_length_changes, prepended_paths
+from .update_rollup import flapping_prefixes, prefix_flap_summary
+from .db_connection import DatabaseManager, QueryTimeout, publish_replica
+from .mrt_archive import LocalMRTArchive
+from .update_batch import UpdateBatch
 
 __all__ = [
     'BGPStreamWrapper',
@@ -9,8 +22,38 @@ __all__ = [
     'create_rib_table',
     'create_live_updates_table', 
     'store_live_update',
+    'UpdateWriter',
+    'prefix_range_filter',
     'load_or_create_trees_OPTIMIZED',
     'save_trees_OPTIMIZED',
     'fetch_rpki_validation',
-    'fetch_whois_data'
+    'fetch_whois_data',
+    'RibSnapshot',
+    'save_snapshot_from_trees',
+    'RibTable',
+    'load_rib_table',
+    'ASPathTable',
+    'get_path_table',
+    'RibJournal',
+    'JournalCompactor',
+    'recover_rib',
+    'RibGenerations',
+    'LiveRibUpdater',
+    'SnapshotWatcher',
+    'materialize_checkpoint',
+    'state_at',
+    'archive_closed_hours',
+    'updates_relation',
+    'stream_updates',
+    'summarize_updates',
+    'transit_updates',
+    'path_length_changes',
+    'prepended_paths',
+    'flapping_prefixes',
+    'prefix_flap_summary',
+    'DatabaseManager',
+    'QueryTimeout',
+    'publish_replica',
+    'LocalMRTArchive',
+    'UpdateBatch'
 ] 
\ No newline at end of file
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Global AS path interning table
+
+A full-table RIB has millions of routes but only a few hundred thousand
+distinct AS paths. Paths are interned once into a packed uint32 blob and
+referred to by id everywhere else (RIB table, radix node data, DuckDB rows,
+analyzers), so equality checks are integer compares and each path is stored
+once per process.
+
+The table also indexes which paths carry an AS in transit (anywhere but the
+origin position) and which paths contain each AS adjacency. The indexes are
+caught up with newly interned paths when they are queried, so interning stays
+cheap and queries never rescan old paths.
+"""
+
+import threading
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Raw path strings remembered per table to skip re-splitting repeated paths
+MAX_CACHED_STRINGS = 1 << 20
+
+
+def parse_as_path(as_path_str):
+    """Parses an AS path string into a list of integers (first ASN of each AS_SET, confederation segments skipped)."""
+    as_numbers = []
+    if not as_path_str:
+        return as_numbers
+
+    for asn_token in as_path_str.split():
+        try:
+            if '{' in asn_token:
+                clean_token = asn_token.strip('{}')
+                parts = clean_token.split(',')
+                if parts and parts[0].isdigit():
+                    as_numbers.append(int(parts[0]))
+            elif '(' in asn_token:
+                pass
+            elif asn_token.isdigit():
+                as_numbers.append(int(asn_token))
+        except ValueError:
+            continue
+    return as_numbers
+
+
+class ASPathTable:
+    """Path id -> packed uint32 ASN array, with a hash index from path to id."""
+
+    def __init__(self):
+        self.offsets = array("I", [0])
+        self.asns = array("I")
+        self.index: Dict[bytes, int] = {}
+        self.strings: Dict[str, int] = {}
+        self._tuples: Dict[int, Tuple[int, ...]] = {}
+        self._lock = threading.Lock()
+
+        self._transit: Dict[int, array] = {}  # ASN -> ids of paths it transits
+        self._adjacent: Dict[Tuple[int, int], array] = {}  # (ASN, next ASN) -> path ids
+        self._indexed = 0
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def intern(self, as_path) -> int:
+        """Return the id of a path given as a sequence of ASNs, adding it if new."""
+        if isinstance(as_path, np.ndarray):
+            key = as_path.astype(np.uint32, copy=False).tobytes()
+        else:
+            key = array("I", as_path).tobytes()
+        path_id = self.index.get(key)
+        if path_id is not None:
+            return path_id
+        with self._lock:
+            path_id = self.index.get(key)
+            if path_id is None:
+                self.asns.frombytes(key)
+                self.offsets.append(len(self.asns))
+                path_id = self.index[key] = len(self.offsets) - 2
+        return path_id
+
+    def intern_str(self, as_path_str: Optional[str]) -> Optional[int]:
+        """Return the id of a path given as a raw AS path string, or None if it has no ASNs."""
+        if not as_path_str:
+            return None
+        path_id = self.strings.get(as_path_str)
+        if path_id is not None:
+            return path_id
+        as_numbers = parse_as_path(as_path_str)
+        if not as_numbers:
+            return None
+        path_id = self.intern(as_numbers)
+        if len(self.strings) >= MAX_CACHED_STRINGS:
+            self.strings.clear()
+        self.strings[as_path_str] = path_id
+        return path_id
+
+    def get(self, path_id: int) -> List[int]:
+        """ASNs of a path."""
+        return self.asns[self.offsets[path_id]:self.offsets[path_id + 1]].tolist()
+
+    def as_tuple(self, path_id: int) -> Tuple[int, ...]:
+        """ASNs of a path as a tuple shared by every caller asking for the same id."""
+        path = self._tuples.get(path_id)
+        if path is None:
+            path = self._tuples[path_id] = tuple(self.get(path_id))
+        return path
+
+    def origin(self, path_id: int) -> int:
+        """Last ASN of a path."""
+        return self.asns[self.offsets[path_id + 1] - 1]
+
+    def length(self, path_id: int) -> int:
+        """Number of ASNs in a path."""
+        return self.offsets[path_id + 1] - self.offsets[path_id]
+
+    def to_string(self, path_id: int) -> str:
+        """Space-separated form of a path, as stored in DuckDB."""
+        return " ".join(map(str, self.get(path_id)))
+
+    def _index_new_paths(self):
+        """Add paths interned since the last query to the transit and adjacency indexes."""
+        with self._lock:
+            end = len(self.offsets) - 1
+            bounds = self.offsets[self._indexed:end + 1].tolist()
+            asns = self.asns[bounds[0]:bounds[-1]].tolist() if bounds else []
+            base = bounds[0] if bounds else 0
+            for path_id in range(self._indexed, end):
+                i = path_id - self._indexed
+                path = asns[bounds[i] - base:bounds[i + 1] - base]
+                # Origin prepending is not transit
+                for asn in set(path[:-1]) - set(path[-1:]):
+                    self._transit.setdefault(asn, array("I")).append(path_id)
+                for pair in set(zip(path, path[1:])):
+                    if pair[0] != pair[1]:
+                        self._adjacent.setdefault(pair, array("I")).append(path_id)
+            self._indexed = end
+
+    def paths_through(self, asn: int) -> List[int]:
+        """Ids of the paths in which an AS appears in transit (not as the origin)."""
+        self._index_new_paths()
+        return self._transit.get(int(asn), array("I")).tolist()
+
+    def paths_with_adjacency(self, left: int, right: int) -> List[int]:
+        """Ids of the paths in which two ASes are adjacent, in either direction."""
+        self._index_new_paths()
+        ids = set(self._adjacent.get((int(left), int(right)), ()))
+        ids.update(self._adjacent.get((int(right), int(left)), ()))
+        return sorted(ids)
+
+    def arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Copies of the (offsets, asns) blob, e.g. for a snapshot."""
+        with self._lock:
+            offsets = self.offsets.tobytes()
+            asns = self.asns.tobytes()
+        return np.frombuffer(offsets, dtype=np.uint32), np.frombuffer(asns, dtype=np.uint32)
+
+    @classmethod
+    def from_arrays(cls, offsets: np.ndarray, asns: np.ndarray) -> "ASPathTable":
+        """Rebuild a table from an (offsets, asns) blob, keeping its ids."""
+        table = cls()
+        table.offsets = array("I", np.asarray(offsets, dtype=np.uint32).tobytes())
+        table.asns = array("I", np.asarray(asns, dtype=np.uint32).tobytes())
+        raw = table.asns.tobytes()
+        bounds = table.offsets.tolist()
+        for path_id in range(len(bounds) - 1):
+            table.index.setdefault(raw[bounds[path_id] * 4:bounds[path_id + 1] * 4], path_id)
+        return table
+
+    def remap_from(self, offsets: np.ndarray, asns: np.ndarray) -> np.ndarray:
+        """Intern every path of another blob; returns an array mapping its ids to ids in this table."""
+        bounds = np.asarray(offsets).tolist()
+        asns = np.asarray(asns, dtype=np.uint32)
+        mapping = np.empty(max(len(bounds) - 1, 0), dtype=np.uint32)
+        for path_id in range(len(bounds) - 1):
+            mapping[path_id] = self.intern(asns[bounds[path_id]:bounds[path_id + 1]])
+        return mapping
+
+
+_shared_table = ASPathTable()
+
+
+def get_path_table() -> ASPathTable:
+    """The process-wide path table shared by the RIB, DuckDB ingest and analyzers."""
+    return _shared_table
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Point-in-time routing state from RIB dumps, checkpoints and updates
+
+The routing state at time T is the latest materialized checkpoint at or before
+T (or, before the first checkpoint, the latest RIB dump in rib_entries) plus
+the updates between that checkpoint and T (from the live table or the Parquet
+archive), where the last update per (prefix, peer) wins. Checkpoints are
+written every CHECKPOINT_INTERVAL of update time, so a lookup never replays
+more than one interval of updates regardless of how much history is stored.
+
+Each checkpoint holds the full routing state, so older ones are thinned out:
+every checkpoint of the last CHECKPOINT_KEEP_HOURLY is kept, then the first
+checkpoint of each day up to CHECKPOINT_KEEP_DAILY back, and nothing older.
+Lookups further back replay from the nearest older base. Times are naive
+UTC throughout, like update timestamps.
+"""
+
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from .bgp_to_duckdb import RIB_TABLE_NAME
+from .ip_prefix import covering_prefixes, parse_prefix
+from .update_archive import ARCHIVE_DIR, updates_relation
+
+CHECKPOINT_TABLE_NAME = "rib_checkpoints"
+CHECKPOINT_TIMES_TABLE_NAME = "rib_checkpoint_times"
+CHECKPOINT_INTERVAL = timedelta(hours=1)
+CHECKPOINT_KEEP_HOURLY = timedelta(days=1)
+CHECKPOINT_KEEP_DAILY = timedelta(days=7)
+
+_ROUTE_COLUMNS = "prefix, peer_address, peer_asn, as_path, origin_as, path_id"
+# Updates expose INET columns as text (see update_archive), so base rows are compared as text too
+_BASE_COLUMNS = ("CAST(prefix AS VARCHAR) AS prefix, CAST(peer_address AS VARCHAR) AS peer_address, "
+                 "peer_asn, as_path, origin_as, path_id")
+
+
+def create_checkpoint_tables(con):
+    """Creates the checkpoint tables if they don't exist."""
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {CHECKPOINT_TABLE_NAME} (
+            checkpoint_time TIMESTAMP,
+            prefix INET,
+            peer_address INET,
+            peer_asn BIGINT,
+            as_path VARCHAR,
+            origin_as BIGINT,
+            path_id UINTEGER,
+            changed_at TIMESTAMP
+        );
+    """)
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {CHECKPOINT_TIMES_TABLE_NAME} (
+            checkpoint_time TIMESTAMP PRIMARY KEY,
+            route_count BIGINT,
+            created_at TIMESTAMP
+        );
+    """)
+    con.execute(f"CREATE INDEX IF NOT EXISTS idx_checkpoints_time ON {CHECKPOINT_TABLE_NAME}(checkpoint_time);")
+
+
+def latest_checkpoint(con, at: datetime) -> Optional[datetime]:
+    """Time of the latest checkpoint at or before a time."""
+    row = con.execute(f"SELECT max(checkpoint_time) FROM {CHECKPOINT_TIMES_TABLE_NAME} WHERE checkpoint_time <= ?",
+                      [at]).fetchone()
+    return row[0] if row else None
+
+
+def _latest_dump(con, at: datetime) -> Optional[Tuple[datetime, datetime]]:
+    """(dump_time, record time) of the latest RIB dump in rib_entries taken at or before a time."""
+    row = con.execute(f"""
+        SELECT dump_time, max(record_time) AS taken
+        FROM {RIB_TABLE_NAME}
+        GROUP BY dump_time
+        HAVING max(record_time) <= ?
+        ORDER BY taken DESC
+        LIMIT 1
+    """, [at]).fetchone()
+    return (row[0], row[1]) if row else None
+
+
+def _state_query(con, at: datetime, prefixes: Optional[List[str]] = None,
+                 archive_dir: str = ARCHIVE_DIR) -> Tuple[str, list, Optional[datetime]]:
+    """
+    SQL (and parameters) selecting the routes valid at a time, optionally
+    restricted to some prefixes, plus the base time it replays from.
+    """
+    prefix_filter, prefix_params = "", []
+    if prefixes is not None:
+        prefix_filter = f" AND prefix IN ({', '.join('?' * len(prefixes))})"
+        prefix_params = list(prefixes)
+
+    base_time = latest_checkpoint(con, at)
+    if base_time is not None:
+        base_sql = (f"SELECT {_BASE_COLUMNS}, changed_at FROM {CHECKPOINT_TABLE_NAME} "
+                    f"WHERE checkpoint_time = ?{prefix_filter}")
+        base_params = [base_time] + prefix_params
+    else:
+        dump = _latest_dump(con, at)
+        if dump is None:
+            return "", [], None
+        base_sql = (f"SELECT {_BASE_COLUMNS}, record_time AS changed_at FROM {RIB_TABLE_NAME} "
+                    f"WHERE dump_time = ?{prefix_filter}")
+        base_params = [dump[0]] + prefix_params
+        base_time = dump[1]
+
+    updates_sql, updates_params = updates_relation(base_time, at, prefixes, archive_dir=archive_dir)
+    sql = f"""
+        WITH base AS ({base_sql}),
+        changes AS (
+            SELECT {_ROUTE_COLUMNS}, update_type, timestamp AS changed_at
+            FROM {updates_sql}
+            QUALIFY row_number() OVER (
+                PARTITION BY prefix, peer_address, peer_asn ORDER BY timestamp DESC, tier DESC, seq DESC
+            ) = 1
+        )
+        SELECT {_ROUTE_COLUMNS}, changed_at FROM base
+        WHERE NOT EXISTS (
+            SELECT 1 FROM changes c
+            WHERE c.prefix = base.prefix
+              AND c.peer_address IS NOT DISTINCT FROM base.peer_address
+              AND c.peer_asn IS NOT DISTINCT FROM base.peer_asn
+        )
+        UNION ALL
+        SELECT {_ROUTE_COLUMNS}, changed_at FROM changes WHERE update_type = 'A'
+    """
+    return sql, base_params + updates_params, base_time
+
+
+def materialize_checkpoint(con, at: datetime, archive_dir: str = ARCHIVE_DIR) -> int:
+    """Store the full routing state at a time as a checkpoint. Returns its route count."""
+    create_checkpoint_tables(con)
+    if latest_checkpoint(con, at) == at:
+        return 0
+    sql, params, base_time = _state_query(con, at, archive_dir=archive_dir)
+    if base_time is None:
+        return 0
+
+    con.execute("BEGIN TRANSACTION")
+    try:
+        con.execute(f"INSERT INTO {CHECKPOINT_TABLE_NAME} SELECT ?, * FROM ({sql})", [at] + params)
+        count = con.execute(f"SELECT count(*) FROM {CHECKPOINT_TABLE_NAME} WHERE checkpoint_time = ?",
+                            [at]).fetchone()[0]
+        con.execute(f"INSERT INTO {CHECKPOINT_TIMES_TABLE_NAME} VALUES (?, ?, ?)", [at, count, datetime.utcnow()])
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    return count
+
+
+def following_checkpoint_time(con, until: datetime, interval: timedelta = CHECKPOINT_INTERVAL) -> Optional[datetime]:
+    """One interval after the latest checkpoint (or RIB dump) at or before a time, or None without either."""
+    base_time = latest_checkpoint(con, until)
+    if base_time is None:
+        dump = _latest_dump(con, until)
+        if dump is None:
+            return None
+        base_time = dump[1]
+    return base_time + interval
+
+
+def next_checkpoint_time(con, until: datetime, interval: timedelta = CHECKPOINT_INTERVAL) -> Optional[datetime]:
+    """When the next checkpoint is due (one interval after the previous base), if that is not after a time."""
+    next_time = following_checkpoint_time(con, until, interval)
+    return next_time if next_time is not None and next_time <= until else None
+
+
+def prune_checkpoints(con, now: datetime, keep_hourly: timedelta = CHECKPOINT_KEEP_HOURLY,
+                      keep_daily: timedelta = CHECKPOINT_KEEP_DAILY) -> List[datetime]:
+    """
+    Delete the checkpoints outside the retention policy: those older than
+    keep_hourly before `now` that are not the first of their day, and all
+    older than keep_daily. The latest checkpoint is always kept. Returns the
+    deleted checkpoint times.
+    """
+    rows = con.execute(f"""
+        SELECT checkpoint_time FROM {CHECKPOINT_TIMES_TABLE_NAME}
+        WHERE checkpoint_time < ?
+          AND checkpoint_time < (SELECT max(checkpoint_time) FROM {CHECKPOINT_TIMES_TABLE_NAME})
+          AND (checkpoint_time < ? OR checkpoint_time NOT IN (
+              SELECT min(checkpoint_time) FROM {CHECKPOINT_TIMES_TABLE_NAME}
+              GROUP BY date_trunc('day', checkpoint_time)
+          ))
+        ORDER BY checkpoint_time
+    """, [now - keep_hourly, now - keep_daily]).fetchall()
+    expired = [row[0] for row in rows]
+    if not expired:
+        return []
+
+    con.execute("BEGIN TRANSACTION")
+    try:
+        placeholders = ", ".join("?" * len(expired))
+        con.execute(f"DELETE FROM {CHECKPOINT_TABLE_NAME} WHERE checkpoint_time IN ({placeholders})", expired)
+        con.execute(f"DELETE FROM {CHECKPOINT_TIMES_TABLE_NAME} WHERE checkpoint_time IN ({placeholders})", expired)
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    return expired
+
+
+def materialize_due_checkpoints(con, until: datetime, interval: timedelta = CHECKPOINT_INTERVAL,
+                                archive_dir: str = ARCHIVE_DIR) -> List[datetime]:
+    """Write every checkpoint that is due up to a time, then prune those past retention."""
+    create_checkpoint_tables(con)
+    written = []
+    next_time = next_checkpoint_time(con, until, interval)
+    while next_time is not None:
+        materialize_checkpoint(con, next_time, archive_dir)
+        written.append(next_time)
+        next_time = next_checkpoint_time(con, until, interval)
+    if written:
+        prune_checkpoints(con, until)
+    return written
+
+
+def state_at(con, prefix_or_ip: str, at: datetime, archive_dir: str = ARCHIVE_DIR) -> Dict[str, Any]:
+    """
+    Routes for a prefix (exact) or an IP address (longest matching prefix
+    with routes) as they were at a time.
+    """
+    candidates = covering_prefixes(prefix_or_ip) if "/" not in prefix_or_ip else [prefix_or_ip]
+    sql, params, base_time = _state_query(con, at, candidates, archive_dir)
+    if base_time is None:
+        return {"status": "no_data", "time": at, "query": prefix_or_ip}
+
+    rows = con.execute(f"SELECT * FROM ({sql}) ORDER BY peer_asn, peer_address", params).fetchall()
+    by_prefix: Dict[Tuple[int, int, int], List[Dict[str, Any]]] = {}
+    for prefix, peer_address, peer_asn, as_path, origin_as, path_id, changed_at in rows:
+        by_prefix.setdefault(parse_prefix(str(prefix)), []).append({
+            "peer_address": str(peer_address) if peer_address is not None else None,
+            "peer_asn": peer_asn,
+            "as_path": as_path,
+            "origin_as": origin_as,
+            "path_id": path_id,
+            "since": changed_at,
+        })
+
+    # Candidates are ordered most specific first
+    for candidate in candidates:
+        routes = by_prefix.get(parse_prefix(candidate))
+        if routes:
+            return {"status": "success", "time": at, "query": prefix_or_ip, "prefix": candidate,
+                    "base_time": base_time, "routes": routes}
+    return {"status": "success", "time": at, "query": prefix_or_ip, "prefix": None,
+            "base_time": base_time, "routes": []}
@@ -9,18 +9,43 @@ import gzip
 import pickle
 import time
 import os
+from functools import partial
 from .bgp_stream_wrapper import BGPStreamWrapper
 from datetime import datetime, timedelta
 import duckdb
-from .bgp_to_duckdb import create_rib_table, create_live_updates_table, store_live_update
+from .bgp_to_duckdb import (create_rib_table, create_live_updates_table, UpdateWriter,
+                            parse_communities_to_string, load_path_table, save_path_table)
+from .as_path_table import ASPathTable, get_path_table
+from .bgp_history import (CHECKPOINT_INTERVAL, create_checkpoint_tables, following_checkpoint_time,
+                          materialize_due_checkpoints)
+from .update_archive import archive_closed_hours
+from .mrt_split import map_mrt_chunks, map_mrt_dumps
+from .parallel_fetch import iter_batches_parallel
+from .update_batch import ANNOUNCE, NO_ID, WITHDRAW, to_microseconds
+from .mrt_archive import LocalMRTArchive
+from .db_connection import publish_replica
+from .rib_snapshot import SNAPSHOT_FILE, save_snapshot_from_trees
+from .rib_table import RibTable
+from .rib_journal import JOURNAL_DIR, RibJournal, JournalCompactor, recover_rib
 
 DUCKDB_FILE = "data/bgp_data/bgp_rib_snapshot.duckdb"
+RIB_TIMESTAMP = "20250504.0800"
+# collector -> RIB dump ingested into the merged table
+RIB_FILES = {
+    "rrc03": f"data/bgp_data/bview.{RIB_TIMESTAMP}",
+}
+# Local MRT files (one directory per collector) replayed instead of remote data when present
+MRT_ARCHIVE_DIR = "data/bgp_data/mrt"
+# Seconds between the database replicas published for the router
+REPLICA_INTERVAL = 300
 
 def init_duckdb_connection():
-    """Initialize DuckDB connection and ensure tables exist."""
+    """Initialize DuckDB connection, ensure tables exist and load the AS path dictionary."""
     con = duckdb.connect(DUCKDB_FILE)
     create_rib_table(con)
     create_live_updates_table(con)
+    create_checkpoint_tables(con)
+    load_path_table(con)
     return con
 
 def load_or_create_trees_OPTIMIZED(v4_path="data/bgp_data/radix_v4_obj.pkl.gz", 
@@ -62,18 +87,20 @@ def save_trees_OPTIMIZED(rtree_v4, rtree_v6,
     except Exception:
         pass
 
-def create_trees_from_rib(rib_file_path):
-    """Create radix trees from a BGP RIB dump file."""
-    rtree_v4 = radix.Radix()
-    rtree_v6 = radix.Radix()
+def save_snapshot(rtree_v4, rtree_v6, rib=None, path=SNAPSHOT_FILE):
+    """Write the router's RIB snapshot from the per-peer table, or from the trees without one."""
+    if rib is not None:
+        rib.save(path)
+    else:
+        save_snapshot_from_trees(rtree_v4, rtree_v6, path)
 
+def _iter_rib_elems(rib_file_path):
+    """Yield the RIB ("R") elems of an MRT dump file."""
     stream = pybgpstream.BGPStream()
     stream.set_data_interface("singlefile")
     stream.set_data_interface_option("singlefile", "rib-file", rib_file_path)
     stream.start()
 
-    processed_count = 0
-
     while True:
         rec = stream.get_next_record()
         if rec is None:
@@ -84,123 +111,299 @@ def create_trees_from_rib(rib_file_path):
         elem = rec.get_next_elem()
         while elem:
             if elem.type == "R":
-                prefix_str = elem.fields.get("prefix")
-                as_path_str = elem.fields.get("as-path")
-
-                if prefix_str and as_path_str:
-                    try:
-                        as_numbers = []
-                        raw_asns = as_path_str.split()
-                        for asn_token in raw_asns:
-                            if '{' in asn_token:
-                                clean_token = asn_token.strip('{}')
-                                first_asn_in_set = clean_token.split(',')[0]
-                                if first_asn_in_set.isdigit():
-                                    as_numbers.append(int(first_asn_in_set))
-                            elif asn_token.isdigit():
-                                as_numbers.append(int(asn_token))
-                        
-                        if not as_numbers:
-                            elem = rec.get_next_elem()
-                            continue
-                        
-                        origin_as = as_numbers[-1]
-                        
-                        rnode = None
-                        if ":" in prefix_str:
-                            rnode = rtree_v6.add(prefix_str)
-                        else:
-                            rnode = rtree_v4.add(prefix_str)
-                        
-                        rnode.data["origin_as"] = origin_as
-                        rnode.data["as_path"] = as_numbers
-                        processed_count += 1
-
-                    except (ValueError, IndexError, KeyError):
-                        pass
+                yield elem
             elem = rec.get_next_elem()
 
+def _add_tree_route(rtree_v4, rtree_v6, paths, prefix_str, as_path_str):
+    """Set a prefix's route in the radix trees (last announcement wins)."""
+    if not prefix_str or not as_path_str:
+        return
+    try:
+        path_id = paths.intern_str(as_path_str)
+        if path_id is None:
+            return
+
+        rnode = rtree_v6.add(prefix_str) if ":" in prefix_str else rtree_v4.add(prefix_str)
+        rnode.data["origin_as"] = paths.origin(path_id)
+        rnode.data["as_path"] = paths.as_tuple(path_id)
+        rnode.data["path_id"] = path_id
+    except (ValueError, IndexError, KeyError):
+        pass
+
+def _tree_routes_chunk(chunk_path):
+    """Worker: last AS path seen for each prefix of one MRT chunk, in order of first appearance."""
+    routes = {}
+    for elem in _iter_rib_elems(chunk_path):
+        prefix_str = elem.fields.get("prefix")
+        as_path_str = elem.fields.get("as-path")
+        if prefix_str and as_path_str:
+            routes[prefix_str] = as_path_str
+    return list(routes.items())
+
+def create_trees_from_rib(rib_file_path, workers=1):
+    """
+    Create radix trees from a BGP RIB dump file. With workers > 1 the dump is
+    split into record ranges parsed in a process pool, and chunk results are
+    applied in file order so the trees match a sequential build.
+    """
+    rtree_v4 = radix.Radix()
+    rtree_v6 = radix.Radix()
+    paths = get_path_table()
+
+    if workers > 1:
+        for routes in map_mrt_chunks(rib_file_path, _tree_routes_chunk, workers):
+            for prefix_str, as_path_str in routes:
+                _add_tree_route(rtree_v4, rtree_v6, paths, prefix_str, as_path_str)
+        return rtree_v4, rtree_v6
+
+    for elem in _iter_rib_elems(rib_file_path):
+        _add_tree_route(rtree_v4, rtree_v6, paths, elem.fields.get("prefix"), elem.fields.get("as-path"))
+
     return rtree_v4, rtree_v6
 
-def handle_live_updates(rtree_v4, rtree_v6, rib_timestamp_str="20250504.0800"):
-    """Handle live BGP updates from rrc03 starting from RIB snapshot time."""
+def _parse_rib_into(rib, rib_file_path, collector=None):
+    """Announce every route of a BGP RIB dump file, seen through a collector, into a RibTable."""
+    paths = rib.paths
+    for elem in _iter_rib_elems(rib_file_path):
+        prefix_str = elem.fields.get("prefix")
+        path_id = paths.intern_str(elem.fields.get("as-path"))
+
+        if prefix_str and path_id is not None:
+            try:
+                rib.announce(
+                    prefix_str,
+                    elem.peer_asn,
+                    str(elem.peer_address) if elem.peer_address else None,
+                    next_hop=elem.fields.get("next-hop"),
+                    med=elem.fields.get("med"),
+                    local_pref=elem.fields.get("local-pref"),
+                    communities=parse_communities_to_string(elem.fields.get("communities")),
+                    path_id=path_id,
+                    collector=collector
+                )
+            except (ValueError, KeyError):
+                pass
+    return rib
+
+def _rib_table_chunk(collector, chunk_path):
+    """Worker: one MRT chunk as a frozen per-peer RIB with its own path table."""
+    return _parse_rib_into(RibTable(ASPathTable()), chunk_path, collector).freeze()
+
+def create_rib_table_from_rib(rib_file_path, workers=1, collector=None):
+    """
+    Create a per-peer RIB table (every peer's route and attributes) from a BGP
+    RIB dump file. With workers > 1 chunks are parsed in a process pool and
+    merged in file order.
+    """
+    rib = RibTable()
+    if workers > 1:
+        for snapshot in map_mrt_chunks(rib_file_path, partial(_rib_table_chunk, collector), workers):
+            rib.merge_snapshot(snapshot)
+        return rib
+    return _parse_rib_into(rib, rib_file_path, collector)
+
+def create_rib_table_from_ribs(rib_files, workers=1):
+    """
+    Create one deduplicated per-peer RIB table from the RIB dumps of several
+    collectors (collector -> dump path). Routes seen by more than one
+    collector are stored once, tagged with every collector that carries them.
+    """
+    rib_files = {collector: path for collector, path in rib_files.items() if os.path.exists(path)}
+    rib = RibTable()
+    if workers > 1:
+        for _, snapshot in map_mrt_dumps(rib_files, _rib_table_chunk, workers):
+            rib.merge_snapshot(snapshot)
+        return rib
+    for collector, path in rib_files.items():
+        _parse_rib_into(rib, path, collector)
+    return rib
+
+def handle_live_updates(rtree_v4, rtree_v6, rib_timestamp_str=RIB_TIMESTAMP, rib=None, db_con=None, journal=None,
+                        collectors=None, workers=1, archive=None):
+    """
+    Handle live BGP updates from the collectors (default: those in RIB_FILES)
+    starting from RIB snapshot time. Updates are streamed in columnar
+    UpdateBatches and processed while the rest of the window is still being
+    read; with workers > 1 the collectors' time slices are decoded in a
+    process pool and merged back in timestamp order. With a LocalMRTArchive the updates are
+    replayed from its files, offline.
+
+    Updates are applied to the radix trees when given (last announcement wins)
+    and to the per-peer RibTable. With a RibTable, every applied update is
+    appended to the write-ahead journal, processing resumes from the journal's
+    ingest cursor, and the journal is compacted into the RIB snapshot in the
+    background every COMPACT_INTERVAL updates. Without one, the trees are
+    re-saved every SAVE_INTERVAL updates.
+    Updates are stored in DuckDB in bulk by a background UpdateWriter, which
+    commits its own ingest cursor with the rows, so a restart re-reads from
+    the older of the two cursors and neither loses nor repeats updates. They are
+    folded into an hourly routing-state checkpoint, so point-in-time lookups
+    replay at most one hour of updates. Closed hours then move to the Parquet
+    update archive. Every REPLICA_INTERVAL seconds the database is copied to
+    a replica the router reads, since it cannot open the file while this
+    process holds it.
+    Each AS path is parsed once into the shared path table; trees, RIB table
+    and DuckDB rows all refer to it by path id.
+    """
     
-    stream_wrapper = BGPStreamWrapper(collectors=["rrc03"])
-    db_con = init_duckdb_connection()
+    stream_wrapper = BGPStreamWrapper(collectors=collectors or list(RIB_FILES), archive=archive)
+    if db_con is None:
+        db_con = init_duckdb_connection()
+    paths = get_path_table()
+    writer = UpdateWriter(db_con)
+
+    compactor = None
+    if rib is not None:
+        if journal is None:
+            journal = RibJournal(JOURNAL_DIR)
+        compactor = JournalCompactor(rib, journal, SNAPSHOT_FILE)
     
     rib_time = datetime.strptime(rib_timestamp_str, "%Y%m%d.%H%M")
     current_time = rib_time + timedelta(minutes=10)
     
     update_count = 0
     last_save_count = 0
+    last_replica = 0.0
+    # Next checkpoint time, recomputed only after a checkpoint (or, until there is a base, hourly)
+    next_checkpoint = None
+    checkpoint_checked = None
+    saved_paths = 0
     SAVE_INTERVAL = 10000
+    COMPACT_INTERVAL = 500000
     
     try:
-        chunk_start = rib_time
-        while chunk_start < current_time:
-            chunk_end = min(chunk_start + timedelta(minutes=1), current_time)
+        rib_start = rib_time
+        if journal is not None and all(c in journal.cursor for c in stream_wrapper.collectors):
+            resume_time = datetime.utcfromtimestamp(min(journal.cursor[c] for c in stream_wrapper.collectors))
+            rib_start = max(rib_time, resume_time)
+        # The DuckDB side resumes from its own cursor, which trails the journal's
+        # by what the writer had not committed yet; the writer drops stored rows
+        start_time = rib_start
+        db_start = writer.resume_time(stream_wrapper.collectors)
+        if db_start is not None:
+            start_time = max(rib_time, min(rib_start, db_start))
+        rib_start_us = to_microseconds(rib_start)
+
+        # Batches are processed as they are decoded, so the first updates are
+        # applied before the rest of the window has been read
+        if workers > 1:
+            batches = iter_batches_parallel(stream_wrapper.collectors, start_time, current_time,
+                                            workers=workers, paths=paths, archive=archive)
+        else:
+            batches = stream_wrapper.iter_update_batches(start_time, current_time)
+        for batch in batches:
+            batch_end = batch.last_time
+            
+            # Announcement paths were interned into the shared path table while parsing
+            if len(paths) > saved_paths:
+                save_path_table(db_con, paths)
+                saved_paths = len(paths)
+
+            writer.write(batch)
+            if start_time < rib_start and batch.columns["timestamp"][0] < rib_start_us:
+                # Already applied to the RIB and journaled before the restart
+                batch = batch.take(batch.columns["timestamp"] >= rib_start_us)
+            if next_checkpoint is None and (checkpoint_checked is None
+                                            or batch_end - checkpoint_checked >= CHECKPOINT_INTERVAL):
+                next_checkpoint = following_checkpoint_time(db_con, batch_end)
+                checkpoint_checked = batch_end
+            if next_checkpoint is not None and next_checkpoint <= batch_end:
+                writer.flush()
+                materialize_due_checkpoints(db_con, batch_end)
+                archive_closed_hours(db_con)
+                next_checkpoint = following_checkpoint_time(db_con, batch_end)
             
-            historical_updates = stream_wrapper.get_prefix_updates_in_range(
-                start_time=chunk_start,
-                end_time=chunk_end
-            )
+            if time.time() - last_replica >= REPLICA_INTERVAL:
+                writer.flush()
+                publish_replica(db_con)
+                last_replica = time.time()
             
-            if historical_updates:
-                for update in historical_updates:
-                    store_live_update(update, db_con)
-                
-                for update in historical_updates:
-                    prefix_str = update.prefix
+            if rib is not None:
+                applied = rib.apply_batch(batch)
+                journal.append_batch(batch, paths, applied)
+                update_count += int(applied.sum())
+
+            if rtree_v4 is not None and rtree_v6 is not None:
+                prefixes = batch.values["prefix"]
+                for update_type, prefix, path_id in zip(batch.columns["update_type"].tolist(),
+                                                        batch.columns["prefix"].tolist(),
+                                                        batch.columns["path_id"].tolist()):
+                    prefix_str = prefixes[prefix] if prefix >= 0 else None
                     if not prefix_str:
                         continue
 
                     target_tree = rtree_v6 if ":" in prefix_str else rtree_v4
                     
-                    if update.update_type == 'W':
+                    if update_type == WITHDRAW:
                         if prefix_str in target_tree:
                             target_tree.delete(prefix_str)
                     
-                    elif update.update_type == 'A':
-                        if not update.as_path:
+                    elif update_type == ANNOUNCE:
+                        if path_id == NO_ID:
                             continue
 
                         try:
-                            as_numbers = [int(asn) for asn in update.as_path.split()]
-                            
-                            if not as_numbers:
-                                continue
-                            
                             rnode = target_tree.add(prefix_str)
-                            rnode.data["origin_as"] = int(update.origin_as) if update.origin_as else as_numbers[-1]
-                            rnode.data["as_path"] = as_numbers
+                            rnode.data["origin_as"] = paths.origin(path_id)
+                            rnode.data["as_path"] = paths.as_tuple(path_id)
+                            rnode.data["path_id"] = path_id
                             
-                            update_count += 1
+                            if rib is None:
+                                update_count += 1
                             
-                            if update_count - last_save_count >= SAVE_INTERVAL:
+                            if rib is None and update_count - last_save_count >= SAVE_INTERVAL:
                                 save_trees_OPTIMIZED(rtree_v4, rtree_v6)
+                                save_snapshot(rtree_v4, rtree_v6)
                                 last_save_count = update_count
 
                         except (ValueError, IndexError, KeyError):
                             continue
-            
-            chunk_start = chunk_end
+
+            if journal is not None:
+                for collector in stream_wrapper.collectors:
+                    journal.advance_cursor(collector, batch_end)
+                journal.flush()
+
+                if update_count - last_save_count >= COMPACT_INTERVAL and compactor.compact():
+                    last_save_count = update_count
+
+        if journal is not None:
+            for collector in stream_wrapper.collectors:
+                journal.advance_cursor(collector, current_time)
+            journal.flush()
+        
+        writer.flush()
+        publish_replica(db_con)
         
     except KeyboardInterrupt:
-        save_trees_OPTIMIZED(rtree_v4, rtree_v6)
+        if rtree_v4 is not None and rtree_v6 is not None:
+            save_trees_OPTIMIZED(rtree_v4, rtree_v6)
+            if rib is None:
+                save_snapshot(rtree_v4, rtree_v6)
+        writer.close()
         db_con.close()
+    finally:
+        writer.close()
+        if writer.failed:
+            print(f"{writer.failed} updates could not be stored: {writer.last_error}")
+        if journal is not None:
+            journal.flush()
+        if compactor is not None:
+            compactor.wait()
 
 if __name__ == "__main__":
-    rtree_v4, rtree_v6 = load_or_create_trees_OPTIMIZED()
+    # Load the AS path dictionary before anything else interns paths
+    db_con = init_duckdb_connection()
 
-    if rtree_v4 is None or rtree_v6 is None:
-        RIB_FILE = "data/bgp_data/bview.20250504.0800"
-        if not os.path.exists(RIB_FILE):
-            exit(1)
-            
-        rtree_v4, rtree_v6 = create_trees_from_rib(RIB_FILE)
-        if rtree_v4 and rtree_v6:
-            save_trees_OPTIMIZED(rtree_v4, rtree_v6)
-        else:
+    # Base snapshot plus the journal tail it does not cover
+    journal = RibJournal(JOURNAL_DIR)
+    rib, _ = recover_rib(SNAPSHOT_FILE, journal)
+    if rib is None:
+        if not any(os.path.exists(path) for path in RIB_FILES.values()):
             exit(1)
+        rib = create_rib_table_from_ribs(RIB_FILES, workers=os.cpu_count() or 1)
+        JournalCompactor(rib, journal, SNAPSHOT_FILE).compact(background=False)
 
-    handle_live_updates(rtree_v4, rtree_v6) 
\ No newline at end of file
+    archive = LocalMRTArchive(MRT_ARCHIVE_DIR) if os.path.isdir(MRT_ARCHIVE_DIR) else None
+    handle_live_updates(None, None, rib=rib, db_con=db_con, journal=journal, workers=os.cpu_count() or 1,
+                        archive=archive)
@@ -1,42 +1,220 @@
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional, Sequence
 import pybgpstream
 from datetime import datetime, timedelta
 from dataclasses import dataclass
+from .bgp_to_duckdb import parse_communities_to_string
+from .as_path_table import ASPathTable, get_path_table
+from .mrt_archive import LocalMRTArchive
+from .update_batch import UpdateBatch, UpdateBatchBuilder
+
+# Updates per batch yielded by iter_update_batches()
+BATCH_SIZE = 5000
+
+# BGPStream prefix filter modifiers: the prefix itself, its more/less specifics, or both
+PREFIX_MATCHES = ("exact", "more", "less", "any")
+_ELEM_TYPES = {"A": "announcements", "W": "withdrawals"}
+
+
+def _asn_number(asn) -> int:
+    return int(str(asn).upper().replace("AS", ""))
+
+
+def bgpstream_filter(prefix: Optional[str] = None, prefix_match: str = "exact", peer_asn=None, asn=None,
+                     origin_asn=None, elem_types: Optional[Sequence[str]] = None) -> Optional[str]:
+    """
+    Build a BGPStream filter string, so libbgpstream skips non-matching
+    elements before they are decoded into Python objects. asn matches an AS
+    anywhere in the path, origin_asn the last one; elem_types holds 'A'
+    and/or 'W'. Returns None when nothing is filtered.
+    """
+    terms = []
+    if prefix:
+        if prefix_match not in PREFIX_MATCHES:
+            raise ValueError(f"Unknown prefix match {prefix_match!r}, expected one of {PREFIX_MATCHES}")
+        terms.append(f"prefix {prefix_match} {prefix}")
+    if peer_asn:
+        terms.append(f"peer {_asn_number(peer_asn)}")
+    if asn:
+        terms.append(f"aspath _{_asn_number(asn)}_")
+    if origin_asn:
+        terms.append(f"aspath _{_asn_number(origin_asn)}$")
+    if elem_types:
+        terms.append("elemtype " + " ".join(_ELEM_TYPES[t] for t in elem_types))
+    return " and ".join(terms) or None
 
 @dataclass
 class BGPUpdate:
-    """Simplified BGP update dataclass with only essential fields."""
+    """Simplified BGP update dataclass with the fields needed for per-peer RIB state."""
     timestamp: datetime
     prefix: str
     as_path: str
     update_type: str  # 'A' for announce, 'W' for withdraw
     origin_as: Optional[str]
     collector: str
+    peer_asn: Optional[int] = None
+    peer_address: Optional[str] = None
+    next_hop: Optional[str] = None
+    communities: Optional[str] = None
+    med: Optional[int] = None
+    local_pref: Optional[int] = None
+    atomic_aggregate: bool = False
+    aggregator: Optional[str] = None
+    path_id: Optional[int] = None  # id in the shared ASPathTable, set once the path is interned
 
 class BGPStreamWrapper:
     """Minimal BGP stream wrapper for radix tree updates only."""
     
-    def __init__(self, collectors: Optional[List[str]] = None):
-        """Initialize with basic collector list."""
+    def __init__(self, collectors: Optional[List[str]] = None, paths: Optional[ASPathTable] = None,
+                 archive: Optional[LocalMRTArchive] = None):
+        """
+        Initialize with basic collector list and the path table announcements
+        are interned into. With a local MRT archive, streams read its files
+        instead of asking the BGPStream broker for remote data.
+        """
         self.collectors = collectors or ["rrc03"]
+        self.paths = paths if paths is not None else get_path_table()
+        self.archive = archive
     
-    def _create_stream(self, start_time: datetime, end_time: datetime) -> pybgpstream.BGPStream:
-        """Create a BGP stream for the specified time range."""
-        return pybgpstream.BGPStream(
+    def _create_stream(self, start_time: datetime, end_time: datetime,
+                       filter: Optional[str] = None) -> pybgpstream.BGPStream:
+        """Create a BGP stream for the specified time range, filtered by libbgpstream if given a filter string."""
+        options = dict(
             from_time=start_time.strftime("%Y-%m-%d %H:%M:%S UTC"),
             until_time=end_time.strftime("%Y-%m-%d %H:%M:%S UTC"),
             collectors=self.collectors,
             record_type="updates"
         )
+        if filter:
+            options["filter"] = filter
+        if self.archive is None:
+            return pybgpstream.BGPStream(**options)
+        return self.archive.configure(pybgpstream.BGPStream(data_interface="csvfile", **options))
+    
+    def _elements(self, start_time: datetime, end_time: datetime, prefix: Optional[str] = None,
+                  asn: Optional[str] = None, prefix_match: str = "exact", peer_asn: Optional[str] = None,
+                  origin_asn: Optional[str] = None, elem_types: Optional[Sequence[str]] = None):
+        """
+        Yield (element, path id) for the stream's elements. The stream already
+        applied the filters; the AS checks are repeated on the parsed path,
+        which unlike the path regex also looks inside AS sets.
+        """
+        if not start_time or not end_time:
+            return
+        
+        stream_filter = bgpstream_filter(prefix, prefix_match, peer_asn, asn, origin_asn, elem_types)
+        asn = _asn_number(asn) if asn else None
+        origin_asn = _asn_number(origin_asn) if origin_asn else None
+        
+        # Stream errors reach the caller: a window cut short must not pass for a complete one
+        stream = self._create_stream(start_time, end_time, stream_filter)
+        for elem in stream:
+            try:
+                # Interning parses each distinct path string once
+                path_id = self.paths.intern_str(elem.fields.get("as-path", ""))
+            except Exception:
+                continue
+            if asn and (path_id is None or asn not in self.paths.as_tuple(path_id)):
+                continue
+            if origin_asn and (path_id is None or self.paths.origin(path_id) != origin_asn):
+                continue
+            yield elem, path_id
+    
+    def _to_update(self, elem, path_id: Optional[int]) -> BGPUpdate:
+        """Convert a stream element to a BGPUpdate."""
+        return BGPUpdate(
+            timestamp=datetime.utcfromtimestamp(elem.time),
+            prefix=elem.fields.get("prefix", ""),
+            as_path=elem.fields.get("as-path", ""),
+            update_type=elem.type,
+            origin_as=str(self.paths.origin(path_id)) if path_id is not None else None,
+            collector=elem.collector,
+            peer_asn=elem.peer_asn,
+            peer_address=str(elem.peer_address) if elem.peer_address else None,
+            next_hop=elem.fields.get("next-hop"),
+            communities=parse_communities_to_string(elem.fields.get("communities")),
+            med=elem.fields.get("med"),
+            local_pref=elem.fields.get("local-pref"),
+            atomic_aggregate="atomic-aggregate" in elem.fields,
+            aggregator=elem.fields.get("aggregator"),
+            path_id=path_id
+        )
+    
+    def _append(self, builder: UpdateBatchBuilder, elem, path_id: Optional[int]):
+        """Append a stream element to a batch builder."""
+        fields = elem.fields
+        builder.append(
+            elem.time, elem.type, fields.get("prefix", ""), fields.get("as-path", ""),
+            origin_as=self.paths.origin(path_id) if path_id is not None else None,
+            collector=elem.collector,
+            peer_asn=elem.peer_asn,
+            peer_address=str(elem.peer_address) if elem.peer_address else None,
+            next_hop=fields.get("next-hop"),
+            communities=parse_communities_to_string(fields.get("communities")),
+            med=fields.get("med"),
+            local_pref=fields.get("local-pref"),
+            atomic_aggregate="atomic-aggregate" in fields,
+            aggregator=fields.get("aggregator"),
+            path_id=path_id
+        )
+    
+    def iter_updates(self,
+                     start_time: datetime,
+                     end_time: datetime,
+                     prefix: Optional[str] = None,
+                     asn: Optional[str] = None,
+                     prefix_match: str = "exact",
+                     peer_asn: Optional[str] = None,
+                     origin_asn: Optional[str] = None,
+                     elem_types: Optional[Sequence[str]] = None) -> Iterator[BGPUpdate]:
+        """
+        Yield BGP updates within a time range as they are decoded, in stream
+        order. The window is not limited: only the current record is held in
+        memory, and stopping the iteration stops reading.
+        
+        The filters (see bgpstream_filter) are evaluated by libbgpstream, so
+        only matching elements reach Python.
+        """
+        for elem, path_id in self._elements(start_time, end_time, prefix, asn, prefix_match, peer_asn,
+                                            origin_asn, elem_types):
+            try:
+                update = self._to_update(elem, path_id)
+            except Exception:
+                continue
+            yield update
+    
+    def iter_update_batches(self,
+                            start_time: datetime,
+                            end_time: datetime,
+                            batch_size: int = BATCH_SIZE,
+                            **filters) -> Iterator[UpdateBatch]:
+        """
+        Yield the updates of iter_updates() as UpdateBatches of at most
+        batch_size, in stream order. Elements are appended to the batch
+        columns directly, without a BGPUpdate per update.
+        """
+        builder = UpdateBatchBuilder()
+        for elem, path_id in self._elements(start_time, end_time, **filters):
+            try:
+                self._append(builder, elem, path_id)
+            except Exception:
+                continue
+            if len(builder) >= batch_size:
+                yield builder.build()
+                builder = UpdateBatchBuilder()
+        if len(builder):
+            yield builder.build()
     
     def get_prefix_updates_in_range(self, 
                                   start_time: datetime,
                                   end_time: datetime,
                                   prefix: Optional[str] = None,
-                                  asn: Optional[str] = None) -> List[BGPUpdate]:
+                                  asn: Optional[str] = None,
+                                  **filters) -> List[BGPUpdate]:
         """
-        Get BGP updates within a specific time range.
-        Only method actually used by bgp_radix.py.
+        Get BGP updates within a specific time range as a list, filtered like
+        iter_updates(), or an empty list if the stream fails. Windows are
+        limited to one hour to bound memory; use iter_updates() or
+        iter_update_batches() for longer ones.
         """
         if not start_time or not end_time:
             return []
@@ -47,39 +225,14 @@ class BGPStreamWrapper:
             end_time = start_time + timedelta(hours=1)
         
         try:
-            stream = self._create_stream(start_time, end_time)
-            updates = []
-            
-            for elem in stream:
-                try:
-                    current_prefix = elem.fields.get("prefix", "")
-                    as_path = elem.fields.get("as-path", "")
-                    
-                    if prefix and current_prefix != prefix:
-                        continue
-                    if asn and (not as_path or asn not in as_path.split()):
-                        continue
-                    
-                    update = BGPUpdate(
-                        timestamp=datetime.utcfromtimestamp(elem.time),
-                        prefix=current_prefix,
-                        as_path=as_path,
-                        update_type=elem.type,
-                        origin_as=as_path.split()[-1] if as_path else None,
-                        collector=elem.collector
-                    )
-                    updates.append(update)
-                    
-                except Exception:
-                    continue
-                    
+            return list(self.iter_updates(start_time, end_time, prefix=prefix, asn=asn, **filters))
         except Exception:
             return []
-            
-        return updates
     
-    def summarize_updates(self, updates: List[BGPUpdate]) -> Dict:
-        """Create a summary of BGP updates. Used by bgp_radix.py."""
+    def summarize_updates(self, updates) -> Dict:
+        """Create a summary of BGP updates (an UpdateBatch or a list of BGPUpdates). Used by bgp_radix.py."""
+        if isinstance(updates, UpdateBatch):
+            return updates.summary()
         if not updates:
             return {"total_updates": 0, "status": "No updates found"}
             
@@ -7,10 +7,150 @@ import pybgpstream
 import duckdb
 import time
 import os
+import threading
+from collections import deque
 from datetime import datetime
+from functools import lru_cache, partial
+import numpy as np
+import pandas as pd
+from .mrt_split import map_mrt_chunks
+from .as_path_table import get_path_table, parse_as_path
+from .ip_prefix import parse_prefix, prefix_range
+from .update_rollup import create_rollup_tables, rollup_batch
+from .update_batch import NO_ID, STRING_COLUMNS, UPDATE_TYPES, UpdateBatch
+from .db_connection import publish_replica
 
 DUCKDB_FILE = "bgp_rib_snapshot.duckdb"
 RIB_TABLE_NAME = "rib_entries"
+UPDATES_TABLE_NAME = "rrc03_updates"
+PATH_TABLE_NAME = "as_paths"
+INGEST_CURSOR_TABLE_NAME = "ingest_cursor"
+
+# Numeric form of `prefix`: first/last address as 128-bit values split into
+# unsigned 64-bit halves (IPv4 addresses live in the low half)
+PREFIX_RANGE_COLUMNS = ["ip_version", "prefix_len", "start_hi", "start_lo", "end_hi", "end_lo"]
+PREFIX_RANGE_TYPES = ["UTINYINT", "UTINYINT", "UBIGINT", "UBIGINT", "UBIGINT", "UBIGINT"]
+_LOW_MASK = (1 << 64) - 1
+
+@lru_cache(maxsize=1 << 20)
+def prefix_range_values(prefix):
+    """
+    (ip_version, prefix_len, start_hi, start_lo, end_hi, end_lo) of a prefix,
+    or None if it does not parse. Cached, since updates repeat prefixes.
+    """
+    try:
+        version, value, plen = parse_prefix(str(prefix))
+    except (ValueError, OSError):
+        return None
+    start, end = prefix_range(version, value, plen)
+    return (version, plen, start >> 64, start & _LOW_MASK, end >> 64, end & _LOW_MASK)
+
+def prefix_range_arrays(prefixes):
+    """The prefix range columns of a sequence of prefixes, as nullable pandas arrays."""
+    values = [prefix_range_values(p) if p else None for p in prefixes]
+    valid = np.array([v is not None for v in values], dtype=bool)
+    parsed = np.array([v for v in values if v is not None], dtype=np.uint64).reshape(-1, len(PREFIX_RANGE_COLUMNS))
+    arrays = {}
+    for i, column in enumerate(PREFIX_RANGE_COLUMNS):
+        data = np.zeros(len(values), dtype=np.uint64)
+        data[valid] = parsed[:, i]
+        arrays[column] = pd.arrays.IntegerArray(data, ~valid)
+    return arrays
+
+def _add_columns(con, table_name, columns, column_types):
+    for column, column_type in zip(columns, column_types):
+        con.execute(f"ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS {column} {column_type};")
+
+def backfill_prefix_ranges(con, table_name):
+    """Fills the prefix range columns of rows stored before they existed. Returns the number of prefixes."""
+    prefixes = [row[0] for row in con.execute(f"""
+        SELECT DISTINCT CAST(prefix AS VARCHAR) FROM {table_name}
+        WHERE ip_version IS NULL AND prefix IS NOT NULL
+    """).fetchall()]
+    if not prefixes:
+        return 0
+    con.register("prefix_ranges", pd.DataFrame({"prefix": prefixes, **prefix_range_arrays(prefixes)}))
+    try:
+        assignments = ", ".join(f"{column} = r.{column}" for column in PREFIX_RANGE_COLUMNS)
+        con.execute(f"""
+            UPDATE {table_name} SET {assignments}
+            FROM prefix_ranges r
+            WHERE CAST({table_name}.prefix AS VARCHAR) = r.prefix AND {table_name}.ip_version IS NULL
+        """)
+    finally:
+        con.unregister("prefix_ranges")
+    return len(prefixes)
+
+# Typed form of `as_path`: its ASNs (as parsed by parse_as_path), their count and the first hop
+AS_PATH_COLUMNS = ["as_path_asns", "path_length", "first_hop_as"]
+AS_PATH_TYPES = ["BIGINT[]", "USMALLINT", "BIGINT"]
+
+def as_path_list_sql(column="as_path"):
+    """
+    DuckDB expression turning an AS path string into a BIGINT list the way
+    parse_as_path does: first ASN of an AS_SET, confederation segments skipped.
+    """
+    return (f"list_filter(list_transform(string_split({column}, ' '), "
+            f"t -> CASE WHEN t NOT LIKE '%(%' THEN TRY_CAST(split_part(trim(t, '{{}}'), ',', 1) AS BIGINT) END), "
+            f"a -> a >= 0)")
+
+def as_path_values(asns):
+    """(as_path_asns, path_length, first_hop_as) of a parsed AS path."""
+    if asns is None:
+        return None, None, None
+    asns = list(asns)
+    return asns, len(asns), asns[0] if asns else None
+
+def backfill_as_path_columns(con, table_name):
+    """Fills the typed AS path columns of rows stored before they existed."""
+    con.execute(f"""
+        UPDATE {table_name} SET as_path_asns = {as_path_list_sql()}
+        WHERE as_path_asns IS NULL AND as_path IS NOT NULL
+    """)
+    con.execute(f"""
+        UPDATE {table_name} SET path_length = len(as_path_asns), first_hop_as = as_path_asns[1]
+        WHERE path_length IS NULL AND as_path_asns IS NOT NULL
+    """)
+
+def prefix_range_filter(prefixes, match="exact"):
+    """
+    SQL predicate (and parameters) selecting rows whose prefix equals
+    ("exact"), covers ("covering"), is covered by ("covered") or either
+    ("related") any of the given prefixes. Every condition compares a stored
+    range column with a constant, so DuckDB can skip row groups by their
+    min/max zone maps instead of casting INET per row (parameters are cast
+    to the column types so the columns themselves are never cast).
+
+    A row covered by X starts inside X and is at least as long; a row
+    covering X contains X's first address and is at most as long. Since a
+    prefix of /64 or shorter spans whole low halves, the two halves can be
+    compared independently.
+    """
+    if match not in ("exact", "covering", "covered", "related"):
+        raise ValueError(f"Unknown prefix match {match!r}")
+    clauses, params = [], []
+    for prefix in prefixes:
+        values = prefix_range_values(prefix)
+        if values is None:
+            raise ValueError(f"Invalid prefix {prefix!r}")
+        version, plen, start_hi, start_lo, end_hi, end_lo = values
+        if match == "exact":
+            clauses.append("(ip_version = ?::UTINYINT AND prefix_len = ?::UTINYINT "
+                           "AND start_hi = ?::UBIGINT AND start_lo = ?::UBIGINT)")
+            params.extend([version, plen, start_hi, start_lo])
+        if match in ("covered", "related"):
+            clauses.append("(ip_version = ?::UTINYINT AND prefix_len >= ?::UTINYINT "
+                           "AND start_hi BETWEEN ?::UBIGINT AND ?::UBIGINT "
+                           "AND start_lo BETWEEN ?::UBIGINT AND ?::UBIGINT)")
+            params.extend([version, plen, start_hi, end_hi, start_lo, end_lo])
+        if match in ("covering", "related"):
+            clauses.append("(ip_version = ?::UTINYINT AND prefix_len <= ?::UTINYINT "
+                           "AND start_hi <= ?::UBIGINT AND end_hi >= ?::UBIGINT "
+                           "AND start_lo <= ?::UBIGINT AND end_lo >= ?::UBIGINT)")
+            params.extend([version, plen, start_hi, start_hi, start_lo, start_lo])
+    if not clauses:
+        return "FALSE", []
+    return f"({' OR '.join(clauses)})", params
 
 def create_rib_table(con):
     """Creates the RIB table in DuckDB if it doesn't exist."""
@@ -36,9 +176,56 @@ def create_rib_table(con):
             local_pref BIGINT,
             atomic_aggregate BOOLEAN,
             aggregator_as BIGINT,
-            aggregator_address INET
+            aggregator_address INET,
+            path_id UINTEGER,
+            ip_version UTINYINT,
+            prefix_len UTINYINT,
+            start_hi UBIGINT,
+            start_lo UBIGINT,
+            end_hi UBIGINT,
+            end_lo UBIGINT,
+            as_path_asns BIGINT[],
+            path_length USMALLINT,
+            first_hop_as BIGINT
         );
     """)
+    con.execute(f"ALTER TABLE {RIB_TABLE_NAME} ADD COLUMN IF NOT EXISTS path_id UINTEGER;")
+    _add_columns(con, RIB_TABLE_NAME, PREFIX_RANGE_COLUMNS, PREFIX_RANGE_TYPES)
+    _add_columns(con, RIB_TABLE_NAME, AS_PATH_COLUMNS, AS_PATH_TYPES)
+    backfill_prefix_ranges(con, RIB_TABLE_NAME)
+    backfill_as_path_columns(con, RIB_TABLE_NAME)
+    create_path_table(con)
+
+def create_path_table(con):
+    """Creates the AS path dictionary table (path_id -> AS path) if it doesn't exist."""
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {PATH_TABLE_NAME} (
+            path_id UINTEGER PRIMARY KEY,
+            as_path VARCHAR
+        );
+    """)
+
+def load_path_table(con, paths=None):
+    """
+    Loads the AS path dictionary into a path table, so ids assigned by earlier
+    runs stay valid. Defaults to the process-wide shared table.
+    """
+    paths = paths if paths is not None else get_path_table()
+    create_path_table(con)
+    rows = con.execute(f"SELECT path_id, as_path FROM {PATH_TABLE_NAME} ORDER BY path_id").fetchall()
+    for path_id, as_path in rows:
+        if paths.intern(parse_as_path(as_path)) != path_id:
+            raise ValueError(f"{PATH_TABLE_NAME} does not match the in-memory path table at id {path_id}")
+    return paths
+
+def save_path_table(con, paths=None):
+    """Appends path table entries that are not yet in the AS path dictionary."""
+    paths = paths if paths is not None else get_path_table()
+    stored = con.execute(f"SELECT count(*) FROM {PATH_TABLE_NAME}").fetchone()[0]
+    new_rows = [(path_id, paths.to_string(path_id)) for path_id in range(stored, len(paths))]
+    if new_rows:
+        con.executemany(f"INSERT INTO {PATH_TABLE_NAME} VALUES (?, ?)", new_rows)
+    return len(new_rows)
 
 def create_live_updates_table(con):
     """Creates a table specifically for live BGP updates if it doesn't exist."""
@@ -63,9 +250,25 @@ def create_live_updates_table(con):
             med BIGINT,
             local_pref BIGINT,
             atomic_aggregate BOOLEAN,
-            aggregator VARCHAR
+            aggregator VARCHAR,
+            path_id UINTEGER,
+            ip_version UTINYINT,
+            prefix_len UTINYINT,
+            start_hi UBIGINT,
+            start_lo UBIGINT,
+            end_hi UBIGINT,
+            end_lo UBIGINT,
+            as_path_asns BIGINT[],
+            path_length USMALLINT,
+            first_hop_as BIGINT
         );
     """)
+    con.execute("ALTER TABLE rrc03_updates ADD COLUMN IF NOT EXISTS path_id UINTEGER;")
+    _add_columns(con, "rrc03_updates", PREFIX_RANGE_COLUMNS, PREFIX_RANGE_TYPES)
+    _add_columns(con, "rrc03_updates", AS_PATH_COLUMNS, AS_PATH_TYPES)
+    backfill_prefix_ranges(con, "rrc03_updates")
+    backfill_as_path_columns(con, "rrc03_updates")
+    create_path_table(con)
     
     con.execute("CREATE INDEX IF NOT EXISTS idx_updates_timestamp ON rrc03_updates(timestamp);")
     con.execute("CREATE INDEX IF NOT EXISTS idx_updates_prefix ON rrc03_updates(prefix);")
@@ -78,13 +281,15 @@ def store_live_update(update, con):
 
         if not update.prefix or update.prefix.strip() == "":
             return False
+        range_values = list(prefix_range_values(update.prefix) or [None] * len(PREFIX_RANGE_COLUMNS))
 
         if update.update_type == 'W':
             con.execute("""
                 INSERT INTO rrc03_updates (
                     timestamp, collector, peer_address, peer_asn, 
-                    prefix, update_type
-                ) VALUES (?, ?, ?, ?, ?, ?);
+                    prefix, update_type,
+                    ip_version, prefix_len, start_hi, start_lo, end_hi, end_lo
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
             """, [
                 update.timestamp,
                 update.collector,
@@ -92,14 +297,18 @@ def store_live_update(update, con):
                 update.peer_asn,
                 update.prefix,
                 'W'
-            ])
+            ] + range_values)
         else:
+            paths = get_path_table()
+            path_id = update.path_id if update.path_id is not None else paths.intern_str(update.as_path)
             con.execute("""
                 INSERT INTO rrc03_updates (
                     timestamp, collector, peer_address, peer_asn,
                     prefix, update_type, as_path, origin_as, next_hop,
-                    communities, med, local_pref, atomic_aggregate, aggregator
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
+                    communities, med, local_pref, atomic_aggregate, aggregator,
+                    path_id, ip_version, prefix_len, start_hi, start_lo, end_hi, end_lo,
+                    as_path_asns, path_length, first_hop_as
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
             """, [
                 update.timestamp,
                 update.collector,
@@ -114,34 +323,334 @@ def store_live_update(update, con):
                 update.med,
                 update.local_pref,
                 update.atomic_aggregate,
-                update.aggregator
-            ])
+                update.aggregator,
+                path_id
+            ] + range_values + list(as_path_values(paths.get(path_id) if path_id is not None else None)))
         return True
     except:
         return False
 
+UPDATE_COLUMNS = [
+    "timestamp", "collector", "peer_address", "peer_asn", "prefix", "update_type", "as_path", "origin_as",
+    "next_hop", "communities", "med", "local_pref", "atomic_aggregate", "aggregator", "path_id",
+]
+# Columns a withdrawal does not carry
+ANNOUNCE_ONLY_COLUMNS = UPDATE_COLUMNS[6:]
+
+def batch_to_frame(batch):
+    """
+    Convert an UpdateBatch into a columnar DataFrame in rrc03_updates column
+    order, followed by the prefix range columns. String columns are decoded
+    and prefix ranges computed once per distinct value. Updates that are
+    neither announcements nor withdrawals are dropped.
+    """
+    batch = batch.take(batch.columns["update_type"] > 0)
+    columns = {}
+    for column in UPDATE_COLUMNS:
+        if column == "timestamp":
+            columns[column] = batch.columns["timestamp"].astype("datetime64[us]")
+        elif column == "update_type":
+            columns[column] = np.array(UPDATE_TYPES, dtype=object)[batch.columns["update_type"]]
+        elif column == "atomic_aggregate":
+            columns[column] = batch.columns["atomic_aggregate"]
+        elif column in STRING_COLUMNS:
+            columns[column] = batch.strings(column)
+        else:
+            values = batch.columns[column]
+            columns[column] = pd.arrays.IntegerArray(values, values == NO_ID)
+    # Index -1 (no prefix) picks the appended None
+    ranges = prefix_range_arrays(batch.values["prefix"] + [None])
+    prefix_ids = batch.columns["prefix"]
+    columns.update({column: values[prefix_ids] for column, values in ranges.items()})
+    return pd.DataFrame(columns, copy=False)
+
+def updates_to_frame(updates):
+    """Convert BGPUpdates into a DataFrame like batch_to_frame()."""
+    return batch_to_frame(UpdateBatch.from_updates(updates))
+
+def _batch_insert_sql(table_name):
+    """
+    INSERT ... SELECT from a registered update batch. Rows without a prefix
+    are skipped, withdrawal attributes are cleared, and the typed AS path
+    columns are derived in bulk.
+    """
+    select = []
+    for column in UPDATE_COLUMNS:
+        value = column
+        if column in ANNOUNCE_ONLY_COLUMNS:
+            value = f"CASE WHEN update_type = 'A' THEN {value} END"
+        select.append(value)
+    columns = UPDATE_COLUMNS + PREFIX_RANGE_COLUMNS + AS_PATH_COLUMNS
+    select.extend(PREFIX_RANGE_COLUMNS)
+    select.extend(["as_path_asns", "len(as_path_asns)", "as_path_asns[1]"])
+    return (f"INSERT INTO {table_name} ({', '.join(columns)}) SELECT {', '.join(select)} "
+            f"FROM (SELECT *, CASE WHEN update_type = 'A' THEN {as_path_list_sql()} END AS as_path_asns "
+            f"FROM update_batch WHERE nullif(trim(prefix), '') IS NOT NULL)")
+
+def create_ingest_cursor_table(con):
+    """
+    Creates the ingest cursor table if it doesn't exist: per collector, the
+    newest committed update timestamp and how many updates at that timestamp
+    were committed.
+    """
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {INGEST_CURSOR_TABLE_NAME} (
+            collector VARCHAR PRIMARY KEY,
+            timestamp TIMESTAMP,
+            rows_at BIGINT
+        );
+    """)
+
+def load_ingest_cursor(con):
+    """The ingest cursor as {collector: (timestamp, rows at that timestamp)}."""
+    create_ingest_cursor_table(con)
+    rows = con.execute(f"SELECT collector, timestamp, rows_at FROM {INGEST_CURSOR_TABLE_NAME}").fetchall()
+    return {collector: (timestamp, rows_at) for collector, timestamp, rows_at in rows}
+
+# Moves the ingest cursor past the rows of a registered update batch
+_ADVANCE_CURSOR_SQL = f"""
+    INSERT INTO {INGEST_CURSOR_TABLE_NAME}
+    WITH batch AS (SELECT coalesce(collector, '') AS collector, timestamp FROM update_batch),
+    last AS (SELECT collector, max(timestamp) AS timestamp FROM batch GROUP BY collector)
+    SELECT collector, timestamp, count(*)
+    FROM batch JOIN last USING (collector, timestamp)
+    GROUP BY collector, timestamp
+    ON CONFLICT DO UPDATE SET
+        rows_at = CASE WHEN EXCLUDED.timestamp > timestamp THEN EXCLUDED.rows_at
+                       WHEN EXCLUDED.timestamp = timestamp THEN rows_at + EXCLUDED.rows_at
+                       ELSE rows_at END,
+        timestamp = greatest(timestamp, EXCLUDED.timestamp)
+"""
+
+class UpdateWriter:
+    """
+    Batched writer for live updates.
+
+    Producers hand UpdateBatches (or lists of BGPUpdates) to write(); a
+    dedicated thread concatenates everything queued into one batch and
+    appends it with a single INSERT ... SELECT in one transaction (group
+    commit), so the per-row cost is a few column appends instead of a
+    statement. Buffering is bounded:
+    write() blocks while max_pending rows are waiting. Rows without a prefix,
+    and rows the database rejects, are counted in `failed`; a rejected batch is
+    split in halves until the offending rows are isolated, so one bad row
+    does not cost its batch. With rollup, each batch is also folded into the
+    per-prefix, per-minute rollup in the same transaction.
+
+    The ingest cursor (see create_ingest_cursor_table) is advanced in the
+    transaction that commits the rows, so it never runs ahead of or behind
+    the table. Updates are expected in time order per collector; those the
+    cursor already covers are dropped, so after a crash the stream can be
+    re-read from resume_time() without storing an update twice.
+    """
+
+    def __init__(self, con, table_name="rrc03_updates", batch_size=100000, max_pending=1000000,
+                 flush_interval=1.0, rollup=True):
+        self.con = con.cursor()
+        self.table_name = table_name
+        self.rollup = rollup
+        if rollup:
+            create_rollup_tables(self.con)
+        self.cursor = load_ingest_cursor(self.con)
+        # Collectors whose first updates may already be stored: (timestamp, rows at it still to skip)
+        self._skip = dict(self.cursor)
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self._insert_sql = _batch_insert_sql(table_name)
+
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+        self.skipped = 0
+        self.last_error = None
+
+        self._queue = deque()
+        self._pending = 0
+        self._in_flight = 0
+        self._flush_waiters = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="update-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, updates):
+        """Queue an UpdateBatch or BGPUpdates for writing, blocking while the buffer is full."""
+        if not isinstance(updates, UpdateBatch):
+            updates = list(updates)
+        if not len(updates):
+            return
+        with self._cond:
+            while self._pending >= self.max_pending and not self._closed:
+                self._cond.wait()
+            if self._closed:
+                raise RuntimeError("UpdateWriter is closed")
+            self._queue.append(updates)
+            self._pending += len(updates)
+            self._cond.notify_all()
+
+    def flush(self):
+        """Block until every queued update has been committed."""
+        with self._cond:
+            self._flush_waiters += 1
+            self._cond.notify_all()
+            while self._pending or self._in_flight:
+                self._cond.wait()
+            self._flush_waiters -= 1
+
+    def close(self):
+        """Write what is queued and stop the writer thread."""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        self.con.close()
+
+    def stats(self):
+        return {"written": self.written, "failed": self.failed, "batches": self.batches,
+                "pending": self._pending, "skipped": self.skipped, "last_error": self.last_error}
+
+    def resume_time(self, collectors):
+        """Where re-reading must start so the collectors' stored updates continue without a gap, or None."""
+        if not collectors or any((collector or "") not in self.cursor for collector in collectors):
+            return None
+        return min(self.cursor[collector or ""][0] for collector in collectors)
+
+    def _drop_stored(self, frame):
+        """Drop the rows of a frame the ingest cursor already covers."""
+        if not self._skip or frame.empty:
+            return frame
+        collectors = frame["collector"].fillna("").to_numpy()
+        timestamps = frame["timestamp"].to_numpy()
+        keep = np.ones(len(frame), dtype=bool)
+        for collector, (timestamp, rows_at) in list(self._skip.items()):
+            rows = collectors == collector
+            if not rows.any():
+                continue
+            timestamp = np.datetime64(timestamp, "us")
+            keep &= ~(rows & (timestamps < timestamp))
+            at = np.flatnonzero(rows & (timestamps == timestamp))[:rows_at]
+            keep[at] = False
+            if (rows & (timestamps > timestamp)).any():
+                del self._skip[collector]
+            else:
+                self._skip[collector] = (self._skip[collector][0], rows_at - len(at))
+        self.skipped += int(len(frame) - keep.sum())
+        return frame[keep].reset_index(drop=True)
+
+    def _take_batch(self):
+        """Wait for updates and take about batch_size of them."""
+        with self._cond:
+            deadline = None
+            while not (self._closed or self._flush_waiters) and self._pending < self.batch_size:
+                if not self._pending:
+                    self._cond.wait()
+                    continue
+                # Give a partial batch flush_interval to fill up
+                deadline = deadline or time.time() + self.flush_interval
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch, count = [], 0
+            while self._queue and count < self.batch_size:
+                batch.append(self._queue.popleft())
+                count += len(batch[-1])
+            self._pending -= count
+            self._in_flight = count
+            self._cond.notify_all()
+            return batch, count
+
+    def _run(self):
+        while True:
+            batch, count = self._take_batch()
+            if count:
+                try:
+                    batch = UpdateBatch.concat([updates if isinstance(updates, UpdateBatch)
+                                                else UpdateBatch.from_updates(updates) for updates in batch])
+                    frame = batch_to_frame(batch)
+                    # Updates that could not be converted
+                    self.failed += count - len(batch)
+                    frame = self._drop_stored(frame)
+                    frame["seq"] = np.arange(len(frame))
+                    self._insert(frame)
+                except Exception as e:
+                    self.failed += count
+                    self.last_error = str(e)
+            with self._cond:
+                self._in_flight = 0
+                self._cond.notify_all()
+                if self._closed and not self._queue:
+                    return
+
+    def _insert(self, frame):
+        """Append a batch in one transaction; on error, retry its halves to isolate rejected rows."""
+        if frame.empty:
+            return
+        self.con.register("update_batch", frame)
+        try:
+            self.con.execute("BEGIN TRANSACTION")
+            inserted = self.con.execute(self._insert_sql).fetchone()[0]
+            if self.rollup:
+                rollup_batch(self.con)
+            self.con.execute(_ADVANCE_CURSOR_SQL)
+            self.con.execute("COMMIT")
+        except Exception as e:
+            self.con.execute("ROLLBACK")
+            self.last_error = str(e)
+            inserted = None
+        finally:
+            self.con.unregister("update_batch")
+
+        if inserted is None:
+            if len(frame) == 1:
+                self.failed += 1
+                # A rejected update is not retried after a restart either
+                self._advance_cursor(frame)
+            else:
+                middle = len(frame) // 2
+                self._insert(frame.iloc[:middle])
+                self._insert(frame.iloc[middle:])
+            return
+        self.written += inserted
+        self.failed += len(frame) - inserted
+        self.batches += 1
+        self._remember_cursor(frame)
+
+    def _advance_cursor(self, frame):
+        """Move the ingest cursor past a frame's rows in a transaction of its own."""
+        self.con.register("update_batch", frame)
+        try:
+            self.con.execute(_ADVANCE_CURSOR_SQL)
+        except Exception as e:
+            self.last_error = str(e)
+            return
+        finally:
+            self.con.unregister("update_batch")
+        self._remember_cursor(frame)
+
+    def _remember_cursor(self, frame):
+        """Mirror a committed cursor advance in self.cursor."""
+        for collector, timestamps in frame.groupby(frame["collector"].fillna(""))["timestamp"]:
+            last = timestamps.max().to_pydatetime()
+            rows_at = int((timestamps == last).sum())
+            stored, stored_rows = self.cursor.get(collector, (None, 0))
+            if stored is None or last > stored:
+                self.cursor[collector] = (last, rows_at)
+            elif last == stored:
+                self.cursor[collector] = (stored, stored_rows + rows_at)
+
 def parse_as_path_to_data(as_path_str):
     """Parses an AS path string into a list of integers and extracts the origin AS."""
     if not as_path_str:
         return None, None
     
-    as_numbers = []
-    raw_asns = as_path_str.split()
-    for asn_token in raw_asns:
-        try:
-            if '{' in asn_token:
-                clean_token = asn_token.strip('{}')
-                parts = clean_token.split(',')
-                if parts and parts[0].isdigit():
-                    as_numbers.append(int(parts[0]))
-            elif '(' in asn_token:
-                pass
-            elif asn_token.isdigit():
-                as_numbers.append(int(asn_token))
-        except ValueError:
-            continue
+    as_numbers = parse_as_path(as_path_str)
 
     if not as_numbers:
+        raw_asns = as_path_str.split()
         return " ".join(raw_asns) if raw_asns else None, None
 
     origin_as = as_numbers[-1] if as_numbers else None
@@ -166,74 +675,143 @@ def parse_communities_to_string(communities_list):
             
     return " ".join(result) if result else None
 
-def load_rib_to_duckdb(rib_file_path, db_file=DUCKDB_FILE, table_name=RIB_TABLE_NAME):
-    """Parses a BGP RIB dump (MRT) file and loads its entries into a DuckDB table."""
-    if not os.path.exists(rib_file_path):
-        return
-
-    con = duckdb.connect(database=db_file, read_only=False)
-    create_rib_table(con)
-
+def _iter_rib_rows(rib_file_path, dump_processing_time):
+    """
+    Yield one row per RIB entry of an MRT dump, with the raw AS path string in
+    place of the (as_path, origin_as) columns; the path id is assigned by the
+    caller's path table.
+    """
     stream = pybgpstream.BGPStream()
     stream.set_data_interface("singlefile")
     stream.set_data_interface_option("singlefile", "rib-file", rib_file_path)
     stream.start()
 
-    dump_processing_time = datetime.now()
-    inserted_count = 0
-    processed_count = 0
-    batch_data = []
-    BATCH_SIZE = 10000
-
     while True:
         rec = stream.get_next_record()
         if rec is None:
             break
         if rec.status != "valid":
             continue
-        
-        processed_count += 1
 
         elem = rec.get_next_elem()
         while elem:
             if elem.type == "R":
-                as_path_str, origin_as = parse_as_path_to_data(elem.fields.get("as-path"))
-                communities_str = parse_communities_to_string(elem.fields.get("communities"))
-                
-                entry_data = (
+                yield (
                     dump_processing_time,
-                    datetime.fromtimestamp(rec.time) if rec.time else None,
+                    datetime.utcfromtimestamp(rec.time) if rec.time else None,
                     rec.collector,
                     str(elem.peer_address) if elem.peer_address else None,
                     elem.peer_asn,
                     elem.fields.get("prefix"),
-                    as_path_str,
-                    origin_as,
+                    elem.fields.get("as-path"),
                     elem.fields.get("next-hop"),
-                    communities_str,
+                    parse_communities_to_string(elem.fields.get("communities")),
                     elem.fields.get("med"),
                     elem.fields.get("local-pref"),
                     'atomic-aggregate' in elem.fields,
                     elem.fields.get("aggregator", "::").split(":",1)[0] if "aggregator" in elem.fields and elem.fields.get("aggregator").count(":") >=1 else None,
-                    elem.fields.get("aggregator", "::").split(":",1)[-1] if "aggregator" in elem.fields and elem.fields.get("aggregator").count(":") >=1 else None
+                    elem.fields.get("aggregator", "::").split(":",1)[-1] if "aggregator" in elem.fields and elem.fields.get("aggregator").count(":") >=1 else None,
                 )
-                batch_data.append(entry_data)
-
-                if len(batch_data) >= BATCH_SIZE:
-                    con.executemany(f"INSERT INTO {table_name} VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", batch_data)
-                    inserted_count += len(batch_data)
-                    batch_data = []
-            
             elem = rec.get_next_elem()
 
+# Columns of the raw rows of _iter_rib_rows(), as written to chunk Parquet files
+RIB_ROW_COLUMNS = [
+    ("dump_time", "TIMESTAMP"), ("record_time", "TIMESTAMP"), ("collector", "VARCHAR"),
+    ("peer_address", "VARCHAR"), ("peer_asn", "BIGINT"), ("prefix", "VARCHAR"), ("as_path", "VARCHAR"),
+    ("next_hop", "VARCHAR"), ("communities", "VARCHAR"), ("med", "BIGINT"), ("local_pref", "BIGINT"),
+    ("atomic_aggregate", "BOOLEAN"), ("aggregator_as", "VARCHAR"), ("aggregator_address", "VARCHAR"),
+]
+
+def _rib_rows_chunk(dump_processing_time, chunk_path):
+    """
+    Worker: write the raw RIB rows of one MRT chunk to a Parquet file next to
+    the chunk and return its path, so rows reach the parent through the file
+    instead of as pickled tuples.
+    """
+    frame = pd.DataFrame.from_records(list(_iter_rib_rows(chunk_path, dump_processing_time)),
+                                      columns=[column for column, _ in RIB_ROW_COLUMNS])
+    parquet_path = chunk_path + ".parquet"
+    con = duckdb.connect()
+    try:
+        con.register("rib_rows", frame)
+        select = ", ".join(f"CAST({column} AS {column_type}) AS {column}" for column, column_type in RIB_ROW_COLUMNS)
+        quoted_path = parquet_path.replace("'", "''")
+        con.execute(f"COPY (SELECT {select} FROM rib_rows) TO '{quoted_path}' (FORMAT PARQUET)")
+    finally:
+        con.close()
+    return parquet_path
+
+def _read_rib_rows(parquet_path, batch_size):
+    """Yield the raw RIB rows of a chunk Parquet file in order, batch_size at a time, then delete it."""
+    con = duckdb.connect()
+    try:
+        cursor = con.execute("SELECT * FROM read_parquet(?)", [parquet_path])
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        con.close()
+        os.remove(parquet_path)
+
+def load_rib_to_duckdb(rib_file_path, db_file=DUCKDB_FILE, table_name=RIB_TABLE_NAME, workers=1):
+    """
+    Parses a BGP RIB dump (MRT) file and loads its entries into a DuckDB table.
+    With workers > 1 the dump is split into record ranges parsed in a process
+    pool, each written to a Parquet file the parent streams into the table as
+    it arrives; rows are inserted in file order, so the table matches a
+    sequential load.
+    """
+    if not os.path.exists(rib_file_path):
+        return
+
+    con = duckdb.connect(database=db_file, read_only=False)
+    create_rib_table(con)
+    paths = load_path_table(con)
+
+    BATCH_SIZE = 10000
+    dump_processing_time = datetime.utcnow()
+    if workers > 1:
+        chunks = map_mrt_chunks(rib_file_path, partial(_rib_rows_chunk, dump_processing_time), workers)
+        raw_rows = (row for parquet_path in chunks for row in _read_rib_rows(parquet_path, BATCH_SIZE))
+    else:
+        raw_rows = _iter_rib_rows(rib_file_path, dump_processing_time)
+
+    inserted_count = 0
+    batch_data = []
+    insert_sql = f"INSERT INTO {table_name} VALUES ({', '.join('?' * (16 + len(PREFIX_RANGE_COLUMNS) + len(AS_PATH_COLUMNS)))})"
+
+    for row in raw_rows:
+        raw_as_path = row[6]
+        path_id = paths.intern_str(raw_as_path)
+        if path_id is not None:
+            as_path_str, origin_as = paths.to_string(path_id), paths.origin(path_id)
+        else:
+            as_path_str, origin_as = parse_as_path_to_data(raw_as_path)
+
+        range_values = prefix_range_values(row[5]) if row[5] else None
+        batch_data.append(row[:6] + (as_path_str, origin_as) + row[7:] + (path_id,)
+                          + (range_values or (None,) * len(PREFIX_RANGE_COLUMNS))
+                          + as_path_values(paths.get(path_id) if path_id is not None else None))
+
+        if len(batch_data) >= BATCH_SIZE:
+            save_path_table(con, paths)
+            con.executemany(insert_sql, batch_data)
+            inserted_count += len(batch_data)
+            batch_data = []
+
     if batch_data:
-        con.executemany(f"INSERT INTO {table_name} VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", batch_data)
+        save_path_table(con, paths)
+        con.executemany(insert_sql, batch_data)
         inserted_count += len(batch_data)
 
+    # The router reads replicas, not the database file
+    publish_replica(con)
     con.close()
 
 if __name__ == "__main__":
     rib_file = "data/bgp_data/bview.20250504.0800"
 
     if os.path.exists(rib_file):
-        load_rib_to_duckdb(rib_file) 
\ No newline at end of file
+        load_rib_to_duckdb(rib_file, workers=os.cpu_count() or 1) 
\ No newline at end of file
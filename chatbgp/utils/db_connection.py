@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+"""
+Concurrent read access to the BGP DuckDB database
+
+DuckDB locks a database file across processes: one process may open it for
+writing, or any number may open it read-only, never both. The ingest process
+keeps the database open for writing, so the router reads a replica instead:
+publish_replica() copies the database (one consistent transaction snapshot)
+into a new, never modified file under REPLICA_DIR and then points the
+CURRENT file at it. Each replica has its own file name, since DuckDB reuses
+an open database instance for a path it has already opened.
+
+DatabaseManager opens the current replica read-only (or, without a replica
+directory, the database itself, which is only possible while no ingest
+process runs) and switches to a newer replica once it is published. The
+previous replica stays open for queries still running on it and is closed
+at a later switch, once nothing uses it. Until the first replica is
+published it reads the database itself, closing it whenever no query runs
+so the ingest process can still open it. Every thread reads through its own
+cursor, i.e. its own connection to the shared database instance, so request
+threads run queries in parallel instead of queueing on one handle. A query
+running longer than the timeout is interrupted.
+snapshot() keeps a thread's queries on one replica, so they see one
+committed state; a writable database (shared with an in-process writer)
+runs them in one transaction instead.
+
+Replicas are as fresh as the ingest process publishes them (see
+bgp_radix.REPLICA_INTERVAL), and each publish copies the whole live
+database; archived updates are not copied, both sides read the same
+Parquet archive.
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Optional
+
+import duckdb
+
+QUERY_TIMEOUT = 30.0
+RETRY_INTERVAL = 5.0
+REPLICA_DIR = "data/bgp_data/replica"
+CURRENT_FILE = "CURRENT"
+# Replicas kept besides the current one, for readers still on an older replica
+KEEP_REPLICAS = 2
+
+
+class QueryTimeout(TimeoutError):
+    """A query ran longer than its timeout and was interrupted."""
+
+
+def _quote(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def publish_replica(con, replica_dir: str = REPLICA_DIR, keep: int = KEEP_REPLICAS) -> str:
+    """
+    Copy the database of a connection into a new replica file, make it the
+    current replica and remove all but the `keep` previous ones. Returns its path.
+    """
+    os.makedirs(replica_dir, exist_ok=True)
+    name = f"bgp_{datetime.utcnow():%Y%m%dT%H%M%S%f}.duckdb"
+    path = os.path.join(replica_dir, name)
+    tmp_path = path + ".tmp"
+    database = con.execute("SELECT current_database()").fetchone()[0]
+    con.execute(f"ATTACH {_quote(tmp_path)} AS chatbgp_replica")
+    try:
+        con.execute(f'COPY FROM DATABASE "{database}" TO chatbgp_replica')
+    finally:
+        con.execute("DETACH chatbgp_replica")
+    os.replace(tmp_path, path)
+
+    current_path = os.path.join(replica_dir, CURRENT_FILE)
+    with open(current_path + ".tmp", "w") as f:
+        f.write(name)
+    os.replace(current_path + ".tmp", current_path)
+
+    older = sorted(n for n in os.listdir(replica_dir) if n.startswith("bgp_") and n.endswith(".duckdb") and n < name)
+    for old in older[:len(older) - keep]:
+        try:
+            os.remove(os.path.join(replica_dir, old))
+        except OSError:
+            pass
+    return path
+
+
+def current_replica(replica_dir: str = REPLICA_DIR) -> Optional[str]:
+    """Path of the current replica, or None if none was published."""
+    try:
+        with open(os.path.join(replica_dir, CURRENT_FILE)) as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return None
+    path = os.path.join(replica_dir, name)
+    return path if name and os.path.exists(path) else None
+
+
+class ReadCursor:
+    """
+    One thread's connection to the database. execute() matches the DuckDB
+    connection API (and returns the DuckDB cursor), so the query helpers in
+    chatbgp.utils take it wherever they take a connection.
+    """
+
+    def __init__(self, con, timeout: Optional[float] = QUERY_TIMEOUT, source: Optional[str] = None):
+        self.con = con
+        self.timeout = timeout
+        self.source = source
+        self.depth = 0
+        self.in_transaction = False
+        # Held while a query runs, so the cursor is not closed under it
+        self.busy = threading.Lock()
+
+    def execute(self, sql: str, params=None, timeout: Optional[float] = None):
+        """Run a query, interrupting it after the timeout (None uses the cursor's default)."""
+        timeout = self.timeout if timeout is None else timeout
+        with self.busy:
+            if self.con is None:
+                raise duckdb.ConnectionException("Cursor is closed; take a new one from the DatabaseManager")
+            if not timeout:
+                return self.con.execute(sql, params)
+            timer = threading.Timer(timeout, self.con.interrupt)
+            timer.daemon = True
+            timer.start()
+            try:
+                return self.con.execute(sql, params)
+            except duckdb.InterruptException as e:
+                raise QueryTimeout(f"Query exceeded {timeout}s") from e
+            finally:
+                timer.cancel()
+
+    def __getattr__(self, name):
+        return getattr(self.con, name)
+
+
+def _close_cursor(cursor: ReadCursor):
+    try:
+        if cursor.con is not None:
+            cursor.con.close()
+    except Exception:
+        pass
+    cursor.con = None
+
+
+def _close_idle(cursors) -> bool:
+    """Close the cursors unless one is in a snapshot or running a query. Returns whether they were closed."""
+    locked = []
+    try:
+        for cursor in cursors:
+            if cursor.depth or not cursor.busy.acquire(blocking=False):
+                return False
+            locked.append(cursor)
+        for cursor in cursors:
+            _close_cursor(cursor)
+        return True
+    finally:
+        for cursor in locked:
+            cursor.busy.release()
+
+
+class DatabaseManager:
+    """Per-thread cursors over the current replica (or the database), opened once per process."""
+
+    def __init__(self, path: str, read_only: bool = True, replica_dir: Optional[str] = None,
+                 query_timeout: Optional[float] = QUERY_TIMEOUT, retry_interval: float = RETRY_INTERVAL,
+                 verbose: bool = False):
+        self.path = path
+        self.read_only = read_only or replica_dir is not None
+        self.replica_dir = replica_dir
+        self.query_timeout = query_timeout
+        self.retry_interval = retry_interval
+        self.verbose = verbose
+
+        self.con = None
+        self.source: Optional[str] = None
+        self.last_error = None
+        self._last_attempt = 0.0
+        self._last_check = 0.0
+        self._local = threading.local()
+        self._cursors = []
+        # (connection, cursors) of replicas switched away from, oldest first
+        self._retired = []
+        self._lock = threading.Lock()
+
+    def _target(self) -> Optional[str]:
+        if self.replica_dir is None:
+            return self.path
+        # Until the first replica is published, read the database itself
+        return current_replica(self.replica_dir) or (self.path if os.path.exists(self.path) else None)
+
+    def connect(self) -> bool:
+        """Open the current replica (or the database) if it is not open yet. Returns whether it is open."""
+        with self._lock:
+            if self.con is not None:
+                return True
+            return self._open(self._target())
+
+    def _open(self, source: Optional[str]) -> bool:
+        self._last_attempt = self._last_check = time.time()
+        if source is None:
+            self.last_error = f"No replica published in {self.replica_dir} and no database at {self.path}"
+            return False
+        try:
+            con = duckdb.connect(source, read_only=self.read_only)
+        except Exception as e:
+            self.last_error = str(e)
+            if self.verbose:
+                print(f"Failed to connect to database: {e}")
+            return False
+        try:
+            con.execute("INSTALL inet; LOAD inet;")
+        except Exception:
+            pass
+        # Cursors of the previous replica stay usable until their threads move on
+        if self.con is not None:
+            self._retired.append((self.con, self._cursors))
+        self.con, self.source = con, source
+        self._cursors = []
+        self._close_retired()
+        self.last_error = None
+        if self.verbose:
+            print(f"Connected to database: {source}{' (read-only)' if self.read_only else ''}")
+        return True
+
+    def _close_retired(self, keep: int = 1):
+        """
+        Close retired replicas nothing uses any more, except the `keep` newest,
+        which threads may still hold a cursor of between queries.
+        """
+        cutoff = max(len(self._retired) - keep, 0)
+        remaining = []
+        for con, cursors in self._retired[:cutoff]:
+            if not _close_idle(cursors):
+                remaining.append((con, cursors))
+                continue
+            try:
+                con.close()
+            except Exception:
+                pass
+        self._retired = remaining + self._retired[cutoff:]
+
+    def _release_database(self):
+        """
+        Close the database itself once idle if it was only opened for lack of
+        a replica: while it is open, the ingest process cannot open it for
+        writing (and so cannot publish one). The next query reopens it.
+        """
+        with self._lock:
+            if self.replica_dir is None or self.con is None or self.source != self.path:
+                return
+            if not _close_idle(self._cursors):
+                return
+            try:
+                self.con.close()
+            except Exception:
+                pass
+            self.con, self.source, self._cursors = None, None, []
+            self._last_attempt = 0.0
+
+    def refresh(self) -> bool:
+        """Switch to the current replica if a newer one was published. Returns True on a switch."""
+        if self.replica_dir is None:
+            return False
+        with self._lock:
+            self._last_check = time.time()
+            self._close_retired()
+            source = current_replica(self.replica_dir)
+            if source is None or source == self.source:
+                return False
+            return self._open(source)
+
+    @property
+    def connected(self) -> bool:
+        return self.con is not None
+
+    def cursor(self) -> Optional[ReadCursor]:
+        """This thread's cursor, or None if the database cannot be opened (retried every retry_interval)."""
+        if self.con is None:
+            if time.time() - self._last_attempt < self.retry_interval or not self.connect():
+                return None
+        cursor = getattr(self._local, "cursor", None)
+        if cursor is not None and cursor.depth:
+            # Inside snapshot(): stay on the same replica
+            return cursor
+        if time.time() - self._last_check >= self.retry_interval:
+            self.refresh()
+        if cursor is None or cursor.con is None or cursor.source != self.source:
+            with self._lock:
+                if self.con is None:
+                    return None
+                cursor = ReadCursor(self.con.cursor(), self.query_timeout, self.source)
+                self._cursors.append(cursor)
+            self._local.cursor = cursor
+        return cursor
+
+    @contextmanager
+    def snapshot(self):
+        """
+        Run the enclosed queries of this thread against one consistent state:
+        one replica (or one read transaction on a writable database). Nested
+        uses join the outer one.
+        """
+        cursor = self.cursor()
+        if cursor is None:
+            yield None
+            return
+        if not cursor.depth and not self.read_only:
+            cursor.con.execute("BEGIN TRANSACTION")
+            cursor.in_transaction = True
+        cursor.depth += 1
+        try:
+            yield cursor
+        finally:
+            cursor.depth -= 1
+            if not cursor.depth and cursor.in_transaction:
+                cursor.in_transaction = False
+                try:
+                    cursor.con.execute("ROLLBACK")
+                except Exception:
+                    pass
+            if not cursor.depth:
+                self._release_database()
+
+    def close(self):
+        """Close every thread's cursor and the database, retired replicas included."""
+        with self._lock:
+            for cursor in self._cursors:
+                _close_cursor(cursor)
+            self._cursors = []
+            for con, cursors in self._retired:
+                for cursor in cursors:
+                    _close_cursor(cursor)
+                try:
+                    con.close()
+                except Exception:
+                    pass
+            self._retired = []
+            if self.con is not None:
+                self.con.close()
+                self.con = None
+                self.source = None
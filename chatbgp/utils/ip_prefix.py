@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Helpers for converting IP addresses and prefixes to and from integer form
+"""
+
+import socket
+from typing import List, Tuple
+
+V4_BITS = 32
+V6_BITS = 128
+
+
+def parse_ip(ip: str) -> Tuple[int, int]:
+    """Parse an IP address string into (version, integer value); raises ValueError if it is invalid."""
+    version, family = (6, socket.AF_INET6) if ":" in ip else (4, socket.AF_INET)
+    try:
+        packed = socket.inet_pton(family, ip)
+    except OSError:
+        raise ValueError(f"Invalid IP address {ip!r}") from None
+    return version, int.from_bytes(packed, "big")
+
+
+def parse_prefix(prefix: str) -> Tuple[int, int, int]:
+    """
+    Parse a prefix string into (version, network value, prefix length).
+
+    Host bits are cleared, so "10.1.2.3/8" parses to the 10.0.0.0/8 network.
+    A bare address is treated as a host prefix (/32 or /128).
+    """
+    addr, _, length = prefix.partition("/")
+    version, value = parse_ip(addr.strip())
+    bits = V6_BITS if version == 6 else V4_BITS
+    plen = int(length) if length else bits
+    if plen < 0 or plen > bits:
+        raise ValueError(f"Invalid prefix length in {prefix!r}")
+    value &= ~((1 << (bits - plen)) - 1)
+    return version, value, plen
+
+
+def prefix_range(version: int, value: int, plen: int) -> Tuple[int, int]:
+    """Return the first and last address covered by a prefix."""
+    bits = V6_BITS if version == 6 else V4_BITS
+    return value, value | ((1 << (bits - plen)) - 1)
+
+
+def format_ip(version: int, value: int) -> str:
+    """Format an integer address as a string."""
+    if version == 6:
+        return socket.inet_ntop(socket.AF_INET6, value.to_bytes(16, "big"))
+    return socket.inet_ntop(socket.AF_INET, value.to_bytes(4, "big"))
+
+
+def format_prefix(version: int, value: int, plen: int) -> str:
+    """Format an integer network and length as a prefix string."""
+    return f"{format_ip(version, value)}/{plen}"
+
+
+def inet_text(prefix: str) -> str:
+    """A prefix in DuckDB's INET text form (host prefixes without their length)."""
+    version, value, plen = parse_prefix(prefix)
+    address = format_ip(version, value)
+    return address if plen == (V6_BITS if version == 6 else V4_BITS) else f"{address}/{plen}"
+
+
+def covering_prefixes(prefix: str) -> List[str]:
+    """Every prefix containing a prefix or address (itself included), most specific first."""
+    version, value, plen = parse_prefix(prefix)
+    bits = V6_BITS if version == 6 else V4_BITS
+    return [format_prefix(version, value & ~((1 << (bits - length)) - 1), length)
+            for length in range(plen, -1, -1)]
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+In-process live RIB updates with double-buffered generations
+
+The writer generation is a mutable RibTable that ingestion applies batches of
+updates to. Periodically it is frozen into an immutable RibSnapshot and
+published as the new read generation by a single reference swap. Readers take
+the current generation once per query and use it for every lookup, so they
+see a consistent RIB without taking locks on the lookup path.
+
+SnapshotWatcher covers the other direction: when a separate ingest process
+publishes a new snapshot file, it is mapped and swapped in as the next read
+generation. Snapshots are replaced atomically (os.replace), so in-flight
+queries keep reading the old mapping, and every worker mapping the same file
+shares its pages through the OS page cache.
+"""
+
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .bgp_stream_wrapper import BGPStreamWrapper
+from .rib_snapshot import RibSnapshot
+from .rib_table import RibTable
+from .update_batch import UpdateBatch, to_datetime, to_microseconds
+
+
+@dataclass(frozen=True)
+class RibGeneration:
+    """An immutable, published view of the RIB."""
+    number: int
+    snapshot: RibSnapshot
+    published_at: float
+    info: Dict[str, Any] = field(default_factory=dict)
+
+
+def resume_time(snapshot: RibSnapshot) -> datetime:
+    """Where ingestion into a snapshot should resume: its oldest collector cursor, else its creation time."""
+    cursor = snapshot.meta.get("cursor")
+    if isinstance(cursor, dict) and cursor:
+        return datetime.utcfromtimestamp(min(cursor.values()))
+    return datetime.utcfromtimestamp(snapshot.meta.get("created") or time.time())
+
+
+class RibGenerations:
+    """Holds the current read generation; publishing swaps it atomically."""
+
+    def __init__(self):
+        self._current: Optional[RibGeneration] = None
+        self._publish_lock = threading.Lock()
+
+    def current(self) -> Optional[RibGeneration]:
+        """The latest published generation (a single attribute read, no lock)."""
+        return self._current
+
+    def publish(self, snapshot: RibSnapshot, **info) -> RibGeneration:
+        """Make a snapshot the new read generation."""
+        with self._publish_lock:
+            previous = self._current
+            generation = RibGeneration(
+                number=previous.number + 1 if previous else 1,
+                snapshot=snapshot,
+                published_at=time.time(),
+                info=info,
+            )
+            self._current = generation
+        return generation
+
+
+class LiveRibUpdater:
+    """
+    Background ingestion into a writer RibTable, publishing read generations.
+
+    Updates are fetched in chunk-sized windows up to `lag` behind real time
+    (collectors publish update files with a delay) and a new generation is
+    published at most every `publish_interval` seconds. Freezing a full
+    table takes seconds, so the interval is stretched to keep freezing
+    below `max_publish_share` of the updater's time. A failed fetch, apply
+    or publish is recorded in last_error (and printed when verbose) and
+    retried on the next poll. The cursor follows every applied batch, so a
+    retry re-reads from there and skips the updates at the cursor that were
+    already applied.
+    """
+
+    def __init__(self, rib: RibTable, generations: RibGenerations, start_time: datetime,
+                 collectors: Optional[List[str]] = None, publish_interval: float = 30.0,
+                 chunk: timedelta = timedelta(minutes=1), lag: timedelta = timedelta(minutes=10),
+                 poll_interval: float = 60.0, journal=None, max_publish_share: float = 0.1,
+                 verbose: bool = False):
+        self.rib = rib
+        self.generations = generations
+        self.cursor = start_time
+        # Updates at the cursor timestamp already applied (the stream re-reads them)
+        self.applied_at_cursor = 0
+        self.stream_wrapper = BGPStreamWrapper(collectors=collectors)
+        self.publish_interval = publish_interval
+        self.chunk = chunk
+        self.lag = lag
+        self.poll_interval = poll_interval
+        self.journal = journal
+        self.max_publish_share = max_publish_share
+        self.verbose = verbose
+
+        self.applied = 0
+        self.pending = 0
+        self.last_freeze_seconds: Optional[float] = None
+        self.errors = 0
+        self.last_error: Optional[str] = None
+        self.last_error_at: Optional[float] = None
+        self._last_publish = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def apply_batch(self, updates: Iterable) -> int:
+        """Apply an UpdateBatch (or BGPUpdates) to the writer generation. Returns how many changed it."""
+        paths = self.rib.paths
+        if isinstance(updates, UpdateBatch):
+            changed = self.rib.apply_batch(updates)
+            if self.journal is not None:
+                self.journal.append_batch(updates, paths, changed)
+            applied = int(changed.sum())
+        else:
+            applied = 0
+            for update in updates:
+                if not update.prefix:
+                    continue
+                try:
+                    if not self.rib.apply_update(update):
+                        continue
+                except ValueError:
+                    continue
+                applied += 1
+                if self.journal is not None:
+                    path_id = update.path_id if update.path_id is not None else paths.intern_str(update.as_path)
+                    self.journal.append(update, paths.get(path_id) if update.update_type == 'A' else ())
+        if self.journal is not None:
+            self.journal.flush()
+        self.applied += applied
+        self.pending += applied
+        return applied
+
+    def publish(self) -> RibGeneration:
+        """Freeze the writer generation and publish it for readers."""
+        timestamp = self.cursor.replace(tzinfo=timezone.utc).timestamp()
+        start = time.time()
+        snapshot = self.rib.freeze(meta={
+            "cursor": {collector: timestamp for collector in self.stream_wrapper.collectors},
+            "created": start,
+        })
+        self.last_freeze_seconds = time.time() - start
+        self.pending = 0
+        self._last_publish = time.time()
+        return self.generations.publish(snapshot, cursor=self.cursor.isoformat(), applied=self.applied,
+                                        freeze_seconds=self.last_freeze_seconds)
+
+    @property
+    def effective_publish_interval(self) -> float:
+        """publish_interval, stretched so freezing stays below max_publish_share of the time."""
+        if not self.last_freeze_seconds or not self.max_publish_share:
+            return self.publish_interval
+        return max(self.publish_interval, self.last_freeze_seconds / self.max_publish_share)
+
+    def _publish_due(self) -> bool:
+        return bool(self.pending) and time.time() - self._last_publish >= self.effective_publish_interval
+
+    def step(self) -> bool:
+        """Fetch and apply one chunk. Returns False when caught up with real time."""
+        end = min(self.cursor + self.chunk, datetime.utcnow() - self.lag)
+        if end <= self.cursor:
+            return False
+        cursor = to_microseconds(self.cursor)
+        seen = 0  # updates at the cursor timestamp read so far
+        for batch in self.stream_wrapper.iter_update_batches(self.cursor, end):
+            timestamps = batch.columns["timestamp"]
+            at_cursor = np.flatnonzero(timestamps == cursor)
+            done = at_cursor[:max(self.applied_at_cursor - seen, 0)]
+            seen += len(at_cursor)
+            if len(done):
+                keep = np.ones(len(batch), dtype=bool)
+                keep[done] = False
+                batch = batch.take(keep)
+            if len(batch):
+                self.apply_batch(batch)
+            # A failure further on resumes after this batch
+            last = int(timestamps[-1])
+            if last > cursor:
+                cursor, seen = last, int((timestamps == last).sum())
+                self.cursor, self.applied_at_cursor = to_datetime(last), seen
+            else:
+                self.applied_at_cursor = max(self.applied_at_cursor, seen)
+        if cursor < to_microseconds(end):
+            self.cursor, self.applied_at_cursor = end, 0
+        if self._publish_due():
+            self.publish()
+        return True
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                caught_up = not self.step()
+                if caught_up and self._publish_due():
+                    self.publish()
+                self.last_error = None
+            except Exception as e:
+                # Keep serving the current generation; retry on the next poll
+                caught_up = True
+                self.errors += 1
+                self.last_error = f"{type(e).__name__}: {e}"
+                self.last_error_at = time.time()
+                if self.verbose:
+                    print(f"Live RIB update failed at {self.cursor.isoformat()}: {self.last_error}")
+            if caught_up:
+                self._stop.wait(self.poll_interval)
+
+    def start(self):
+        """Start ingesting in a daemon thread."""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._last_publish = time.time()
+            self._thread = threading.Thread(target=self._run, name="live-rib-updater", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        """Stop ingesting; pending changes are published first."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                return
+        if self.pending:
+            self.publish()
+
+
+class SnapshotWatcher:
+    """Polls a snapshot file and publishes each new version as a RIB generation."""
+
+    def __init__(self, path: str, generations: RibGenerations, interval: float = 5.0):
+        self.path = path
+        self.generations = generations
+        self.interval = interval
+
+        self.reloads = 0
+        self.last_reload_seconds: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self._file_id: Optional[Tuple[int, int, int]] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def check(self) -> bool:
+        """Map and publish the snapshot if the file changed since the last load. Returns True on reload."""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        file_id = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if file_id == self._file_id:
+            return False
+
+        start = time.time()
+        snapshot = RibSnapshot.open(self.path)
+        self.last_reload_seconds = time.time() - start
+        self.generations.publish(
+            snapshot,
+            source=self.path,
+            reload_seconds=self.last_reload_seconds,
+            publish_lag_seconds=time.time() - stat.st_mtime,
+        )
+        self._file_id = file_id
+        self.reloads += 1
+        self.last_error = None
+        return True
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                # Keep serving the current generation; retry on the next poll
+                self.last_error = str(e)
+
+    def start(self):
+        """Start polling in a daemon thread."""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="rib-snapshot-watcher", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+
+def generation_status(generation: Optional[RibGeneration]) -> Dict[str, Any]:
+    """Freshness information about a published generation, for status endpoints and logs."""
+    if generation is None:
+        return {"status": "no_data"}
+    snapshot = generation.snapshot
+    status = {
+        "status": "success",
+        "generation": generation.number,
+        "published_at": datetime.utcfromtimestamp(generation.published_at).isoformat(),
+        "age_seconds": time.time() - generation.published_at,
+        "prefixes": len(snapshot),
+        "routes": snapshot.meta.get("routes"),
+        # Snapshots are versioned by their creation time
+        "snapshot_version": snapshot.meta.get("created"),
+    }
+    status.update(generation.info)
+    return status
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Local MRT archive for offline BGPStream replay
+
+A directory of MRT files named like the collectors publish them
+(updates.YYYYMMDD.HHMM[.gz|.bz2], bview./rib.YYYYMMDD.HHMM[...]), one
+subdirectory per collector (files at the top level belong to
+default_collector). The index maps every file to its collector, record type
+and time range (an updates file covers the time until the collector's next
+one) and is written as index.csv in the format of BGPStream's csvfile data
+interface, so a stream over the archive reads no network and opens only the
+files that overlap its interval and collectors.
+"""
+
+import csv
+import os
+import re
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import List, Optional, Sequence
+
+INDEX_FILE = "index.csv"
+PROJECT = "local"
+# Duration assumed for an updates file when its collector has no second one to measure the interval
+UPDATES_DURATION = 300
+
+_FILE_NAME = re.compile(r"^(updates|bview|rib)\.(\d{8})\.(\d{4})(?:\.(?:gz|bz2))?$")
+
+
+@dataclass
+class ArchiveFile:
+    """One MRT file of the archive and the time range it covers (unix seconds)."""
+    path: str
+    collector: str
+    record_type: str  # 'updates' or 'ribs'
+    start: int
+    duration: int
+    mtime: int = 0
+
+    @property
+    def end(self) -> int:
+        return self.start + self.duration
+
+
+def _unix(time: datetime) -> int:
+    return int(time.replace(tzinfo=timezone.utc).timestamp())
+
+
+class LocalMRTArchive:
+    """Index of a local MRT archive and BGPStream configuration to replay it."""
+
+    def __init__(self, root: str, default_collector: Optional[str] = None):
+        self.root = root
+        self.default_collector = default_collector
+        self.index_path = os.path.join(root, INDEX_FILE)
+        self.entries: List[ArchiveFile] = []
+        self.refresh()
+
+    def _scan(self) -> List[ArchiveFile]:
+        entries = []
+        for directory, _, names in os.walk(self.root):
+            relative = os.path.relpath(directory, self.root)
+            collector = relative.split(os.sep)[0] if relative != os.curdir else self.default_collector
+            if not collector:
+                continue
+            for name in names:
+                match = _FILE_NAME.match(name)
+                if match is None:
+                    continue
+                kind, day, minute = match.groups()
+                path = os.path.abspath(os.path.join(directory, name))
+                start = _unix(datetime.strptime(day + minute, "%Y%m%d%H%M"))
+                entries.append(ArchiveFile(path, collector, "updates" if kind == "updates" else "ribs",
+                                           start, 0, int(os.path.getmtime(path))))
+        entries.sort(key=lambda e: (e.collector, e.record_type, e.start))
+
+        # An updates file runs until the collector's next one; the last runs for the collector's usual interval
+        updates = {}
+        for entry in entries:
+            if entry.record_type == "updates":
+                updates.setdefault(entry.collector, []).append(entry)
+        for files in updates.values():
+            gaps = [b.start - a.start for a, b in zip(files, files[1:]) if b.start > a.start]
+            interval = min(gaps) if gaps else UPDATES_DURATION
+            for a, b in zip(files, files[1:]):
+                a.duration = min(b.start - a.start, interval) if b.start > a.start else interval
+            files[-1].duration = interval
+        return entries
+
+    def refresh(self) -> List[ArchiveFile]:
+        """Rescan the directory and rewrite the index if files were added, removed or changed."""
+        entries = self._scan() if os.path.isdir(self.root) else []
+        if entries != self.entries or not os.path.exists(self.index_path):
+            self.entries = entries
+            if os.path.isdir(self.root):
+                self._write_index()
+        return self.entries
+
+    def _write_index(self):
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w", newline="") as f:
+            writer = csv.writer(f)
+            for e in self.entries:
+                writer.writerow([e.path, PROJECT, e.collector, e.record_type, e.start, e.duration, e.mtime])
+        os.replace(tmp_path, self.index_path)
+
+    @property
+    def collectors(self) -> List[str]:
+        return sorted({e.collector for e in self.entries})
+
+    def files(self, start: datetime, end: datetime, collectors: Optional[Sequence[str]] = None,
+              record_type: str = "updates") -> List[ArchiveFile]:
+        """The files of a record type ('updates' or 'ribs') overlapping [start, end], in time order."""
+        start, end = _unix(start), _unix(end)
+        return sorted((e for e in self.entries
+                       if e.record_type == record_type and e.start <= end and e.end >= start
+                       and (not collectors or e.collector in collectors)),
+                      key=lambda e: (e.start, e.collector))
+
+    def configure(self, stream):
+        """Point a BGPStream created with data_interface='csvfile' at the index."""
+        stream.set_data_interface_option("csvfile", "csv-file", self.index_path)
+        return stream
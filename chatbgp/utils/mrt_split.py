@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Split MRT RIB dumps into record ranges for parallel parsing
+
+An MRT file is a sequence of records, each with a 12-byte header (timestamp,
+type, subtype, body length), so it can be cut at record boundaries without
+decoding BGP. A TABLE_DUMP_V2 dump starts with a PEER_INDEX_TABLE record that
+every RIB record refers to; it is copied to the front of every chunk so each
+chunk is a valid dump on its own. Chunks are written as uncompressed files,
+parsed by a process pool and returned in file order, so merging the results
+in order gives the same outcome as a single sequential pass. Dumps of several
+collectors share one pool: each dump's chunks are queued as soon as it has
+been split, so splitting the next dump overlaps with parsing.
+"""
+
+import bz2
+import gzip
+import os
+import struct
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+MRT_HEADER = struct.Struct(">IHHI")  # timestamp, type, subtype, length
+MRT_TABLE_DUMP_V2 = 13
+PEER_INDEX_TABLE = 1
+
+DEFAULT_CHUNK_BYTES = 64 << 20
+
+
+def open_mrt(path: str):
+    """Open an MRT file, transparently decompressing gzip and bzip2."""
+    with open(path, "rb") as f:
+        magic = f.read(3)
+    if magic[:2] == b"\x1f\x8b":
+        return gzip.open(path, "rb")
+    if magic == b"BZh":
+        return bz2.open(path, "rb")
+    return open(path, "rb")
+
+
+def iter_mrt_records(f) -> Iterator[bytes]:
+    """Yield raw MRT records (header and body) from a binary stream."""
+    while True:
+        header = f.read(MRT_HEADER.size)
+        if len(header) < MRT_HEADER.size:
+            return
+        length = MRT_HEADER.unpack(header)[3]
+        body = f.read(length)
+        if len(body) < length:
+            return
+        yield header + body
+
+
+def split_mrt(path: str, out_dir: str, chunk_bytes: int = DEFAULT_CHUNK_BYTES) -> List[str]:
+    """Cut an MRT dump into chunk files of about chunk_bytes each. Returns their paths in order."""
+    chunks = []
+    peer_index = b""
+    out = None
+    written = 0
+
+    with open_mrt(path) as f:
+        for record in iter_mrt_records(f):
+            _, mrt_type, subtype, _ = MRT_HEADER.unpack_from(record)
+            if mrt_type == MRT_TABLE_DUMP_V2 and subtype == PEER_INDEX_TABLE:
+                peer_index = record
+                continue
+            if out is None or written >= chunk_bytes:
+                if out is not None:
+                    out.close()
+                chunk_path = os.path.join(out_dir, f"chunk.{len(chunks):05d}.mrt")
+                chunks.append(chunk_path)
+                out = open(chunk_path, "wb")
+                out.write(peer_index)
+                written = 0
+            out.write(record)
+            written += len(record)
+    if out is not None:
+        out.close()
+    return chunks
+
+
+def map_mrt_chunks(path: str, func: Callable, workers: Optional[int] = None,
+                   chunk_bytes: int = DEFAULT_CHUNK_BYTES, max_pending: Optional[int] = None) -> Iterator:
+    """
+    Split an MRT dump and yield func(chunk_path) for every chunk, in chunk
+    order, computed by a pool of worker processes. func must be a module-level
+    function so it can be sent to the workers. At most max_pending (default
+    twice the workers) chunks are submitted and not yet consumed, so results
+    do not pile up when the caller is slower than the pool.
+    """
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or 2 * workers
+    with tempfile.TemporaryDirectory(prefix="mrt-chunks-") as tmp_dir:
+        chunks = split_mrt(path, tmp_dir, chunk_bytes)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = deque()
+            for chunk in chunks:
+                if len(pending) >= max_pending:
+                    yield pending.popleft().result()
+                pending.append(pool.submit(func, chunk))
+            while pending:
+                yield pending.popleft().result()
+
+
+def map_mrt_dumps(dumps: Dict[str, str], func: Callable, workers: Optional[int] = None,
+                  chunk_bytes: int = DEFAULT_CHUNK_BYTES) -> Iterator[Tuple[str, Any]]:
+    """
+    Split several MRT dumps (key -> path, e.g. collector -> bview file) and
+    yield (key, func(key, chunk_path)) for every chunk, in dump order and then
+    chunk order, computed by one pool of worker processes.
+    """
+    with tempfile.TemporaryDirectory(prefix="mrt-chunks-") as tmp_dir:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = []
+            for i, (key, path) in enumerate(dumps.items()):
+                dump_dir = os.path.join(tmp_dir, f"dump.{i:03d}")
+                os.makedirs(dump_dir)
+                futures.extend((key, chunk, pool.submit(func, key, chunk))
+                               for chunk in split_mrt(path, dump_dir, chunk_bytes))
+            for key, chunk, future in futures:
+                result = future.result()
+                # Uncompressed chunks of a dozen dumps add up; drop each once parsed
+                os.remove(chunk)
+                yield key, result
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Parallel BGPStream fetching across collectors and time slices
+
+Decoding MRT update files is CPU bound, so one stream reads a day of several
+collectors far slower than the disk or network delivers it. The job is cut
+into (time slice, collector) pieces, each decoded by a BGPStream in a worker
+process and sent back as a columnar UpdateBatch, and merged back into one
+timestamp-ordered stream: the collectors' pieces of a slice are merged by a
+stable sort on their timestamps, and slices follow each other since their
+time ranges do not overlap. At most max_pending pieces are in flight or
+waiting to be merged, which bounds memory however long the range is.
+
+Workers intern paths into their own tables, so path ids are reassigned from
+the caller's path table as updates are merged.
+"""
+
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .as_path_table import ASPathTable, get_path_table
+from .bgp_stream_wrapper import BGPStreamWrapper, BGPUpdate
+from .mrt_archive import LocalMRTArchive
+from .update_batch import ANNOUNCE, NO_ID, UpdateBatch, to_microseconds
+
+SLICE_LENGTH = timedelta(minutes=10)
+
+
+def time_slices(start: datetime, end: datetime, length: timedelta = SLICE_LENGTH) -> List[Tuple[datetime, datetime]]:
+    """Cut [start, end] into consecutive slices of at most `length`."""
+    slices = []
+    while start < end:
+        slices.append((start, min(start + length, end)))
+        start += length
+    return slices
+
+
+def _fetch_slice(collector: str, start: datetime, end: datetime, last: bool, filters: dict,
+                 archive: Optional[LocalMRTArchive] = None) -> UpdateBatch:
+    """
+    Worker: the updates of one collector in one time slice, as one batch in
+    time order. A slice keeps updates in [start, end) (the last one
+    [start, end]), so an update on a boundary is returned by exactly one slice.
+    """
+    wrapper = BGPStreamWrapper(collectors=[collector], paths=ASPathTable(), archive=archive)
+    batch = UpdateBatch.concat(list(wrapper.iter_update_batches(start, end, **filters)))
+    timestamps = batch.columns["timestamp"]
+    start, end = to_microseconds(start), to_microseconds(end)
+    keep = (timestamps >= start) & ((timestamps <= end) if last else (timestamps < end))
+    batch = batch.take(keep)
+    return batch.take(np.argsort(batch.columns["timestamp"], kind="stable"))
+
+
+def _merge(pieces: List[UpdateBatch], paths: ASPathTable) -> UpdateBatch:
+    """
+    Merge time-ordered pieces into one batch in timestamp order (ties keep
+    piece order) and give announcements path ids from `paths`, interning
+    each distinct path string once.
+    """
+    batch = UpdateBatch.concat(pieces)
+    batch = batch.take(np.argsort(batch.columns["timestamp"], kind="stable"))
+    path_ids = [paths.intern_str(as_path) for as_path in batch.values["as_path"]]
+    lookup = np.array([NO_ID if path_id is None else path_id for path_id in path_ids] + [NO_ID], dtype=np.int64)
+    announced = batch.columns["update_type"] == ANNOUNCE
+    batch.columns["path_id"] = np.where(announced, lookup[batch.columns["as_path"]], NO_ID)
+    return batch
+
+
+def iter_batches_parallel(collectors: Sequence[str], start: datetime, end: datetime,
+                          workers: Optional[int] = None, slice_length: timedelta = SLICE_LENGTH,
+                          max_pending: Optional[int] = None, paths: Optional[ASPathTable] = None,
+                          archive: Optional[LocalMRTArchive] = None, **filters) -> Iterator[UpdateBatch]:
+    """
+    Yield the updates of several collectors between start and end as one
+    UpdateBatch per time slice, in timestamp order, decoded by a pool of
+    worker processes and filtered like BGPStreamWrapper.iter_updates().
+    Announcement paths are interned into `paths` (the shared path table by
+    default). With a local MRT archive, only slices that overlap its files
+    are decoded.
+    """
+    paths = paths if paths is not None else get_path_table()
+    slices = time_slices(start, end, slice_length)
+    groups = []
+    for i, (s, e) in enumerate(slices):
+        group = [(collector, s, e, i == len(slices) - 1) for collector in collectors
+                 if archive is None or archive.files(s, e, [collector])]
+        if group:
+            groups.append(group)
+    if not groups:
+        return
+    jobs = [job for group in groups for job in group]
+
+    workers = workers or os.cpu_count() or 1
+    max_pending = max(max_pending or 2 * workers, len(collectors))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        submitted = 0
+        for group in groups:
+            while submitted < len(jobs) and len(pending) < max_pending:
+                pending.append(pool.submit(_fetch_slice, *jobs[submitted], filters, archive))
+                submitted += 1
+            batch = _merge([pending.popleft().result() for _ in group], paths)
+            if len(batch):
+                yield batch
+
+
+def iter_updates_parallel(collectors: Sequence[str], start: datetime, end: datetime, **options) -> Iterator[BGPUpdate]:
+    """The updates of iter_batches_parallel() as BGPUpdates."""
+    for batch in iter_batches_parallel(collectors, start, end, **options):
+        yield from batch.updates()
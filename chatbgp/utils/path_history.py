@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+AS path queries over stored BGP updates
+
+Each update row carries its AS path as a typed BIGINT list (as_path_asns)
+with its length and first hop, so transit, path length and prepending
+questions are answered by DuckDB's vectorized list functions and window
+operators over the live table and the archive, instead of splitting path
+strings in Python.
+"""
+
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence
+
+from .update_archive import ARCHIVE_DIR, updates_relation
+
+
+def _rows(con, sql: str, params: list) -> List[Dict[str, Any]]:
+    cursor = con.execute(sql, params)
+    columns = [d[0] for d in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def transit_updates(con, asn: int, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                    prefixes: Optional[Sequence[str]] = None, collectors: Optional[Sequence[str]] = None,
+                    archive_dir: str = ARCHIVE_DIR, limit: int = 100) -> List[Dict[str, Any]]:
+    """Announcements, newest first, whose AS path carries an AS in transit (anywhere but as the origin)."""
+    updates_sql, params = updates_relation(start, end, prefixes, collectors, archive_dir)
+    return _rows(con, f"""
+        SELECT timestamp, collector, peer_asn, prefix, as_path, origin_as, path_length
+        FROM {updates_sql}
+        WHERE update_type = 'A' AND list_contains(as_path_asns, ?) AND as_path_asns[-1] != ?
+        ORDER BY timestamp DESC, tier DESC, seq DESC
+        LIMIT ?
+    """, params + [asn, asn, limit])
+
+
+def path_length_changes(con, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                        prefixes: Optional[Sequence[str]] = None, collectors: Optional[Sequence[str]] = None,
+                        archive_dir: str = ARCHIVE_DIR, limit: int = 100) -> List[Dict[str, Any]]:
+    """
+    Announcements whose path length differs from the previous announcement
+    of the same prefix by the same peer, largest changes first.
+    """
+    updates_sql, params = updates_relation(start, end, prefixes, collectors, archive_dir)
+    return _rows(con, f"""
+        WITH announced AS (
+            SELECT timestamp, collector, peer_address, peer_asn, prefix, as_path,
+                   CAST(path_length AS INTEGER) AS path_length,
+                   lag(as_path) OVER w AS previous_path,
+                   lag(CAST(path_length AS INTEGER)) OVER w AS previous_length
+            FROM {updates_sql}
+            WHERE update_type = 'A'
+            WINDOW w AS (PARTITION BY collector, prefix, peer_address, peer_asn ORDER BY timestamp, tier, seq)
+        )
+        SELECT timestamp, collector, peer_asn, prefix, previous_path, as_path, previous_length, path_length,
+               path_length - previous_length AS change
+        FROM announced
+        WHERE previous_length IS NOT NULL AND path_length != previous_length
+        ORDER BY abs(path_length - previous_length) DESC, timestamp DESC
+        LIMIT ?
+    """, params + [limit])
+
+
+def prepended_paths(con, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                    prefixes: Optional[Sequence[str]] = None, collectors: Optional[Sequence[str]] = None,
+                    archive_dir: str = ARCHIVE_DIR, limit: int = 100) -> List[Dict[str, Any]]:
+    """
+    Prefixes announced with AS path prepending, per origin and prepending
+    depth (repeated ASNs in the path), most prepended first.
+    """
+    updates_sql, params = updates_relation(start, end, prefixes, collectors, archive_dir)
+    return _rows(con, f"""
+        WITH announced AS (
+            SELECT prefix, origin_as, timestamp, as_path,
+                   CAST(path_length AS INTEGER) - len(list_distinct(as_path_asns)) AS prepends,
+                   as_path_asns[-1] = as_path_asns[-2] AS origin_prepended
+            FROM {updates_sql}
+            WHERE update_type = 'A' AND path_length > len(list_distinct(as_path_asns))
+        )
+        SELECT prefix, origin_as, prepends, bool_or(origin_prepended) AS origin_prepended,
+               count(*) AS updates, max(timestamp) AS last_seen, arg_max(as_path, timestamp) AS last_path
+        FROM announced
+        GROUP BY prefix, origin_as, prepends
+        ORDER BY prepends DESC, updates DESC
+        LIMIT ?
+    """, params + [limit])
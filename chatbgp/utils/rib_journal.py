@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+Write-ahead journal of applied RIB updates
+
+Every announce/withdraw applied to the live RibTable is appended to the
+current journal segment as one framed binary record, so steady-state
+persistence is a single sequential append per update. An ingest cursor (last
+processed timestamp per collector) is stored next to the segments.
+
+Compaction rotates to a new segment, freezes the RibTable and, in a background
+thread, writes the frozen state as the new base snapshot and deletes the
+segments it folded in. The snapshot records the first segment it does not
+cover, so a restart loads the snapshot and replays only the journal tail.
+
+Record framing: <uint32 body length><uint32 crc32(body)><body>. A torn or
+corrupt record at the end of the last segment is truncated on open.
+"""
+
+import calendar
+import glob
+import json
+import os
+import struct
+import threading
+import zlib
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from .rib_snapshot import NO_VALUE, RibSnapshot
+from .rib_table import RibTable
+from .update_batch import ANNOUNCE, UPDATE_TYPES, WITHDRAW
+
+JOURNAL_DIR = "data/bgp_data/journal"
+CURSOR_FILE = "cursor.json"
+SEGMENT_PATTERN = "journal.{:08d}.log"
+
+_FRAME = struct.Struct("<II")
+_RECORD = struct.Struct("<cdIIIH")  # type, timestamp, peer_asn, med, local_pref, n_asns
+_STR_LEN = struct.Struct("<H")
+
+
+def _timestamp(value) -> float:
+    """Epoch seconds for a naive-UTC datetime or a number."""
+    if hasattr(value, "utctimetuple"):
+        return calendar.timegm(value.utctimetuple()) + value.microsecond / 1e6
+    return float(value or 0)
+
+
+def _uint(value) -> int:
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return NO_VALUE
+    return value if 0 <= value < NO_VALUE else NO_VALUE
+
+
+def _pack_str(value: Optional[str]) -> bytes:
+    raw = (value or "").encode()[:0xFFFF]
+    return _STR_LEN.pack(len(raw)) + raw
+
+
+def _unpack_str(body: bytes, offset: int) -> Tuple[Optional[str], int]:
+    (length,) = _STR_LEN.unpack_from(body, offset)
+    offset += _STR_LEN.size
+    value = body[offset:offset + length].decode()
+    return value or None, offset + length
+
+
+def encode_record(update_type: str, timestamp: float, prefix: str, peer_asn, peer_address: Optional[str],
+                  collector: Optional[str] = None, as_path=(), next_hop: Optional[str] = None,
+                  med=None, local_pref=None, communities: Optional[str] = None) -> bytes:
+    """Encode one announce ('A') or withdraw ('W') as a framed journal record."""
+    as_path = list(as_path or ())
+    body = b"".join((
+        _RECORD.pack(update_type.encode(), timestamp, _uint(peer_asn), _uint(med), _uint(local_pref), len(as_path)),
+        _pack_str(prefix),
+        _pack_str(peer_address),
+        _pack_str(collector),
+        _pack_str(next_hop),
+        _pack_str(communities),
+        struct.pack(f"<{len(as_path)}I", *as_path),
+    ))
+    return _FRAME.pack(len(body), zlib.crc32(body)) + body
+
+
+def decode_record(body: bytes) -> Dict:
+    """Decode the body of a journal record."""
+    update_type, timestamp, peer_asn, med, local_pref, n_asns = _RECORD.unpack_from(body, 0)
+    offset = _RECORD.size
+    prefix, offset = _unpack_str(body, offset)
+    peer_address, offset = _unpack_str(body, offset)
+    collector, offset = _unpack_str(body, offset)
+    next_hop, offset = _unpack_str(body, offset)
+    communities, offset = _unpack_str(body, offset)
+    as_path = list(struct.unpack_from(f"<{n_asns}I", body, offset))
+    return {
+        "type": update_type.decode(),
+        "timestamp": timestamp,
+        "prefix": prefix,
+        "peer_asn": peer_asn,
+        "peer_address": peer_address,
+        "collector": collector,
+        "as_path": as_path,
+        "next_hop": next_hop,
+        "med": med,
+        "local_pref": local_pref,
+        "communities": communities,
+    }
+
+
+def read_segment(path: str) -> Iterator[Tuple[Dict, int]]:
+    """Yield (record, end offset) for every intact record of a segment, stopping at a torn tail."""
+    with open(path, "rb") as f:
+        data = f.read()
+    offset = 0
+    while offset + _FRAME.size <= len(data):
+        length, crc = _FRAME.unpack_from(data, offset)
+        start = offset + _FRAME.size
+        body = data[start:start + length]
+        if len(body) < length or zlib.crc32(body) != crc:
+            break
+        offset = start + length
+        yield decode_record(body), offset
+
+
+class RibJournal:
+    """Segmented append-only journal plus the per-collector ingest cursor."""
+
+    def __init__(self, directory: str = JOURNAL_DIR, fsync: bool = True):
+        self.directory = directory
+        self.fsync = fsync
+        os.makedirs(directory, exist_ok=True)
+
+        self.cursor: Dict[str, float] = self._load_cursor()
+        segments = self.segments()
+        self.segment = segments[-1] if segments else 0
+        self._file = None
+        self._open_segment(self.segment)
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.directory, SEGMENT_PATTERN.format(segment))
+
+    def _open_segment(self, segment: int):
+        path = self._segment_path(segment)
+        if os.path.exists(path):
+            # Drop a torn record left by a crash before appending behind it
+            valid_end = 0
+            for _, valid_end in read_segment(path):
+                pass
+            if valid_end != os.path.getsize(path):
+                with open(path, "r+b") as f:
+                    f.truncate(valid_end)
+        self._file = open(path, "ab")
+
+    def _load_cursor(self) -> Dict[str, float]:
+        path = os.path.join(self.directory, CURSOR_FILE)
+        if not os.path.exists(path):
+            return {}
+        with open(path) as f:
+            return json.load(f)
+
+    def segments(self) -> List[int]:
+        """Sequence numbers of the segments on disk, oldest first."""
+        pattern = os.path.join(self.directory, "journal.*.log")
+        return sorted(int(os.path.basename(path).split(".")[1]) for path in glob.glob(pattern))
+
+    def append(self, update, as_path=()):
+        """Append one BGPUpdate; as_path is the parsed ASN list for announcements."""
+        timestamp = _timestamp(update.timestamp)
+        self._file.write(encode_record(
+            update.update_type, timestamp, update.prefix, update.peer_asn, update.peer_address,
+            collector=update.collector, as_path=as_path, next_hop=update.next_hop,
+            med=update.med, local_pref=update.local_pref, communities=update.communities
+        ))
+        self.advance_cursor(update.collector, timestamp)
+
+    def append_batch(self, batch, paths, mask=None):
+        """
+        Append the announcements and withdrawals of an UpdateBatch (those
+        selected by mask); announcement paths are resolved through `paths`.
+        """
+        if mask is not None:
+            batch = batch.take(mask)
+        values = batch.values
+        peer_addresses = values["peer_address"] + [None]
+        collectors = values["collector"] + [None]
+        next_hops = values["next_hop"] + [None]
+        communities = values["communities"] + [None]
+        records = []
+        cursor = {}
+        rows = zip(*(batch.columns[name].tolist() for name in (
+            "update_type", "timestamp", "prefix", "peer_address", "collector", "path_id", "as_path",
+            "next_hop", "communities")), *(batch.decoded(name) for name in ("peer_asn", "med", "local_pref")))
+        for kind, timestamp, prefix, address, collector, path_id, as_path, next_hop, community, peer_asn, med, \
+                local_pref in rows:
+            if kind not in (ANNOUNCE, WITHDRAW) or prefix < 0:
+                continue
+            asns = ()
+            if kind == ANNOUNCE:
+                if path_id < 0 and as_path >= 0:
+                    path_id = paths.intern_str(values["as_path"][as_path])
+                asns = paths.get(path_id) if path_id is not None and path_id >= 0 else ()
+            timestamp /= 1e6
+            records.append(encode_record(
+                UPDATE_TYPES[kind], timestamp, values["prefix"][prefix], peer_asn, peer_addresses[address],
+                collector=collectors[collector], as_path=asns, next_hop=next_hops[next_hop], med=med,
+                local_pref=local_pref, communities=communities[community]
+            ))
+            cursor[collector] = max(cursor.get(collector, timestamp), timestamp)
+        self._file.write(b"".join(records))
+        for collector, timestamp in cursor.items():
+            self.advance_cursor(collectors[collector], timestamp)
+
+    def advance_cursor(self, collector: Optional[str], timestamp):
+        """Record that a collector has been processed up to a timestamp."""
+        if collector:
+            timestamp = _timestamp(timestamp)
+            if timestamp > self.cursor.get(collector, 0):
+                self.cursor[collector] = timestamp
+
+    def flush(self):
+        """Flush appended records, then persist the cursor that covers them."""
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+        path = os.path.join(self.directory, CURSOR_FILE)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.cursor, f)
+        os.replace(tmp_path, path)
+
+    def rotate(self) -> int:
+        """Seal the current segment and start a new one. Returns the new segment number."""
+        self.flush()
+        self._file.close()
+        self.segment += 1
+        self._open_segment(self.segment)
+        return self.segment
+
+    def remove_segments(self, before: int):
+        """Delete segments that have been folded into a snapshot."""
+        for segment in self.segments():
+            if segment < before:
+                os.remove(self._segment_path(segment))
+
+    def records(self, from_segment: int = 0) -> Iterator[Dict]:
+        """Iterate over journal records starting at a segment."""
+        self._file.flush()
+        for segment in self.segments():
+            if segment >= from_segment:
+                for record, _ in read_segment(self._segment_path(segment)):
+                    yield record
+
+    def replay(self, rib: RibTable, from_segment: int = 0) -> int:
+        """Apply journal records from a segment onwards to a RibTable. Returns the record count."""
+        count = 0
+        for record in self.records(from_segment):
+            if record["type"] == "A":
+                rib.announce(record["prefix"], record["peer_asn"], record["peer_address"], record["as_path"],
+                             next_hop=record["next_hop"], med=record["med"], local_pref=record["local_pref"],
+                             communities=record["communities"], collector=record["collector"])
+            elif record["type"] == "W":
+                rib.withdraw(record["prefix"], record["peer_asn"], record["peer_address"], record["collector"])
+            count += 1
+        return count
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+
+class JournalCompactor:
+    """Folds sealed journal segments into a new base snapshot in the background."""
+
+    def __init__(self, rib: RibTable, journal: RibJournal, snapshot_path: str):
+        self.rib = rib
+        self.journal = journal
+        self.snapshot_path = snapshot_path
+        self._thread: Optional[threading.Thread] = None
+        self.compactions = 0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def compact(self, background: bool = True) -> bool:
+        """
+        Rotate the journal and snapshot the RibTable as of the rotation.
+        Must be called from the thread that applies updates. Returns False if
+        a previous compaction is still being written.
+        """
+        if self.running:
+            return False
+
+        segment = self.journal.rotate()
+        snapshot = self.rib.freeze(meta={
+            "journal_segment": segment,
+            "cursor": dict(self.journal.cursor),
+        })
+
+        def write():
+            snapshot.save(self.snapshot_path)
+            self.journal.remove_segments(before=segment)
+            self.compactions += 1
+
+        if background:
+            self._thread = threading.Thread(target=write, name="rib-compaction", daemon=True)
+            self._thread.start()
+        else:
+            write()
+        return True
+
+    def wait(self):
+        if self._thread is not None:
+            self._thread.join()
+
+
+def recover_rib(snapshot_path: str, journal: RibJournal) -> Tuple[Optional[RibTable], int]:
+    """
+    Load the base snapshot and replay the journal tail it does not cover.
+    Returns (rib, replayed record count); rib is None when there is no snapshot.
+    """
+    if not os.path.exists(snapshot_path):
+        return None, 0
+    snapshot = RibSnapshot.open(snapshot_path)
+    rib = RibTable.from_snapshot(snapshot)
+    replayed = journal.replay(rib, from_segment=int(snapshot.meta.get("journal_segment", 0)))
+    return rib, replayed
@@ -0,0 +1,911 @@
+#!/usr/bin/env python3
+"""
+Memory-mapped RIB snapshot format
+
+A snapshot is one flat file holding sorted prefix arrays, per-prefix route
+offset tables and an interned AS path blob. It is opened with mmap and queried
+in place, so opening it costs milliseconds regardless of table size and every
+process that opens the same file shares the same page cache.
+
+File layout:
+    8 bytes   magic (b"CBGPRIB1")
+    4 bytes   header length (little-endian uint32)
+    N bytes   JSON header: metadata and {section: [offset, dtype, length]}
+    ...       sections, each aligned to 64 bytes, offsets relative to the
+              first section
+
+Prefixes are numbered with global ids: IPv4 prefixes first (sorted by network
+then length), followed by IPv6 prefixes in the same order. IPv4 keys are
+uint64 values (network << 8 | length); IPv6 keys are 17 byte big-endian
+strings (network + length), so both families sort and binary search with
+plain numpy. Every prefix also stores the id of its nearest covering prefix,
+which turns longest-prefix match into one binary search plus a short walk up
+the covering chain. All more specifics of a prefix directly follow it in sort
+order; "subtree_end" holds the global id just past them, so covered prefixes
+are a slice and direct children can be enumerated by skipping over subtrees.
+
+For bulk lookups each family's address space is also cut into elementary
+intervals, each mapped to its most specific covering prefix ("v4_bounds" /
+"v4_match", "v6_bounds" / "v6_match"), together with the origin and path of
+every prefix's shortest-path route ("prefix_origin" / "prefix_path"). A batch
+of addresses then resolves with a single vectorized binary search. IPv4
+batches first go through a direct table over /24 blocks (64 MB, built on first
+use), which resolves every block inside a single interval without searching.
+
+Snapshots of several collectors store every distinct (prefix, peer) route
+once, with a "route_collectors" bitmask over the "collector" string table.
+Lookups use the merged view by default; passing a collector restricts them
+to the routes that collector carries.
+"""
+
+import json
+import mmap
+import os
+import struct
+import time
+from itertools import islice
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+from .as_path_table import ASPathTable
+from .ip_prefix import parse_ip, parse_prefix, format_prefix
+
+SNAPSHOT_MAGIC = b"CBGPRIB1"
+SNAPSHOT_VERSION = 1
+SNAPSHOT_FILE = "data/bgp_data/rib_snapshot.bin"
+SECTION_ALIGN = 64
+NO_PARENT = -1
+NO_VALUE = 0xFFFFFFFF  # absent attribute in uint32 route columns
+V4_BLOCK_BITS = 24  # IPv4 batch lookups index a direct table by the top 24 address bits
+SPLIT_BLOCK = -2
+V4_BLOCK_CHUNK = 1 << 20  # blocks per step when building the table
+
+_U64_MASK = (1 << 64) - 1
+
+
+def _align(offset: int) -> int:
+    return (offset + SECTION_ALIGN - 1) // SECTION_ALIGN * SECTION_ALIGN
+
+
+def _v4_keys(values: np.ndarray, lens: np.ndarray) -> np.ndarray:
+    return (values.astype(np.uint64) << np.uint64(8)) | lens.astype(np.uint64)
+
+
+def _v6_keys(hi: np.ndarray, lo: np.ndarray, lens: np.ndarray) -> np.ndarray:
+    n = len(hi)
+    raw = np.empty((n, 17), dtype=np.uint8)
+    raw[:, :8] = hi.astype(">u8").view(np.uint8).reshape(n, 8)
+    raw[:, 8:16] = lo.astype(">u8").view(np.uint8).reshape(n, 8)
+    raw[:, 16] = lens
+    return raw.view("S17").ravel()
+
+
+def _v6_split(keys: np.ndarray):
+    """Split IPv6 keys back into (hi, lo, length) arrays."""
+    raw = np.ascontiguousarray(keys).view(np.uint8).reshape(-1, 17)
+    hi = np.ascontiguousarray(raw[:, :8]).view(">u8").ravel().astype(np.uint64)
+    lo = np.ascontiguousarray(raw[:, 8:16]).view(">u8").ravel().astype(np.uint64)
+    return hi, lo, raw[:, 16].copy()
+
+
+def _v6_probe(value: int, plen: int) -> np.ndarray:
+    # A 0-d S17 array rather than np.bytes_, so trailing zero bytes compare
+    # the same way as the stored keys
+    return np.array(value.to_bytes(16, "big") + bytes([plen]), dtype="S17")
+
+
+def _v4_parents(keys: np.ndarray) -> np.ndarray:
+    """Nearest covering prefix (family-local index) for sorted IPv4 keys."""
+    parents = np.full(len(keys), NO_PARENT, dtype=np.int32)
+    starts = keys >> np.uint64(8)
+    lens = (keys & np.uint64(0xFF)).astype(np.uint8)
+    # Walk lengths shortest first so deeper ancestors overwrite shallower ones
+    for plen in np.unique(lens):
+        children = np.nonzero(lens > plen)[0]
+        if len(children) == 0:
+            continue
+        mask = np.uint64(0xFFFFFFFF ^ ((1 << (32 - int(plen))) - 1))
+        probe = ((starts[children] & mask) << np.uint64(8)) | np.uint64(plen)
+        pos = np.minimum(np.searchsorted(keys, probe), len(keys) - 1)
+        found = keys[pos] == probe
+        parents[children[found]] = pos[found]
+    return parents
+
+
+def _v6_parents(keys: np.ndarray) -> np.ndarray:
+    """Nearest covering prefix (family-local index) for sorted IPv6 keys."""
+    parents = np.full(len(keys), NO_PARENT, dtype=np.int32)
+    hi, lo, lens = _v6_split(keys)
+    for plen in np.unique(lens):
+        children = np.nonzero(lens > plen)[0]
+        if len(children) == 0:
+            continue
+        plen = int(plen)
+        hi_mask = _U64_MASK ^ ((1 << (64 - min(plen, 64))) - 1)
+        lo_mask = _U64_MASK ^ ((1 << (128 - max(plen, 64))) - 1)
+        probe = _v6_keys(hi[children] & np.uint64(hi_mask),
+                         lo[children] & np.uint64(lo_mask),
+                         np.full(len(children), plen, dtype=np.uint8))
+        pos = np.minimum(np.searchsorted(keys, probe), len(keys) - 1)
+        found = keys[pos] == probe
+        parents[children[found]] = pos[found]
+    return parents
+
+
+def _host_masks(lens: np.ndarray, bits: int):
+    """(hi, lo) uint64 host bit masks for prefix lengths of a family with `bits` address bits."""
+    lens = lens.astype(np.uint64)
+    ones = np.uint64(_U64_MASK)
+    if bits == 32:
+        return (np.zeros(len(lens), dtype=np.uint64),
+                np.uint64(0xFFFFFFFF) >> np.minimum(lens, np.uint64(32)))
+    hi = np.where(lens < 64, ones >> np.minimum(lens, np.uint64(63)), np.uint64(0))
+    lo = np.where(lens <= 64, ones, ones >> (np.maximum(lens, np.uint64(64)) - np.uint64(64)))
+    return hi.astype(np.uint64), lo.astype(np.uint64)
+
+
+def _subtree_ends(keys: np.ndarray, v6: bool) -> np.ndarray:
+    """
+    For sorted keys, the family-local index just past each prefix's more
+    specifics: they are the contiguous run of keys starting inside it.
+    """
+    if v6:
+        hi, lo, lens = _v6_split(keys)
+        host_hi, host_lo = _host_masks(lens, 128)
+        probe = _v6_keys(hi | host_hi, lo | host_lo, np.full(len(keys), 0xFF, dtype=np.uint8))
+    else:
+        _, host = _host_masks(keys & np.uint64(0xFF), 32)
+        probe = (((keys >> np.uint64(8)) | host) << np.uint64(8)) | np.uint64(0xFF)
+    return np.searchsorted(keys, probe, side="right").astype(np.int32)
+
+
+def _interval_index(hi: np.ndarray, lo: np.ndarray, lens: np.ndarray, parents: np.ndarray, bits: int):
+    """
+    Cut a family's address space into elementary intervals, each mapped to its
+    most specific covering prefix. Returns (bound_hi, bound_lo, match): sorted
+    interval start addresses and family-local prefix indexes (NO_PARENT for
+    uncovered space).
+    """
+    n = len(lo)
+    host_hi, host_lo = _host_masks(lens, bits)
+    end_hi, end_lo = hi | host_hi, lo | host_lo
+
+    # The address after a prefix falls back to its nearest ancestor extending past it
+    after = parents.astype(np.int64)
+    while True:
+        active = np.nonzero(after != NO_PARENT)[0]
+        a = after[active]
+        inside = (end_hi[a] < end_hi[active]) | ((end_hi[a] == end_hi[active]) & (end_lo[a] <= end_lo[active]))
+        if not inside.any():
+            break
+        after[active[inside]] = parents[a[inside]]
+
+    if bits == 32:
+        last = end_lo == np.uint64(0xFFFFFFFF)
+    else:
+        last = (end_hi == np.uint64(_U64_MASK)) & (end_lo == np.uint64(_U64_MASK))
+    next_lo = end_lo[~last] + np.uint64(1)
+    next_hi = end_hi[~last] + (next_lo == 0).astype(np.uint64)
+
+    # Events at the same address: prefix starts beat ends, longer prefixes beat shorter
+    bound_hi = np.concatenate((hi, next_hi))
+    bound_lo = np.concatenate((lo, next_lo))
+    match = np.concatenate((np.arange(n, dtype=np.int64), after[~last]))
+    priority = np.concatenate((np.ones(n, dtype=np.int8), np.zeros(len(next_lo), dtype=np.int8)))
+    rank = np.concatenate((np.arange(n, dtype=np.int64), np.zeros(len(next_lo), dtype=np.int64)))
+    order = np.lexsort((rank, priority, bound_lo, bound_hi))
+    bound_hi, bound_lo, match = bound_hi[order], bound_lo[order], match[order]
+
+    keep = np.ones(len(match), dtype=bool)
+    keep[:-1] = (bound_hi[:-1] != bound_hi[1:]) | (bound_lo[:-1] != bound_lo[1:])
+    bound_hi, bound_lo, match = bound_hi[keep], bound_lo[keep], match[keep]
+
+    # Merge neighbouring intervals that resolve to the same prefix
+    keep = np.ones(len(match), dtype=bool)
+    keep[1:] = match[1:] != match[:-1]
+    return bound_hi[keep], bound_lo[keep], match[keep].astype(np.int32)
+
+
+def _v6_bounds(hi: np.ndarray, lo: np.ndarray) -> np.ndarray:
+    """16 byte big-endian keys for IPv6 addresses given as uint64 halves."""
+    n = len(hi)
+    raw = np.empty((n, 16), dtype=np.uint8)
+    raw[:, :8] = np.asarray(hi, dtype=np.uint64).astype(">u8").view(np.uint8).reshape(n, 8)
+    raw[:, 8:] = np.asarray(lo, dtype=np.uint64).astype(">u8").view(np.uint8).reshape(n, 8)
+    return raw.view("S16").ravel()
+
+
+def build_lpm_sections(v4_keys: np.ndarray, v4_parent: np.ndarray,
+                       v6_keys: np.ndarray, v6_parent: np.ndarray) -> Dict[str, np.ndarray]:
+    """Elementary interval sections for batch longest prefix match (see RibSnapshot.batch_lookup)."""
+    n_v4 = len(v4_keys)
+    starts = v4_keys >> np.uint64(8)
+    lens = v4_keys & np.uint64(0xFF)
+    _, v4_bounds, v4_match = _interval_index(np.zeros(n_v4, dtype=np.uint64), starts, lens, v4_parent, 32)
+
+    hi, lo, lens = _v6_split(v6_keys)
+    local_parent = np.where(v6_parent != NO_PARENT, v6_parent - n_v4, NO_PARENT)
+    bound_hi, bound_lo, v6_match = _interval_index(hi, lo, lens, local_parent, 128)
+    v6_match[v6_match != NO_PARENT] += n_v4
+
+    return {
+        "v4_bounds": v4_bounds,
+        "v4_match": v4_match,
+        "v6_bounds": _v6_bounds(bound_hi, bound_lo),
+        "v6_match": v6_match,
+    }
+
+
+def build_best_route_sections(route_offsets: np.ndarray, route_origin: np.ndarray, route_path: np.ndarray,
+                              path_offsets: np.ndarray) -> Dict[str, np.ndarray]:
+    """Origin AS and path id of every prefix's shortest-path route (NO_VALUE without routes)."""
+    n_prefixes = len(route_offsets) - 1
+    route_path = np.asarray(route_path, dtype=np.int64)
+    path_offsets = np.asarray(path_offsets, dtype=np.int64)
+    lengths = path_offsets[route_path + 1] - path_offsets[route_path]
+    route_pid = np.repeat(np.arange(n_prefixes), np.diff(route_offsets))
+    # Stable sort: ties keep the first route, as in RibSnapshot.route_data
+    order = np.lexsort((lengths, route_pid))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = route_pid[order][1:] != route_pid[order][:-1]
+    best = order[first]
+
+    prefix_origin = np.full(n_prefixes, NO_VALUE, dtype=np.uint32)
+    prefix_path = np.full(n_prefixes, NO_VALUE, dtype=np.uint32)
+    prefix_origin[route_pid[best]] = np.asarray(route_origin)[best]
+    prefix_path[route_pid[best]] = route_path[best]
+    return {"prefix_origin": prefix_origin, "prefix_path": prefix_path}
+
+
+def _posting_lists(keys: np.ndarray, values: np.ndarray):
+    """Group values by key: (sorted unique keys, offsets, values sorted and deduplicated per key)."""
+    if keys.dtype.itemsize <= 4:
+        # Pack 32-bit pairs into one word: a single sort instead of a lexsort
+        pairs = np.sort((keys.astype(np.uint64) << np.uint64(32)) | values.astype(np.uint64))
+        keys = (pairs >> np.uint64(32)).astype(keys.dtype)
+        values = (pairs & np.uint64(0xFFFFFFFF)).astype(values.dtype)
+    else:
+        order = np.lexsort((values, keys))
+        keys, values = keys[order], values[order]
+    distinct = np.ones(len(keys), dtype=bool)
+    distinct[1:] = (keys[1:] != keys[:-1]) | (values[1:] != values[:-1])
+    keys, values = keys[distinct], values[distinct]
+
+    starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1]))) if len(keys) else np.empty(0, dtype=np.int64)
+    offsets = np.empty(len(starts) + 1, dtype=np.uint32)
+    offsets[:-1] = starts
+    offsets[-1] = len(values)
+    return keys[starts], offsets, values
+
+
+def build_origin_sections(route_offsets: np.ndarray, route_origin: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Origin AS posting lists: "origin_asns" (sorted), "origin_offsets" and
+    "origin_prefixes" (sorted global prefix ids seen with that origin by any peer).
+    """
+    n_prefixes = len(route_offsets) - 1
+    route_pid = np.repeat(np.arange(n_prefixes, dtype=np.uint32), np.diff(route_offsets))
+    asns, offsets, prefixes = _posting_lists(np.asarray(route_origin, dtype=np.uint32), route_pid)
+    return {"origin_asns": asns, "origin_offsets": offsets, "origin_prefixes": prefixes}
+
+
+def build_path_index_sections(route_path: np.ndarray, path_offsets: np.ndarray,
+                              path_asns: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Indexes from AS to routes: "path_routes" (route ids grouped by path id,
+    delimited by "path_route_offsets"), transit AS -> path ids ("transit_*")
+    and directed AS adjacency (left << 32 | right) -> path ids ("adjacency_*").
+    """
+    path_offsets = np.asarray(path_offsets, dtype=np.int64)
+    n_paths = len(path_offsets) - 1
+    route_path = np.asarray(route_path, dtype=np.int64)
+    path_route_offsets = np.zeros(n_paths + 1, dtype=np.uint32)
+    path_route_offsets[1:] = np.cumsum(np.bincount(route_path, minlength=n_paths))
+
+    asns = np.asarray(path_asns, dtype=np.uint64)
+    path_of = np.repeat(np.arange(n_paths, dtype=np.uint32), np.diff(path_offsets))
+    origin = asns[path_offsets[1:][path_of] - 1] if len(asns) else asns
+    # Anywhere but the origin position; origin prepending is not transit
+    transit = (np.arange(len(asns)) != path_offsets[1:][path_of] - 1) & (asns != origin)
+    transit_asns, transit_offsets, transit_paths = _posting_lists(asns[transit].astype(np.uint32), path_of[transit])
+
+    linked = (path_of[:-1] == path_of[1:]) & (asns[:-1] != asns[1:])
+    adjacency = (asns[:-1][linked] << np.uint64(32)) | asns[1:][linked]
+    adjacency_keys, adjacency_offsets, adjacency_paths = _posting_lists(adjacency, path_of[:-1][linked])
+
+    return {
+        "path_routes": np.argsort(route_path, kind="stable").astype(np.uint32),
+        "path_route_offsets": path_route_offsets,
+        "transit_asns": transit_asns,
+        "transit_offsets": transit_offsets,
+        "transit_paths": transit_paths,
+        "adjacency_keys": adjacency_keys,
+        "adjacency_offsets": adjacency_offsets,
+        "adjacency_paths": adjacency_paths,
+    }
+
+
+def pack_strings(values: Sequence[str]) -> tuple:
+    """Pack strings into (offsets, utf-8 blob) arrays for a string table section."""
+    encoded = [value.encode() for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.uint32)
+    offsets[1:] = np.cumsum([len(value) for value in encoded])
+    return offsets, np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+
+def build_snapshot_sections(prefixes: Sequence[str],
+                            route_prefix: np.ndarray,
+                            route_columns: Dict[str, np.ndarray],
+                            path_offsets: np.ndarray,
+                            path_asns: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Sort prefixes and routes into snapshot sections.
+
+    Args:
+        prefixes: Unique prefix strings
+        route_prefix: Index into prefixes for every route
+        route_columns: Per-route columns (e.g. "origin", "path"), stored as "route_<name>"
+        path_offsets, path_asns: Interned AS path blob
+
+    Returns:
+        dict of section name -> numpy array, ready for write_snapshot
+    """
+    v4_idx, v4_values, v4_lens = [], [], []
+    v6_idx, v6_values, v6_lens = [], [], []
+    for i, prefix in enumerate(prefixes):
+        version, value, plen = parse_prefix(prefix)
+        if version == 4:
+            v4_idx.append(i)
+            v4_values.append(value)
+            v4_lens.append(plen)
+        else:
+            v6_idx.append(i)
+            v6_values.append(value)
+            v6_lens.append(plen)
+
+    v4_keys = _v4_keys(np.array(v4_values, dtype=np.uint64), np.array(v4_lens, dtype=np.uint8))
+    v6_keys = _v6_keys(np.array([v >> 64 for v in v6_values], dtype=np.uint64),
+                       np.array([v & _U64_MASK for v in v6_values], dtype=np.uint64),
+                       np.array(v6_lens, dtype=np.uint8))
+    v4_order = np.argsort(v4_keys, kind="stable")
+    v6_order = np.argsort(v6_keys, kind="stable")
+    v4_keys = v4_keys[v4_order]
+    v6_keys = v6_keys[v6_order]
+    n_v4 = len(v4_keys)
+
+    global_ids = np.empty(len(prefixes), dtype=np.int64)
+    global_ids[np.array(v4_idx, dtype=np.int64)[v4_order]] = np.arange(n_v4)
+    global_ids[np.array(v6_idx, dtype=np.int64)[v6_order]] = n_v4 + np.arange(len(v6_keys))
+
+    v4_parent = _v4_parents(v4_keys)
+    v6_parent = _v6_parents(v6_keys)
+    v6_parent[v6_parent != NO_PARENT] += n_v4
+    v4_subtree_end = _subtree_ends(v4_keys, v6=False)
+    v6_subtree_end = _subtree_ends(v6_keys, v6=True) + n_v4
+
+    route_gid = global_ids[np.asarray(route_prefix, dtype=np.int64)]
+    route_order = np.argsort(route_gid, kind="stable")
+    counts = np.bincount(route_gid, minlength=len(prefixes))
+    route_offsets = np.zeros(len(prefixes) + 1, dtype=np.uint32)
+    route_offsets[1:] = np.cumsum(counts)
+
+    sections = {
+        "v4_keys": v4_keys,
+        "v4_parent": v4_parent,
+        "v6_keys": v6_keys,
+        "v6_parent": v6_parent,
+        "v4_subtree_end": v4_subtree_end,
+        "v6_subtree_end": v6_subtree_end,
+        "route_offsets": route_offsets,
+        "path_offsets": np.asarray(path_offsets, dtype=np.uint32),
+        "path_asns": np.asarray(path_asns, dtype=np.uint32),
+    }
+    for name, column in route_columns.items():
+        sections[f"route_{name}"] = np.asarray(column)[route_order]
+    sections.update(build_lpm_sections(v4_keys, v4_parent, v6_keys, v6_parent))
+    if "route_origin" in sections and "route_path" in sections:
+        sections.update(build_best_route_sections(route_offsets, sections["route_origin"],
+                                                  sections["route_path"], path_offsets))
+    if "route_origin" in sections:
+        sections.update(build_origin_sections(route_offsets, sections["route_origin"]))
+    if "route_path" in sections:
+        sections.update(build_path_index_sections(sections["route_path"], path_offsets, path_asns))
+    return sections
+
+
+def write_snapshot(path: str, sections: Dict[str, np.ndarray], meta: Optional[Dict[str, Any]] = None):
+    """Write snapshot sections to disk, atomically replacing any existing file."""
+    layout = {}
+    offset = 0
+    for name, array in sections.items():
+        array = np.ascontiguousarray(array)
+        layout[name] = [offset, array.dtype.str, int(array.shape[0])]
+        offset = _align(offset + array.nbytes)
+
+    header = json.dumps({
+        "version": SNAPSHOT_VERSION,
+        "created": time.time(),
+        "meta": meta or {},
+        "sections": layout,
+    }).encode()
+    data_start = _align(len(SNAPSHOT_MAGIC) + 4 + len(header))
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(SNAPSHOT_MAGIC)
+        f.write(struct.pack("<I", len(header)))
+        f.write(header)
+        for name, array in sections.items():
+            f.seek(data_start + layout[name][0])
+            f.write(np.ascontiguousarray(array).tobytes())
+        f.truncate(data_start + offset)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class RibSnapshot:
+    """Read-only RIB snapshot queried in place (see module docstring for the layout)."""
+
+    def __init__(self, sections: Dict[str, np.ndarray], meta: Optional[Dict[str, Any]] = None,
+                 source: Optional[str] = None):
+        self.sections = sections
+        self.meta = meta or {}
+        self.source = source
+        self.v4_keys = sections["v4_keys"]
+        self.v4_parent = sections["v4_parent"]
+        self.v6_keys = sections["v6_keys"]
+        self.v6_parent = sections["v6_parent"]
+        self.route_offsets = sections["route_offsets"]
+        self.path_offsets = sections["path_offsets"]
+        self.path_asns = sections["path_asns"]
+        self.n_v4 = len(self.v4_keys)
+        self.n_v6 = len(self.v6_keys)
+        self._v4_blocks: Optional[np.ndarray] = None
+        self._collectors: Optional[List[str]] = None
+
+    @classmethod
+    def open(cls, path: str = SNAPSHOT_FILE) -> "RibSnapshot":
+        """Memory-map a snapshot file."""
+        with open(path, "rb") as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if buf[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+            raise ValueError(f"{path} is not a RIB snapshot")
+        header_len = struct.unpack_from("<I", buf, len(SNAPSHOT_MAGIC))[0]
+        header_start = len(SNAPSHOT_MAGIC) + 4
+        header = json.loads(bytes(buf[header_start:header_start + header_len]))
+        if header.get("version") != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported snapshot version {header.get('version')}")
+
+        data_start = _align(header_start + header_len)
+        sections = {}
+        for name, (offset, dtype, length) in header["sections"].items():
+            if length == 0:
+                sections[name] = np.empty(0, dtype=dtype)
+            else:
+                sections[name] = np.frombuffer(buf, dtype=dtype, count=length, offset=data_start + offset)
+
+        meta = dict(header.get("meta", {}))
+        meta.setdefault("created", header.get("created"))
+        return cls(sections, meta, source=path)
+
+    def save(self, path: str):
+        """Write this snapshot to a file."""
+        write_snapshot(path, self.sections, self.meta)
+
+    def __len__(self) -> int:
+        return self.n_v4 + self.n_v6
+
+    def _decode(self, pid: int):
+        """Return (version, network, length) for a global prefix id."""
+        if pid < self.n_v4:
+            key = int(self.v4_keys[pid])
+            return 4, key >> 8, key & 0xFF
+        key = bytes(self.v6_keys[pid - self.n_v4]).ljust(17, b"\x00")
+        return 6, int.from_bytes(key[:16], "big"), key[16]
+
+    def prefix(self, pid: int) -> str:
+        """Prefix string for a global prefix id."""
+        return format_prefix(*self._decode(pid))
+
+    def search_exact(self, prefix: str) -> Optional[int]:
+        """Global id of an exact prefix match, or None."""
+        version, value, plen = parse_prefix(prefix)
+        if version == 4:
+            keys, key, base = self.v4_keys, np.uint64(value << 8 | plen), 0
+        else:
+            keys, key, base = self.v6_keys, _v6_probe(value, plen), self.n_v4
+        pos = int(np.searchsorted(keys, key))
+        if pos < len(keys) and keys[pos] == key:
+            return base + pos
+        return None
+
+    def search_best(self, ip: str, collector: Optional[str] = None) -> Optional[int]:
+        """
+        Global id of the longest prefix covering an address, or None. With a
+        collector, the longest covering prefix that collector has routes for.
+        """
+        version, value = parse_ip(ip.split("/")[0])
+        if version == 4:
+            bits, base, parents = 32, 0, self.v4_parent
+            pos = int(np.searchsorted(self.v4_keys, np.uint64(value << 8 | 0xFF), side="right")) - 1
+        else:
+            bits, base, parents = 128, self.n_v4, self.v6_parent
+            key = _v6_probe(value, 0xFF)
+            pos = int(np.searchsorted(self.v6_keys, key, side="right")) - 1
+        if pos < 0:
+            return None
+
+        # The nearest sorted predecessor either covers the address or sits
+        # below the best match, so walk up its covering chain.
+        pid = base + pos
+        while pid != NO_PARENT:
+            _, network, plen = self._decode(pid)
+            if value >> (bits - plen) == network >> (bits - plen) and \
+                    (collector is None or len(self.collector_routes(pid, collector))):
+                return pid
+            local = pid - base
+            pid = int(parents[local])
+        return None
+
+    def _batch_sections(self) -> Dict[str, np.ndarray]:
+        """Interval and best-route sections, built on first use for snapshots written without them."""
+        sections = self.sections
+        if "v4_bounds" not in sections:
+            sections.update(build_lpm_sections(self.v4_keys, self.v4_parent, self.v6_keys, self.v6_parent))
+        if "prefix_origin" not in sections:
+            sections.update(build_best_route_sections(self.route_offsets, sections["route_origin"],
+                                                      sections["route_path"], self.path_offsets))
+        return sections
+
+    def _v4_block_table(self) -> np.ndarray:
+        """Prefix id for every IPv4 block lying inside one interval, SPLIT_BLOCK for the rest."""
+        if self._v4_blocks is None:
+            sections = self._batch_sections()
+            bounds, match = sections["v4_bounds"], sections["v4_match"]
+            shift = np.uint64(32 - V4_BLOCK_BITS)
+            span = (np.uint64(1) << shift) - np.uint64(1)
+            table = np.empty(1 << V4_BLOCK_BITS, dtype=np.int32)
+            # A chunk of blocks at a time, so the temporaries stay a few MB
+            for chunk in range(0, len(table), V4_BLOCK_CHUNK):
+                starts = np.arange(chunk, min(chunk + V4_BLOCK_CHUNK, len(table)), dtype=np.uint64) << shift
+                first = np.searchsorted(bounds, starts, side="right") - 1
+                last = np.searchsorted(bounds, starts + span, side="right") - 1
+                out = table[chunk:chunk + len(starts)]
+                if len(match):
+                    out[:] = np.where(first >= 0, match[np.maximum(first, 0)], NO_PARENT)
+                else:
+                    out[:] = NO_PARENT
+                out[first != last] = SPLIT_BLOCK
+            self._v4_blocks = table
+        return self._v4_blocks
+
+    def batch_lookup(self, addresses: np.ndarray, lo: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+        """
+        Longest prefix match for an array of addresses.
+
+        Args:
+            addresses: IPv4 addresses as integers, or the upper 64 bits of IPv6 addresses
+            lo: Lower 64 bits of IPv6 addresses; selects IPv6 lookup when given
+
+        Returns:
+            dict with "prefix" (global prefix ids, -1 where nothing matches),
+            "origin_as" and "path_id" (NO_VALUE where nothing matches)
+        """
+        sections = self._batch_sections()
+        if lo is None:
+            addresses = np.asarray(addresses, dtype=np.uint64)
+            prefix = self._v4_block_table()[addresses >> np.uint64(32 - V4_BLOCK_BITS)]
+            split = np.nonzero(prefix == SPLIT_BLOCK)[0]
+            pos = np.searchsorted(sections["v4_bounds"], addresses[split], side="right") - 1
+            prefix[split] = np.where(pos >= 0, sections["v4_match"][np.maximum(pos, 0)], NO_PARENT)
+        else:
+            bounds, match = sections["v6_bounds"], sections["v6_match"]
+            pos = np.searchsorted(bounds, _v6_bounds(addresses, lo), side="right") - 1
+            if len(match):
+                prefix = np.where(pos >= 0, match[np.maximum(pos, 0)], NO_PARENT).astype(np.int32)
+            else:
+                prefix = np.full(len(pos), NO_PARENT, dtype=np.int32)
+        found = prefix != NO_PARENT
+        origin_as = np.full(len(prefix), NO_VALUE, dtype=np.uint32)
+        path_id = np.full(len(prefix), NO_VALUE, dtype=np.uint32)
+        origin_as[found] = sections["prefix_origin"][prefix[found]]
+        path_id[found] = sections["prefix_path"][prefix[found]]
+        return {"prefix": prefix, "origin_as": origin_as, "path_id": path_id}
+
+    def _family(self, version: int):
+        """(keys, first global id, address bits) of an address family."""
+        if version == 4:
+            return self.v4_keys, 0, 32
+        return self.v6_keys, self.n_v4, 128
+
+    @staticmethod
+    def _probe(version: int, value: int, plen: int):
+        if version == 4:
+            return np.uint64(value << 8 | plen)
+        return _v6_probe(value, plen)
+
+    def _subtree_end(self, pid: int) -> int:
+        """Global id just past a prefix's more specifics."""
+        sections = self.sections
+        if "v4_subtree_end" not in sections:
+            sections["v4_subtree_end"] = _subtree_ends(self.v4_keys, v6=False)
+            sections["v6_subtree_end"] = _subtree_ends(self.v6_keys, v6=True) + self.n_v4
+        if pid < self.n_v4:
+            return int(sections["v4_subtree_end"][pid])
+        return int(sections["v6_subtree_end"][pid - self.n_v4])
+
+    def more_specifics(self, prefix: str) -> range:
+        """Global ids of every prefix strictly inside a prefix (which need not be in the table)."""
+        version, value, plen = parse_prefix(prefix)
+        keys, base, bits = self._family(version)
+        last = value | ((1 << (bits - plen)) - 1)
+        start = int(np.searchsorted(keys, self._probe(version, value, plen), side="right"))
+        stop = int(np.searchsorted(keys, self._probe(version, last, 0xFF), side="right"))
+        return range(base + start, base + max(start, stop))
+
+    def less_specifics(self, prefix: str) -> List[int]:
+        """Global ids of the prefixes strictly covering a prefix, most specific first."""
+        version, value, plen = parse_prefix(prefix)
+        keys, base, bits = self._family(version)
+        pos = int(np.searchsorted(keys, self._probe(version, value, plen), side="right")) - 1
+        if pos < 0:
+            return []
+
+        # Every covering prefix is on the covering chain of the sorted predecessor
+        result = []
+        pid = base + pos
+        parents = self.v4_parent if version == 4 else self.v6_parent
+        while pid != NO_PARENT:
+            _, network, length = self._decode(pid)
+            if length < plen and value >> (bits - length) == network >> (bits - length):
+                result.append(pid)
+            pid = int(parents[pid - base])
+        return result
+
+    def iter_siblings(self, prefix: str) -> Iterator[int]:
+        """
+        Global ids of the other direct children of a prefix's nearest covering
+        prefix (top-level prefixes of the family when nothing covers it), found
+        as they are consumed.
+        """
+        version, value, plen = parse_prefix(prefix)
+        keys, base, _ = self._family(version)
+        covering = self.less_specifics(prefix)
+        own = self.more_specifics(prefix)
+        exact = self.search_exact(prefix)
+        if covering:
+            pid, stop = covering[0] + 1, self._subtree_end(covering[0])
+        else:
+            pid, stop = base, base + len(keys)
+
+        while pid < stop:
+            if pid != exact and pid not in own:
+                yield pid
+            pid = self._subtree_end(pid)
+
+    def siblings(self, prefix: str, limit: Optional[int] = None) -> List[int]:
+        """The ids of iter_siblings(), at most limit."""
+        return list(islice(self.iter_siblings(prefix), limit))
+
+    def origin_prefixes(self, asn: int) -> np.ndarray:
+        """Sorted global ids of the prefixes any peer sees originated by an AS."""
+        sections = self.sections
+        if "origin_asns" not in sections:
+            sections.update(build_origin_sections(self.route_offsets, sections["route_origin"]))
+        return self._posting(sections["origin_asns"], sections["origin_offsets"], sections["origin_prefixes"],
+                             np.uint32(asn))
+
+    def _path_index(self) -> Dict[str, np.ndarray]:
+        sections = self.sections
+        if "path_routes" not in sections:
+            sections.update(build_path_index_sections(sections["route_path"], self.path_offsets, self.path_asns))
+        return sections
+
+    def _path_routes(self, path_ids: np.ndarray) -> np.ndarray:
+        """Sorted route ids of every route using one of the given paths."""
+        sections = self._path_index()
+        offsets = sections["path_route_offsets"]
+        routes = [sections["path_routes"][offsets[path_id]:offsets[path_id + 1]] for path_id in path_ids.tolist()]
+        return np.sort(np.concatenate(routes)) if routes else np.empty(0, dtype=np.uint32)
+
+    @staticmethod
+    def _posting(keys: np.ndarray, offsets: np.ndarray, values: np.ndarray, key) -> np.ndarray:
+        pos = int(np.searchsorted(keys, key))
+        if pos == len(keys) or keys[pos] != key:
+            return values[:0]
+        return values[offsets[pos]:offsets[pos + 1]]
+
+    def routes_through(self, asn: int) -> np.ndarray:
+        """Route ids whose AS path carries an AS in transit."""
+        sections = self._path_index()
+        path_ids = self._posting(sections["transit_asns"], sections["transit_offsets"],
+                                 sections["transit_paths"], np.uint32(asn))
+        return self._path_routes(path_ids)
+
+    def routes_via_adjacency(self, left: int, right: int) -> np.ndarray:
+        """Route ids whose AS path crosses the link between two ASes, in either direction."""
+        sections = self._path_index()
+        path_ids = np.union1d(*(
+            self._posting(sections["adjacency_keys"], sections["adjacency_offsets"], sections["adjacency_paths"],
+                          np.uint64(a << 32 | b))
+            for a, b in ((left, right), (right, left))
+        ))
+        return self._path_routes(path_ids)
+
+    def route_prefixes(self, route_ids: np.ndarray) -> np.ndarray:
+        """Sorted global ids of the prefixes the given routes belong to."""
+        return np.unique(np.searchsorted(self.route_offsets, route_ids, side="right") - 1)
+
+    def address_space(self, pids: Sequence[int]) -> Dict[str, float]:
+        """
+        Addresses covered by a set of prefixes, counting overlapping prefixes
+        once: IPv4 addresses and IPv6 /48 equivalents.
+        """
+        pids = np.sort(np.asarray(pids, dtype=np.int64))
+        v4 = pids[pids < self.n_v4]
+        keys = self.v4_keys[v4]
+        starts = (keys >> np.uint64(8)).astype(np.int64)
+        ends = starts + (np.int64(1) << (32 - (keys & np.uint64(0xFF)).astype(np.int64)))
+        # Sorted by start, a prefix is nested when it starts before an earlier prefix ends
+        reach = np.maximum.accumulate(ends) if len(ends) else ends
+        outer = np.ones(len(starts), dtype=bool)
+        outer[1:] = starts[1:] >= reach[:-1]
+        ipv4_addresses = int((ends - starts)[outer].sum())
+
+        ipv6_addresses = 0
+        reach = -1
+        for pid in pids[pids >= self.n_v4].tolist():
+            _, network, plen = self._decode(pid)
+            if network >= reach:
+                ipv6_addresses += 1 << (128 - plen)
+                reach = network + (1 << (128 - plen))
+        return {"ipv4_addresses": ipv4_addresses, "ipv6_slash48s": ipv6_addresses / (1 << 80)}
+
+    def get_path(self, path_id: int) -> List[int]:
+        """ASNs of an interned AS path."""
+        start, end = self.path_offsets[path_id], self.path_offsets[path_id + 1]
+        return self.path_asns[start:end].tolist()
+
+    def route_range(self, pid: int) -> range:
+        """Route indexes belonging to a prefix."""
+        return range(int(self.route_offsets[pid]), int(self.route_offsets[pid + 1]))
+
+    @property
+    def collectors(self) -> List[str]:
+        """Collectors the routes were seen through, in route collector mask bit order."""
+        if self._collectors is None:
+            offsets = self.sections.get("collector_offsets")
+            self._collectors = [] if offsets is None else \
+                [self.string("collector", idx) for idx in range(len(offsets) - 1)]
+        return self._collectors
+
+    def collector_names(self, mask: int) -> List[str]:
+        """Collectors whose bits are set in a route collector mask."""
+        return [name for i, name in enumerate(self.collectors) if mask >> i & 1]
+
+    def collector_routes(self, pid: int, collector: Optional[str] = None) -> np.ndarray:
+        """
+        Route indexes of a prefix in one collector's view, or in the merged
+        view (every route) without a collector.
+        """
+        routes = self.route_range(pid)
+        indexes = np.arange(routes.start, routes.stop)
+        if collector is None:
+            return indexes
+        collectors = self.collectors
+        masks = self.sections.get("route_collectors")
+        if masks is None or collector not in collectors:
+            return indexes[:0]
+        bit = np.uint32(1 << collectors.index(collector))
+        return indexes[(masks[routes.start:routes.stop] & bit) != 0]
+
+    def string(self, table: str, idx: int) -> Optional[str]:
+        """Look up an entry of a string table section (peer_address, next_hop, communities)."""
+        offsets = self.sections.get(f"{table}_offsets")
+        if offsets is None or idx == NO_VALUE:
+            return None
+        blob = self.sections[f"{table}_blob"]
+        return bytes(blob[offsets[idx]:offsets[idx + 1]]).decode()
+
+    def routes(self, pid: int, collector: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Every peer's route for a prefix (in one collector's view), with decoded attributes."""
+        sections = self.sections
+        peers = sections.get("route_peer")
+        masks = sections.get("route_collectors")
+        result = []
+        for r in self.collector_routes(pid, collector).tolist():
+            route = {
+                "origin_as": int(sections["route_origin"][r]),
+                "as_path": self.get_path(int(sections["route_path"][r])),
+            }
+            if peers is not None:
+                peer = int(peers[r])
+                med = int(sections["route_med"][r])
+                local_pref = int(sections["route_local_pref"][r])
+                route.update({
+                    "peer_asn": int(sections["peer_asn"][peer]),
+                    "peer_address": self.string("peer_address", peer),
+                    "next_hop": self.string("next_hop", int(sections["route_next_hop"][r])),
+                    "med": None if med == NO_VALUE else med,
+                    "local_pref": None if local_pref == NO_VALUE else local_pref,
+                    "communities": self.string("communities", int(sections["route_communities"][r])),
+                })
+            if masks is not None:
+                route["collectors"] = self.collector_names(int(masks[r]))
+            result.append(route)
+        return result
+
+    def route_data(self, pid: int, collector: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Route data for a prefix, in the same shape as radix node data.
+
+        origin_as/as_path describe the route with the shortest AS path. When
+        the snapshot holds per-peer routes, visibility (peer_count), origin
+        diversity (origin_ases) and path diversity (path_count) are added, and
+        the collectors that see the prefix when it holds several collectors.
+        With a collector, only the routes in that collector's view are used.
+        """
+        if collector is None:
+            routes = self.route_range(pid)
+            if not routes:
+                return {}
+            routes = slice(routes.start, routes.stop)
+        else:
+            routes = self.collector_routes(pid, collector)
+            if not len(routes):
+                return {}
+        paths = self.sections["route_path"][routes]
+        lengths = self.path_offsets[paths + 1] - self.path_offsets[paths]
+        best = routes.start + int(np.argmin(lengths)) if collector is None else int(routes[np.argmin(lengths)])
+        path_id = int(self.sections["route_path"][best])
+        data = {
+            "origin_as": int(self.sections["route_origin"][best]),
+            "as_path": self.get_path(path_id),
+            "path_id": path_id,
+        }
+        if "route_peer" in self.sections:
+            origins = self.sections["route_origin"][routes]
+            data["peer_count"] = len(paths)
+            data["origin_ases"] = np.unique(origins).tolist()
+            data["path_count"] = int(len(np.unique(paths)))
+        masks = self.sections.get("route_collectors")
+        if masks is not None and len(self.collectors) > 1:
+            data["collectors"] = self.collector_names(int(np.bitwise_or.reduce(masks[routes])))
+        return data
+
+
+def snapshot_from_trees(rtree_v4, rtree_v6, meta: Optional[Dict[str, Any]] = None) -> RibSnapshot:
+    """Build an in-memory snapshot from py-radix trees with origin_as/as_path node data."""
+    paths = ASPathTable()
+    prefixes, origins, path_ids = [], [], []
+    for tree in (rtree_v4, rtree_v6):
+        if tree is None:
+            continue
+        for rnode in tree.nodes():
+            as_path = rnode.data.get("as_path")
+            if not as_path:
+                continue
+            prefixes.append(rnode.prefix)
+            origins.append(rnode.data.get("origin_as", as_path[-1]))
+            path_ids.append(paths.intern(as_path))
+
+    path_offsets, path_asns = paths.arrays()
+    sections = build_snapshot_sections(
+        prefixes,
+        np.arange(len(prefixes)),
+        {"origin": np.array(origins, dtype=np.uint32), "path": np.array(path_ids, dtype=np.uint32)},
+        path_offsets,
+        path_asns,
+    )
+    return RibSnapshot(sections, meta)
+
+
+def save_snapshot_from_trees(rtree_v4, rtree_v6, path: str = SNAPSHOT_FILE, meta: Optional[Dict[str, Any]] = None):
+    """Convert py-radix trees into a snapshot file."""
+    snapshot_from_trees(rtree_v4, rtree_v6, meta).save(path)
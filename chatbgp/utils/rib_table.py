@@ -0,0 +1,500 @@
+#!/usr/bin/env python3
+"""
+Per-peer RIB stored as struct-of-arrays columns
+
+Every (prefix, peer) pair owns one route slot, so routes from different peers
+no longer overwrite each other. Attributes are kept as small integers in typed
+arrays: peers, next hops and community strings are interned into tables, AS
+paths into the shared ASPathTable, and MED/local-pref are stored directly with
+NO_VALUE meaning "absent". A route costs 34 bytes of column storage, i.e.
+about 34 MB per million routes, plus the (prefix, peer) slot index needed to
+apply live updates. freeze() turns the table into a RibSnapshot.
+
+Routes sharing an AS path are threaded into a doubly linked list through two
+more slot columns (8 bytes per route), kept current by announce/withdraw.
+Together with the path table's transit and adjacency indexes this answers
+"which routes go through AS X / the X-Y link" without scanning the table.
+
+Several collectors can feed one table. A route is still stored once per
+(prefix, peer), with a bitmask column recording which collectors currently
+carry it: an announcement through another collector only sets its bit, and a
+withdrawal clears it, removing the route when no collector is left. Memory
+therefore grows with distinct routes rather than collectors x routes, and the
+merged view costs nothing extra to query.
+"""
+
+import os
+from array import array
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .as_path_table import ASPathTable, get_path_table
+from .rib_snapshot import (NO_VALUE, RibSnapshot, build_snapshot_sections,
+                           pack_strings)
+from .update_batch import ANNOUNCE, WITHDRAW
+
+PEER_BITS = 16
+NO_SLOT = -1
+MAX_COLLECTORS = 32  # bits of the route collector mask
+
+
+def _small_int(value) -> int:
+    """Convert an optional attribute (MED, local-pref) to a uint32 column value."""
+    if value is None or value == "":
+        return NO_VALUE
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return NO_VALUE
+    return value if 0 <= value < NO_VALUE else NO_VALUE
+
+
+def _remap_bits(masks: np.ndarray, bits: List[int]) -> np.ndarray:
+    """Translate bitmasks bit by bit: bit i of a mask becomes bits[i]."""
+    masks = np.asarray(masks, dtype=np.uint32)
+    result = np.zeros(len(masks), dtype=np.uint32)
+    for i, bit in enumerate(bits):
+        result[(masks >> np.uint32(i)) & np.uint32(1) != 0] |= np.uint32(bit)
+    return result
+
+
+class _StringTable:
+    """Interns strings to dense integer ids."""
+
+    def __init__(self):
+        self.values: List[str] = []
+        self.ids: Dict[str, int] = {}
+
+    def intern(self, value: Optional[str]) -> int:
+        if value is None:
+            return NO_VALUE
+        idx = self.ids.get(value)
+        if idx is None:
+            idx = self.ids[value] = len(self.values)
+            self.values.append(value)
+        return idx
+
+
+class RibTable:
+    """Mutable per-peer RIB with struct-of-arrays route columns."""
+
+    # column name -> array typecode
+    COLUMNS = {
+        "prefix": "I",
+        "peer": "H",
+        "origin": "I",
+        "path": "I",
+        "next_hop": "I",
+        "med": "I",
+        "local_pref": "I",
+        "communities": "I",
+        "collectors": "I",
+    }
+
+    def __init__(self, paths: Optional[ASPathTable] = None):
+        self.paths = paths if paths is not None else get_path_table()
+        self.prefixes = _StringTable()
+        self.next_hops = _StringTable()
+        self.communities = _StringTable()
+        self.collectors = _StringTable()
+        self.peers: List[tuple] = []  # peer index -> (peer_asn, peer_address)
+        self.peer_ids: Dict[tuple, int] = {}
+
+        self.columns = {name: array(code) for name, code in self.COLUMNS.items()}
+        self.slots: Dict[int, int] = {}  # prefix_id << PEER_BITS | peer -> slot
+        self.free_slots: List[int] = []
+
+        # Per-path route lists: path id -> first slot, plus next/prev slot links
+        self.path_head: Dict[int, int] = {}
+        self.path_next = array("i")
+        self.path_prev = array("i")
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+    def peer_index(self, peer_asn, peer_address) -> int:
+        key = (int(peer_asn or 0), str(peer_address or ""))
+        idx = self.peer_ids.get(key)
+        if idx is None:
+            if len(self.peers) >= 1 << PEER_BITS:
+                raise ValueError("Too many peers for the RIB table")
+            idx = self.peer_ids[key] = len(self.peers)
+            self.peers.append(key)
+        return idx
+
+    def collector_bit(self, collector: Optional[str]) -> int:
+        """Mask bit of a collector (0 for an unknown collector)."""
+        if not collector:
+            return 0
+        idx = self.collectors.ids.get(collector)
+        if idx is None:
+            if len(self.collectors.values) >= MAX_COLLECTORS:
+                raise ValueError("Too many collectors for the RIB table")
+            idx = self.collectors.intern(collector)
+        return 1 << idx
+
+    def _link(self, slot: int, path_id: int):
+        head = self.path_head.get(path_id, NO_SLOT)
+        self.path_prev[slot] = NO_SLOT
+        self.path_next[slot] = head
+        if head != NO_SLOT:
+            self.path_prev[head] = slot
+        self.path_head[path_id] = slot
+
+    def _unlink(self, slot: int, path_id: int):
+        prev, next_slot = self.path_prev[slot], self.path_next[slot]
+        if prev != NO_SLOT:
+            self.path_next[prev] = next_slot
+        elif next_slot != NO_SLOT:
+            self.path_head[path_id] = next_slot
+        else:
+            del self.path_head[path_id]
+        if next_slot != NO_SLOT:
+            self.path_prev[next_slot] = prev
+
+    def announce(self, prefix: str, peer_asn, peer_address, as_path: Optional[List[int]] = None,
+                 next_hop: Optional[str] = None, med=None, local_pref=None,
+                 communities: Optional[str] = None, path_id: Optional[int] = None,
+                 collector: Optional[str] = None) -> Optional[int]:
+        """
+        Insert or replace the route a peer announces for a prefix. The path is
+        given either as ASNs or as an id from the table's ASPathTable. The
+        collector it was seen through is added to the route's provenance.
+        Returns the slot.
+        """
+        if path_id is None and as_path:
+            path_id = self.paths.intern(as_path)
+        if not prefix or path_id is None:
+            return None
+        return self._announce(prefix, self.peer_index(peer_asn, peer_address), path_id,
+                              self.next_hops.intern(next_hop), _small_int(med), _small_int(local_pref),
+                              self.communities.intern(communities), collector)
+
+    def _announce(self, prefix: str, peer: int, path_id: int, next_hop: int, med: int, local_pref: int,
+                  communities: int, collector: Optional[str]) -> int:
+        """announce() with the peer and strings already interned and MED/local-pref as column values."""
+        prefix_id = self.prefixes.intern(prefix)
+        key = prefix_id << PEER_BITS | peer
+        slot = self.slots.get(key)
+        collectors = self.collector_bit(collector)
+        if slot is not None:
+            collectors |= self.columns["collectors"][slot]
+        row = (
+            prefix_id,
+            peer,
+            self.paths.origin(path_id),
+            path_id,
+            next_hop,
+            med,
+            local_pref,
+            communities,
+            collectors,
+        )
+        return self._store(key, row)
+
+    def _store(self, key: int, row: tuple) -> int:
+        """Write a route row into the slot of its (prefix, peer) key, allocating one if needed."""
+        path_id = row[3]
+        slot = self.slots.get(key)
+        if slot is None and not self.free_slots:
+            slot = len(self.columns["prefix"])
+            for column, value in zip(self.columns.values(), row):
+                column.append(value)
+            self.path_next.append(NO_SLOT)
+            self.path_prev.append(NO_SLOT)
+            self._link(slot, path_id)
+        else:
+            if slot is None:
+                slot = self.free_slots.pop()
+                self._link(slot, path_id)
+            elif self.columns["path"][slot] != path_id:
+                self._unlink(slot, self.columns["path"][slot])
+                self._link(slot, path_id)
+            for column, value in zip(self.columns.values(), row):
+                column[slot] = value
+        self.slots[key] = slot
+        return slot
+
+    def withdraw(self, prefix: str, peer_asn, peer_address, collector: Optional[str] = None) -> bool:
+        """
+        Withdraw a peer's route for a prefix through a collector: the
+        collector is dropped from the route's provenance, and the route is
+        removed once no collector carries it. Without a collector (or for a
+        route announced without one) the route is removed. Returns False if
+        the route was not there, or not carried by the collector.
+        """
+        prefix_id = self.prefixes.ids.get(prefix)
+        peer = self.peer_ids.get((int(peer_asn or 0), str(peer_address or "")))
+        if prefix_id is None or peer is None:
+            return False
+        key = prefix_id << PEER_BITS | peer
+        slot = self.slots.get(key)
+        if slot is None:
+            return False
+        carried = self.columns["collectors"][slot]
+        if collector and carried:
+            idx = self.collectors.ids.get(collector)
+            if idx is None or not carried & (1 << idx):
+                return False
+            if carried & ~(1 << idx):
+                self.columns["collectors"][slot] = carried & ~(1 << idx)
+                return True
+        del self.slots[key]
+        self.columns["prefix"][slot] = NO_VALUE
+        self._unlink(slot, self.columns["path"][slot])
+        self.free_slots.append(slot)
+        return True
+
+    def apply_update(self, update) -> bool:
+        """Apply a BGPUpdate (announce or withdraw) from its peer."""
+        if update.update_type == 'A':
+            path_id = update.path_id if update.path_id is not None else self.paths.intern_str(update.as_path)
+            return self.announce(
+                update.prefix, update.peer_asn, update.peer_address,
+                next_hop=update.next_hop, med=update.med, local_pref=update.local_pref,
+                communities=update.communities, path_id=path_id, collector=update.collector
+            ) is not None
+        if update.update_type == 'W':
+            return self.withdraw(update.prefix, update.peer_asn, update.peer_address, update.collector)
+        return False
+
+    def apply_batch(self, batch) -> np.ndarray:
+        """
+        Apply an UpdateBatch in order. Each distinct peer, next hop and
+        community string of the batch is interned once; returns a mask of the
+        updates that changed the table.
+        """
+        columns = batch.columns
+        values = batch.values
+        changed = np.zeros(len(batch), dtype=bool)
+        prefixes = values["prefix"]
+        collectors = values["collector"] + [None]
+        next_hops = [self.next_hops.intern(v) for v in values["next_hop"]] + [NO_VALUE]
+        communities = [self.communities.intern(v) for v in values["communities"]] + [NO_VALUE]
+        addresses = values["peer_address"] + [None]
+        peers = {}
+        rows = zip(*(columns[name].tolist() for name in (
+            "update_type", "prefix", "peer_address", "collector", "path_id", "as_path", "next_hop",
+            "communities")), *(batch.decoded(name) for name in ("peer_asn", "med", "local_pref")))
+        for i, (kind, prefix, address, collector, path_id, as_path, next_hop, community, peer_asn, med,
+                local_pref) in enumerate(rows):
+            if prefix < 0 or not prefixes[prefix]:
+                continue
+            try:
+                if kind == ANNOUNCE:
+                    if path_id < 0:
+                        path_id = self.paths.intern_str(values["as_path"][as_path]) if as_path >= 0 else None
+                        if path_id is None:
+                            continue
+                    peer = peers.get((peer_asn, address))
+                    if peer is None:
+                        peer = peers[(peer_asn, address)] = self.peer_index(peer_asn, addresses[address])
+                    self._announce(prefixes[prefix], peer, path_id, next_hops[next_hop], _small_int(med),
+                                   _small_int(local_pref), communities[community], collectors[collector])
+                    changed[i] = True
+                elif kind == WITHDRAW:
+                    changed[i] = self.withdraw(prefixes[prefix], peer_asn, addresses[address],
+                                               collectors[collector])
+            except ValueError:
+                continue
+        return changed
+
+    def freeze(self, meta: Optional[Dict] = None) -> RibSnapshot:
+        """Build an immutable in-memory snapshot of the current routes."""
+        columns = {name: np.frombuffer(column.tobytes(), dtype=column.typecode)
+                   for name, column in self.columns.items()}
+        live = columns["prefix"] != NO_VALUE
+        columns = {name: values[live] for name, values in columns.items()}
+        order = np.lexsort((columns["peer"], columns["prefix"]))
+        columns = {name: values[order] for name, values in columns.items()}
+
+        prefix_ids, route_prefix = np.unique(columns.pop("prefix"), return_inverse=True)
+        prefixes = [self.prefixes.values[i] for i in prefix_ids.tolist()]
+        path_offsets, path_asns = self.paths.arrays()
+        sections = build_snapshot_sections(prefixes, route_prefix, columns, path_offsets, path_asns)
+
+        peer_address_offsets, peer_address_blob = pack_strings([address for _, address in self.peers])
+        sections["peer_asn"] = np.array([asn for asn, _ in self.peers], dtype=np.uint32)
+        sections["peer_address_offsets"] = peer_address_offsets
+        sections["peer_address_blob"] = peer_address_blob
+        for name, table in (("next_hop", self.next_hops), ("communities", self.communities),
+                            ("collector", self.collectors)):
+            sections[f"{name}_offsets"], sections[f"{name}_blob"] = pack_strings(table.values)
+
+        meta = dict(meta or {})
+        meta.setdefault("routes", int(live.sum()))
+        meta.setdefault("peers", len(self.peers))
+        meta.setdefault("collectors", list(self.collectors.values))
+        return RibSnapshot(sections, meta)
+
+    def save(self, path: str, meta: Optional[Dict] = None):
+        """Write the table as a snapshot file."""
+        self.freeze(meta).save(path)
+
+    @classmethod
+    def from_snapshot(cls, snapshot: RibSnapshot, paths: Optional[ASPathTable] = None) -> "RibTable":
+        """
+        Rebuild a mutable table from a snapshot written by freeze(). Snapshot
+        path ids are re-interned into the given (default: shared) path table.
+        """
+        table = cls(paths)
+        table.merge_snapshot(snapshot)
+        return table
+
+    def merge_snapshot(self, snapshot: RibSnapshot):
+        """
+        Add every route of a snapshot, replacing routes the table already has
+        for the same (prefix, peer) and adding the snapshot's collectors to
+        their provenance. Prefixes, peers, strings, collectors and path ids
+        are remapped into this table's dictionaries.
+        """
+        sections = snapshot.sections
+        n_routes = int(snapshot.route_offsets[-1])
+        n_prefixes = len(self.prefixes.values)
+
+        prefix_mapping = np.array([self.prefixes.intern(snapshot.prefix(pid)) for pid in range(len(snapshot))],
+                                  dtype=np.uint32)
+
+        mappings = {}
+        if "peer_asn" in sections:
+            mappings["peer"] = np.array([self.peer_index(asn, snapshot.string("peer_address", peer))
+                                         for peer, asn in enumerate(sections["peer_asn"].tolist())], dtype=np.uint16)
+            for name, strings in (("next_hop", self.next_hops), ("communities", self.communities)):
+                # Trailing NO_VALUE entry keeps absent attributes absent
+                mappings[name] = np.array([strings.intern(snapshot.string(name, idx))
+                                           for idx in range(len(sections[f"{name}_offsets"]) - 1)] + [NO_VALUE],
+                                          dtype=np.uint32)
+            if "collector_offsets" in sections:
+                mappings["collectors"] = [self.collector_bit(snapshot.string("collector", idx))
+                                          for idx in range(len(sections["collector_offsets"]) - 1)]
+        else:
+            mappings["peer"] = np.array([self.peer_index(0, "")], dtype=np.uint16)
+        mappings["path"] = self.paths.remap_from(snapshot.path_offsets, snapshot.path_asns)
+
+        route_prefix = np.repeat(np.arange(len(snapshot), dtype=np.uint32), np.diff(snapshot.route_offsets))
+        columns = {}
+        for name, code in self.COLUMNS.items():
+            if name == "prefix":
+                values = prefix_mapping[route_prefix]
+            else:
+                values = sections.get(f"route_{name}")
+                if values is None:
+                    values = np.full(n_routes, 0 if name in ("peer", "collectors") else NO_VALUE)
+                mapping = mappings.get(name)
+                if name == "collectors":
+                    values = _remap_bits(values, mapping or [])
+                elif mapping is not None:
+                    values = mapping[np.minimum(values, len(mapping) - 1)]
+            columns[name] = np.asarray(values).astype(np.dtype(code))
+
+        keys = (columns["prefix"].astype(np.int64) << PEER_BITS) | columns["peer"]
+        if n_routes and int(prefix_mapping.min()) >= n_prefixes:
+            # Only new prefixes: no existing (prefix, peer) slot can collide
+            start = len(self.columns["prefix"])
+            for name, column in self.columns.items():
+                column.frombytes(columns[name].tobytes())
+            self.slots.update(zip(keys.tolist(), range(start, start + n_routes)))
+            self._link_appended(start, columns["path"])
+            return
+
+        collector_column = self.columns["collectors"]
+        rows = zip(*(columns[name].tolist() for name in self.COLUMNS))
+        for key, row in zip(keys.tolist(), rows):
+            slot = self.slots.get(key)
+            if slot is not None:
+                row = row[:-1] + (row[-1] | collector_column[slot],)
+            self._store(key, row)
+
+    def _link_appended(self, start: int, paths: np.ndarray):
+        """Prepend slots start.. (one per entry of paths) to their paths' route lists."""
+        order = np.argsort(paths, kind="stable")
+        sorted_paths = paths[order]
+        sorted_slots = (start + order).astype(np.int32)
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = sorted_paths[1:] != sorted_paths[:-1]
+        last = np.ones(len(order), dtype=bool)
+        last[:-1] = first[1:]
+
+        group_paths = sorted_paths[first].tolist()
+        old_heads = np.array([self.path_head.get(path_id, NO_SLOT) for path_id in group_paths], dtype=np.int32)
+        tails = sorted_slots[last]
+
+        next_sorted = np.empty(len(order), dtype=np.int32)
+        next_sorted[:-1] = sorted_slots[1:]
+        next_sorted[last] = old_heads
+        prev_sorted = np.empty(len(order), dtype=np.int32)
+        prev_sorted[1:] = sorted_slots[:-1]
+        prev_sorted[first] = NO_SLOT
+
+        path_next = np.empty(len(order), dtype=np.int32)
+        path_prev = np.empty(len(order), dtype=np.int32)
+        path_next[order] = next_sorted
+        path_prev[order] = prev_sorted
+        self.path_next.frombytes(path_next.tobytes())
+        self.path_prev.frombytes(path_prev.tobytes())
+
+        for head, tail in zip(old_heads.tolist(), tails.tolist()):
+            if head != NO_SLOT:
+                self.path_prev[head] = tail
+        self.path_head.update(zip(group_paths, sorted_slots[first].tolist()))
+
+    def path_slots(self, path_id: int) -> List[int]:
+        """Slots of the live routes using a path."""
+        slots = []
+        slot = self.path_head.get(path_id, NO_SLOT)
+        while slot != NO_SLOT:
+            slots.append(slot)
+            slot = self.path_next[slot]
+        return slots
+
+    def _route_info(self, slot: int) -> Dict:
+        columns = self.columns
+        path_id = columns["path"][slot]
+        peer_asn, peer_address = self.peers[columns["peer"][slot]]
+        return {
+            "prefix": self.prefixes.values[columns["prefix"][slot]],
+            "peer_asn": peer_asn,
+            "peer_address": peer_address,
+            "origin_as": columns["origin"][slot],
+            "as_path": self.paths.get(path_id),
+            "path_id": path_id,
+            "collectors": self.collector_names(columns["collectors"][slot]),
+        }
+
+    def collector_names(self, mask: int) -> List[str]:
+        """Collectors whose bits are set in a route collector mask."""
+        return [name for i, name in enumerate(self.collectors.values) if mask >> i & 1]
+
+    def routes_through(self, asn: int) -> List[Dict]:
+        """Live routes whose AS path carries an AS in transit."""
+        return [self._route_info(slot)
+                for path_id in self.paths.paths_through(asn) for slot in self.path_slots(path_id)]
+
+    def routes_via_adjacency(self, left: int, right: int) -> List[Dict]:
+        """Live routes whose AS path crosses the link between two ASes."""
+        return [self._route_info(slot)
+                for path_id in self.paths.paths_with_adjacency(left, right) for slot in self.path_slots(path_id)]
+
+    def to_radix_trees(self):
+        """Build legacy py-radix trees holding each prefix's shortest-path route."""
+        import radix
+
+        snapshot = self.freeze()
+        rtree_v4 = radix.Radix()
+        rtree_v6 = radix.Radix()
+        for pid in range(len(snapshot)):
+            tree = rtree_v4 if pid < snapshot.n_v4 else rtree_v6
+            data = snapshot.route_data(pid)
+            rnode = tree.add(snapshot.prefix(pid))
+            rnode.data["origin_as"] = data["origin_as"]
+            rnode.data["as_path"] = self.paths.as_tuple(data["path_id"])
+            rnode.data["path_id"] = data["path_id"]
+        return rtree_v4, rtree_v6
+
+
+def load_rib_table(path: str) -> Optional[RibTable]:
+    """Load a RibTable from a snapshot file, or None if it does not exist."""
+    if not os.path.exists(path):
+        return None
+    return RibTable.from_snapshot(RibSnapshot.open(path))
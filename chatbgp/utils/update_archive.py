@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Parquet archive of closed hours of BGP updates
+
+The live updates table only keeps recent hours. Once an hour is closed (no
+longer within ARCHIVE_AFTER of the newest update), its rows are written as
+zstd-compressed Parquet, sorted by address range, under
+
+    <archive_dir>/collector=<name>/date=<YYYY-MM-DD>/hour=<H>/part_<uuid>.parquet
+
+and removed from the table. Readers get a single relation over both tiers
+from updates_relation(): the file list is built from the partition
+directories that overlap the requested time window (and collectors), so the
+archive bytes scanned grow with the window rather than with total history,
+and the prefix/timestamp predicates are pushed into Parquet row-group
+statistics (the numeric prefix range columns make covering/covered-prefix
+predicates prunable the same way). INET columns are archived as text, so the relation exposes
+prefix, peer_address and next_hop as VARCHAR for both tiers.
+
+Archiving an hour is idempotent: its Parquet files are first written under
+<archive_dir>/_staging/, then the rows are deleted from the live table and
+the staging directory is logged in ARCHIVE_LOG_TABLE in one transaction,
+and only then are the files moved into their partitions. After a crash, a
+staging directory that was logged is published and one that was not is
+discarded (its rows are still live and are archived again). The live side of
+updates_relation() also skips every hour that has archive partitions, so a
+reader never sees an hour twice, even through a copy of the database taken
+before the hour was archived.
+"""
+
+import glob
+import os
+import shutil
+import uuid
+from datetime import datetime, timedelta
+from typing import List, Optional, Sequence, Tuple
+
+from .bgp_to_duckdb import AS_PATH_COLUMNS, PREFIX_RANGE_COLUMNS, UPDATE_COLUMNS, UPDATES_TABLE_NAME, prefix_range_filter
+from .ip_prefix import inet_text
+
+ARCHIVE_DIR = "data/bgp_data/archive"
+ARCHIVE_AFTER = timedelta(hours=1)
+ARCHIVE_LOG_TABLE = "archive_log"
+STAGING_DIR = "_staging"
+
+_INET_COLUMNS = ("peer_address", "prefix", "next_hop")
+_COLUMNS = UPDATE_COLUMNS + PREFIX_RANGE_COLUMNS + AS_PATH_COLUMNS
+
+
+def _hour(ts: datetime) -> datetime:
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+
+def _text_columns() -> str:
+    return ", ".join(f"CAST({c} AS VARCHAR) AS {c}" if c in _INET_COLUMNS else c for c in _COLUMNS)
+
+
+def closed_hours(con, table_name: str = UPDATES_TABLE_NAME, after: timedelta = ARCHIVE_AFTER) -> List[datetime]:
+    """Hours with rows in the live table that ended at least `after` before its newest update."""
+    latest = con.execute(f"SELECT max(timestamp) FROM {table_name}").fetchone()[0]
+    if latest is None:
+        return []
+    rows = con.execute(f"""
+        SELECT DISTINCT date_trunc('hour', timestamp) AS hour
+        FROM {table_name}
+        WHERE timestamp < ?
+        ORDER BY hour
+    """, [_hour(latest - after)]).fetchall()
+    return [row[0] for row in rows]
+
+
+def create_archive_log_table(con):
+    """Creates the table recording archived hours (and their staging directories) if it doesn't exist."""
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {ARCHIVE_LOG_TABLE} (
+            staging VARCHAR PRIMARY KEY,
+            hour TIMESTAMP,
+            rows BIGINT,
+            archived_at TIMESTAMP
+        )
+    """)
+
+
+def _publish(staging: str, archive_dir: str):
+    """Move the partition files of a staging directory into the archive and remove it."""
+    for path in glob.glob(os.path.join(staging, "collector=*", "date=*", "hour=*", "*.parquet")):
+        target = os.path.join(archive_dir, os.path.relpath(path, staging))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(path, target)
+    shutil.rmtree(staging, ignore_errors=True)
+
+
+def recover_staged_hours(con, archive_dir: str = ARCHIVE_DIR) -> List[str]:
+    """
+    Finish archiving interrupted by a crash: publish the staging directories
+    whose delete committed (those in the log) and discard the others.
+    Returns the published ones.
+    """
+    staging_root = os.path.join(archive_dir, STAGING_DIR)
+    if not os.path.isdir(staging_root):
+        return []
+    logged = {row[0] for row in con.execute(f"SELECT staging FROM {ARCHIVE_LOG_TABLE}").fetchall()}
+    published = []
+    for name in sorted(os.listdir(staging_root)):
+        staging = os.path.join(staging_root, name)
+        if name in logged:
+            _publish(staging, archive_dir)
+            published.append(name)
+        else:
+            shutil.rmtree(staging, ignore_errors=True)
+    return published
+
+
+def archive_hour(con, hour: datetime, archive_dir: str = ARCHIVE_DIR, table_name: str = UPDATES_TABLE_NAME) -> int:
+    """Move one hour of updates from the live table to the Parquet archive. Returns the row count."""
+    start, end = hour, hour + timedelta(hours=1)
+    count = con.execute(f"SELECT count(*) FROM {table_name} WHERE timestamp >= ? AND timestamp < ?",
+                        [start, end]).fetchone()[0]
+    if not count:
+        return 0
+
+    name = f"{hour:%Y%m%d%H}_{uuid.uuid4().hex}"
+    staging = os.path.join(archive_dir, STAGING_DIR, name)
+    os.makedirs(staging)
+    # rowid keeps the arrival order of updates sharing a timestamp (seq)
+    con.execute(f"""
+        COPY (
+            SELECT {_text_columns()}, rowid AS seq,
+                   strftime(timestamp, '%Y-%m-%d') AS date, hour(timestamp) AS hour
+            FROM {table_name}
+            WHERE timestamp >= ? AND timestamp < ?
+            ORDER BY ip_version, start_hi, start_lo, prefix_len, timestamp, seq
+        ) TO '{staging}' (FORMAT PARQUET, COMPRESSION ZSTD, PARTITION_BY (collector, date, hour),
+                          FILENAME_PATTERN 'part_{{uuid}}', OVERWRITE_OR_IGNORE true)
+    """, [start, end])
+    con.execute("BEGIN TRANSACTION")
+    try:
+        con.execute(f"DELETE FROM {table_name} WHERE timestamp >= ? AND timestamp < ?", [start, end])
+        con.execute(f"INSERT INTO {ARCHIVE_LOG_TABLE} VALUES (?, ?, ?, now()::TIMESTAMP)", [name, hour, count])
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    _publish(staging, archive_dir)
+    return count
+
+
+def archive_closed_hours(con, archive_dir: str = ARCHIVE_DIR, table_name: str = UPDATES_TABLE_NAME,
+                         after: timedelta = ARCHIVE_AFTER) -> List[Tuple[datetime, int]]:
+    """Archive every closed hour of the live table. Returns (hour, rows) for each archived hour."""
+    create_archive_log_table(con)
+    recover_staged_hours(con, archive_dir)
+    return [(hour, archive_hour(con, hour, archive_dir, table_name))
+            for hour in closed_hours(con, table_name, after)]
+
+
+def _partitions(start: Optional[datetime] = None, end: Optional[datetime] = None,
+                collectors: Optional[Sequence[str]] = None,
+                archive_dir: str = ARCHIVE_DIR) -> List[Tuple[datetime, List[str]]]:
+    """(hour, Parquet files) of the partitions overlapping a time window (open-ended without start/end)."""
+    if not os.path.isdir(archive_dir):
+        return []
+    if collectors:
+        collector_dirs = [os.path.join(archive_dir, f"collector={c}") for c in collectors]
+    else:
+        collector_dirs = glob.glob(os.path.join(archive_dir, "collector=*"))
+
+    first = _hour(start) if start else None
+    last = _hour(end) if end else None
+    partitions = []
+    for collector_dir in collector_dirs:
+        for hour_dir in glob.glob(os.path.join(collector_dir, "date=*", "hour=*")):
+            date = os.path.basename(os.path.dirname(hour_dir)).split("=", 1)[1]
+            hour = int(os.path.basename(hour_dir).split("=", 1)[1])
+            partition = datetime.strptime(date, "%Y-%m-%d") + timedelta(hours=hour)
+            if (first is None or partition >= first) and (last is None or partition <= last):
+                files = glob.glob(os.path.join(hour_dir, "*.parquet"))
+                if files:
+                    partitions.append((partition, files))
+    return partitions
+
+
+def archive_files(start: Optional[datetime] = None, end: Optional[datetime] = None,
+                  collectors: Optional[Sequence[str]] = None, archive_dir: str = ARCHIVE_DIR) -> List[str]:
+    """Parquet files of the partitions overlapping a time window (open-ended without start/end)."""
+    return sorted(f for _, files in _partitions(start, end, collectors, archive_dir) for f in files)
+
+
+def _hour_ranges(hours) -> List[Tuple[datetime, datetime]]:
+    """Consecutive hours merged into [start, end) ranges."""
+    ranges = []
+    for hour in sorted(set(hours)):
+        if ranges and ranges[-1][1] == hour:
+            ranges[-1] = (ranges[-1][0], hour + timedelta(hours=1))
+        else:
+            ranges.append((hour, hour + timedelta(hours=1)))
+    return ranges
+
+
+def updates_relation(start: Optional[datetime] = None, end: Optional[datetime] = None,
+                     prefixes: Optional[Sequence[str]] = None, collectors: Optional[Sequence[str]] = None,
+                     archive_dir: str = ARCHIVE_DIR, table_name: str = UPDATES_TABLE_NAME,
+                     prefix_match: str = "exact") -> Tuple[str, list]:
+    """
+    SQL subquery (and its parameters) over the live table and the archive,
+    restricted to a time window (start exclusive, end inclusive), prefixes
+    and collectors. prefix_match widens the prefix filter to prefixes
+    "covering", "covered" by or "related" to (either) the given ones, see
+    prefix_range_filter. Columns are UPDATE_COLUMNS, PREFIX_RANGE_COLUMNS,
+    AS_PATH_COLUMNS, tier (0 archive, 1 live) and seq; ordering by (timestamp, tier, seq)
+    gives arrival order.
+    """
+    filters, params = [], []
+    if start is not None:
+        filters.append("timestamp > ?")
+        params.append(start)
+    if end is not None:
+        filters.append("timestamp <= ?")
+        params.append(end)
+    if collectors:
+        filters.append(f"collector IN ({', '.join('?' * len(collectors))})")
+        params.extend(collectors)
+    if prefixes is not None and prefix_match != "exact":
+        range_filter, range_params = prefix_range_filter(prefixes, prefix_match)
+        filters.append(range_filter)
+        params.extend(range_params)
+    elif prefixes is not None:
+        prefix_params = [inet_text(p) for p in prefixes]
+        filters.append(f"prefix IN ({', '.join('?' * len(prefix_params))})")
+        params.extend(prefix_params)
+    where = f"WHERE {' AND '.join(filters)}" if filters else ""
+
+    partitions = _partitions(start, end, collectors, archive_dir)
+    if not partitions:
+        live = f"SELECT {_text_columns()}, 1 AS tier, rowid AS seq FROM {table_name} {where}"
+        return f"({live})", params
+
+    # Archived hours are read from the archive only, even where the live table still has them
+    live_filters, live_params = list(filters), list(params)
+    for first, last in _hour_ranges(hour for hour, _ in partitions):
+        live_filters.append("NOT (timestamp >= ? AND timestamp < ?)")
+        live_params.extend([first, last])
+    live = (f"SELECT {_text_columns()}, 1 AS tier, rowid AS seq FROM {table_name} "
+            f"WHERE {' AND '.join(live_filters)}")
+    files = sorted(f for _, files in partitions for f in files)
+    file_list = ", ".join("'" + f.replace("'", "''") + "'" for f in files)
+    # union_by_name reads files archived before the range and path columns existed (as NULLs)
+    archived = (f"SELECT {', '.join(_COLUMNS)}, 0 AS tier, seq "
+                f"FROM read_parquet([{file_list}], hive_partitioning = true, union_by_name = true) {where}")
+    return f"({live} UNION ALL {archived})", live_params + params
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Columnar batches of BGP updates
+
+An UpdateBatch holds a run of updates as typed arrays instead of one BGPUpdate
+object each: timestamps as int64 microseconds since the epoch, update types
+as uint8 codes, ASNs, MED, local-pref and path ids as int64 (NO_ID when
+absent), and every string attribute (prefix, collector, peer address, AS path
+string, next hop, communities, aggregator) as int32 ids into a list of the
+batch's distinct values. A busy collector repeats the same prefixes, peers
+and paths within a batch, so most appends are one dictionary lookup, and
+consumers resolve each distinct value once (a path's id, a prefix's RIB id)
+instead of once per update. Batches pickle as a handful of arrays, which is
+what worker processes send back.
+
+Parsing builds batches with UpdateBatchBuilder; DuckDB ingestion, the RIB
+table, the journal and the summaries take them directly, and updates()
+materializes BGPUpdates for code that still wants objects.
+"""
+
+from array import array
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+NO_ID = -1
+ANNOUNCE = 1
+WITHDRAW = 2
+UPDATE_TYPES = ["", "A", "W"]  # code -> BGPUpdate.update_type
+_TYPE_CODES = {"A": ANNOUNCE, "W": WITHDRAW}
+
+STRING_COLUMNS = ("prefix", "collector", "peer_address", "as_path", "next_hop", "communities", "aggregator")
+INT_COLUMNS = ("peer_asn", "origin_as", "med", "local_pref", "path_id")
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def to_microseconds(timestamp) -> int:
+    """Microseconds since the epoch of a naive-UTC datetime or epoch seconds."""
+    if isinstance(timestamp, datetime):
+        return (timestamp - _EPOCH) // _MICROSECOND
+    return int(round(float(timestamp) * 1e6))
+
+
+def _optional_int(value) -> int:
+    if value is None or value == "":
+        return NO_ID
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return NO_ID
+
+
+def to_datetime(microseconds: int) -> datetime:
+    """Naive-UTC datetime of a batch timestamp."""
+    return _EPOCH + timedelta(microseconds=int(microseconds))
+
+
+class UpdateBatchBuilder:
+    """Appends updates column by column and builds an UpdateBatch."""
+
+    def __init__(self):
+        self.timestamp = array("q")
+        self.update_type = array("B")
+        self.atomic_aggregate = array("B")
+        self.ints = {name: array("q") for name in INT_COLUMNS}
+        self.strings = {name: array("i") for name in STRING_COLUMNS}
+        self.ids: Dict[str, Dict[str, int]] = {name: {} for name in STRING_COLUMNS}
+        self._int_columns = list(self.ints.values())
+        self._string_columns = list(self.strings.values())
+
+    def __len__(self) -> int:
+        return len(self.timestamp)
+
+    def _string_id(self, column: str, value) -> int:
+        if value is None:
+            return NO_ID
+        ids = self.ids[column]
+        idx = ids.get(value)
+        if idx is None:
+            idx = ids[value] = len(ids)
+        return idx
+
+    def append(self, timestamp, update_type: str, prefix: Optional[str], as_path: Optional[str] = None,
+               origin_as=None, collector: Optional[str] = None, peer_asn=None, peer_address: Optional[str] = None,
+               next_hop: Optional[str] = None, communities: Optional[str] = None, med=None, local_pref=None,
+               atomic_aggregate: bool = False, aggregator: Optional[str] = None, path_id: Optional[int] = None):
+        """Append one update; timestamp is a naive-UTC datetime or epoch seconds."""
+        # Convert everything first, so a bad value leaves the columns aligned
+        microseconds = to_microseconds(timestamp)
+        ints = (_optional_int(peer_asn), _optional_int(origin_as), _optional_int(med), _optional_int(local_pref),
+                NO_ID if path_id is None else path_id)
+        string_id = self._string_id
+        strings = (string_id("prefix", prefix), string_id("collector", collector),
+                   string_id("peer_address", peer_address), string_id("as_path", as_path),
+                   string_id("next_hop", next_hop), string_id("communities", communities),
+                   string_id("aggregator", aggregator))
+        self.timestamp.append(microseconds)
+        self.update_type.append(_TYPE_CODES.get(update_type, 0))
+        self.atomic_aggregate.append(1 if atomic_aggregate else 0)
+        for column, value in zip(self._int_columns, ints):
+            column.append(value)
+        for column, value in zip(self._string_columns, strings):
+            column.append(value)
+
+    def append_update(self, update):
+        """Append a BGPUpdate (or any object with its fields)."""
+        self.append(update.timestamp, update.update_type, update.prefix, update.as_path, update.origin_as,
+                    update.collector, update.peer_asn, update.peer_address, update.next_hop, update.communities,
+                    update.med, update.local_pref, update.atomic_aggregate, update.aggregator, update.path_id)
+
+    def build(self) -> "UpdateBatch":
+        columns = {
+            "timestamp": np.frombuffer(self.timestamp, dtype=np.int64).copy(),
+            "update_type": np.frombuffer(self.update_type, dtype=np.uint8).copy(),
+            "atomic_aggregate": np.frombuffer(self.atomic_aggregate, dtype=np.uint8).astype(bool),
+        }
+        for name, values in self.ints.items():
+            columns[name] = np.frombuffer(values, dtype=np.int64).copy()
+        for name, values in self.strings.items():
+            columns[name] = np.frombuffer(values, dtype=np.int32).copy()
+        return UpdateBatch(columns, {name: list(ids) for name, ids in self.ids.items()})
+
+
+class UpdateBatch:
+    """A run of updates in stream order, stored as typed columns (see the module docstring)."""
+
+    def __init__(self, columns: Dict[str, np.ndarray], values: Dict[str, List[str]]):
+        self.columns = columns
+        self.values = values
+
+    def __len__(self) -> int:
+        return len(self.columns["timestamp"])
+
+    @classmethod
+    def empty(cls) -> "UpdateBatch":
+        return UpdateBatchBuilder().build()
+
+    @classmethod
+    def from_updates(cls, updates) -> "UpdateBatch":
+        """
+        Build a batch from BGPUpdates, a column at a time. If some update
+        cannot be converted, the batch is built update by update instead,
+        skipping those that fail.
+        """
+        updates = list(updates)
+        try:
+            return cls._from_columns(updates)
+        except (TypeError, ValueError, OverflowError):
+            pass
+        builder = UpdateBatchBuilder()
+        for update in updates:
+            try:
+                builder.append_update(update)
+            except (TypeError, ValueError, OverflowError):
+                continue
+        return builder.build()
+
+    @classmethod
+    def _from_columns(cls, updates) -> "UpdateBatch":
+        timestamps = [u.timestamp for u in updates]
+        if not all(isinstance(t, datetime) for t in timestamps):
+            raise TypeError("timestamps must be datetimes")
+        columns = {
+            "timestamp": pd.DatetimeIndex(timestamps).as_unit("us").asi8.copy(),
+            "update_type": np.array([_TYPE_CODES.get(u.update_type, 0) for u in updates], dtype=np.uint8),
+            "atomic_aggregate": np.array([bool(u.atomic_aggregate) for u in updates], dtype=bool),
+        }
+        for name in INT_COLUMNS:
+            values = pd.to_numeric(pd.Series([getattr(u, name) for u in updates], dtype=object), errors="coerce")
+            values = values.where(values == values.round())
+            columns[name] = values.fillna(NO_ID).to_numpy(dtype=np.int64)
+        values = {}
+        for name in STRING_COLUMNS:
+            codes, uniques = pd.factorize(np.array([getattr(u, name) for u in updates], dtype=object))
+            columns[name] = codes.astype(np.int32)
+            values[name] = list(uniques)
+        return cls(columns, values)
+
+    @classmethod
+    def concat(cls, batches: Sequence["UpdateBatch"]) -> "UpdateBatch":
+        """One batch with the updates of several, in order; string ids are remapped to merged value lists."""
+        batches = [batch for batch in batches if len(batch)]
+        if len(batches) == 1:
+            return batches[0]
+        if not batches:
+            return cls.empty()
+        columns = {name: np.concatenate([batch.columns[name] for batch in batches])
+                   for name in batches[0].columns if name not in STRING_COLUMNS}
+        values = {}
+        for name in STRING_COLUMNS:
+            ids: Dict[str, int] = {}
+            parts = []
+            for batch in batches:
+                remap = np.array([ids.setdefault(value, len(ids)) for value in batch.values[name]] + [NO_ID],
+                                 dtype=np.int32)
+                parts.append(remap[batch.columns[name]])
+            columns[name] = np.concatenate(parts)
+            values[name] = list(ids)
+        return cls(columns, values)
+
+    def take(self, index) -> "UpdateBatch":
+        """The updates selected by a boolean mask or an index array, sharing the value lists."""
+        return UpdateBatch({name: column[index] for name, column in self.columns.items()}, self.values)
+
+    def strings(self, name: str) -> np.ndarray:
+        """A string column decoded to an object array (None where absent)."""
+        lookup = np.array(self.values[name] + [None], dtype=object)
+        return lookup[self.columns[name]]
+
+    def decoded(self, name: str) -> list:
+        """A column as a list of Python values: strings, ints or None where absent, update types as 'A'/'W'."""
+        if name in STRING_COLUMNS:
+            return self.strings(name).tolist()
+        if name == "update_type":
+            return [UPDATE_TYPES[code] for code in self.columns[name].tolist()]
+        if name in INT_COLUMNS:
+            return [None if v == NO_ID else v for v in self.columns[name].tolist()]
+        return self.columns[name].tolist()
+
+    @property
+    def first_time(self) -> Optional[datetime]:
+        return to_datetime(self.columns["timestamp"][0]) if len(self) else None
+
+    @property
+    def last_time(self) -> Optional[datetime]:
+        return to_datetime(self.columns["timestamp"][-1]) if len(self) else None
+
+    def updates(self) -> Iterator:
+        """Materialize the updates as BGPUpdates."""
+        from .bgp_stream_wrapper import BGPUpdate
+        names = ("timestamp", "prefix", "as_path", "update_type", "origin_as", "collector", "peer_asn",
+                 "peer_address", "next_hop", "communities", "med", "local_pref", "atomic_aggregate",
+                 "aggregator", "path_id")
+        columns = [self.decoded(name) for name in names]
+        columns[0] = [to_datetime(t) for t in columns[0]]
+        columns[4] = [None if origin is None else str(origin) for origin in columns[4]]
+        for row in zip(*columns):
+            yield BGPUpdate(**dict(zip(names, row)))
+
+    def summary(self) -> Dict:
+        """Counts, distinct AS paths, time range and final state of the batch."""
+        if not len(self):
+            return {"total_updates": 0, "status": "No updates found"}
+        types = self.columns["update_type"]
+        timestamps = self.columns["timestamp"]
+        nonempty = np.array([bool(path) for path in self.values["as_path"]] + [False])
+        as_paths = self.columns["as_path"]
+        # The latest update, the last one in stream order if several share its timestamp
+        last = len(self) - 1 - int(np.argmax(timestamps[::-1] == timestamps.max()))
+        return {
+            "total_updates": len(self),
+            "announcements": int((types == ANNOUNCE).sum()),
+            "withdrawals": int((types == WITHDRAW).sum()),
+            "unique_as_paths": int(len(np.unique(as_paths[nonempty[as_paths]]))),
+            "time_range": {
+                "start": to_datetime(timestamps.min()).isoformat(),
+                "end": to_datetime(timestamps.max()).isoformat()
+            },
+            "most_recent_state": "withdrawn" if types[last] == WITHDRAW else "announced"
+        }
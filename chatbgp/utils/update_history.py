@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Bounded reads of stored BGP updates
+
+Historical questions about a busy prefix can match hundreds of thousands of
+updates. stream_updates() yields the newest updates in fetch_size chunks up to
+a row limit, so only that many rows are ever materialized in Python, and
+summarize_updates() answers the rest with one aggregate query (counts per
+type, distinct paths, first/last seen, origins and origin changes) computed
+by DuckDB over the same window.
+"""
+
+from datetime import datetime
+from typing import Any, Dict, Iterator, Optional, Sequence
+
+from .update_archive import ARCHIVE_DIR, updates_relation
+
+FETCH_SIZE = 1000
+TOP_ENTRIES = 10
+
+_HISTORY_COLUMNS = ["prefix", "origin_as", "timestamp", "update_type", "as_path"]
+
+
+def stream_updates(con, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                   prefixes: Optional[Sequence[str]] = None, collectors: Optional[Sequence[str]] = None,
+                   prefix_match: str = "exact", archive_dir: str = ARCHIVE_DIR, limit: Optional[int] = None,
+                   fetch_size: int = FETCH_SIZE) -> Iterator[Dict[str, Any]]:
+    """
+    Updates in a window, newest first, at most `limit` of them, fetched in
+    chunks. The connection's result is consumed lazily, so finish (or close)
+    the iterator before running other queries on the same connection.
+    """
+    updates_sql, params = updates_relation(start, end, prefixes, collectors, archive_dir,
+                                           prefix_match=prefix_match)
+    sql = (f"SELECT {', '.join(_HISTORY_COLUMNS)} FROM {updates_sql} "
+           f"ORDER BY timestamp DESC, tier DESC, seq DESC")
+    if limit is not None:
+        sql += " LIMIT ?"
+        params = params + [limit]
+    cursor = con.execute(sql, params)
+    while True:
+        rows = cursor.fetchmany(fetch_size)
+        if not rows:
+            return
+        for row in rows:
+            yield dict(zip(_HISTORY_COLUMNS, row))
+
+
+def summarize_updates(con, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                      prefixes: Optional[Sequence[str]] = None, collectors: Optional[Sequence[str]] = None,
+                      prefix_match: str = "exact", archive_dir: str = ARCHIVE_DIR,
+                      top: int = TOP_ENTRIES) -> Dict[str, Any]:
+    """
+    Aggregates over the updates in a window: totals per type, distinct paths,
+    prefixes and peers, first/last seen, origin changes (an announcement
+    whose origin differs from the same peer's previous one for the prefix),
+    and the `top` most announced origins and most active prefixes.
+    """
+    updates_sql, params = updates_relation(start, end, prefixes, collectors, archive_dir,
+                                           prefix_match=prefix_match)
+    cursor = con.execute(f"""
+        WITH u AS MATERIALIZED (
+            SELECT prefix, peer_address, peer_asn, update_type, as_path, origin_as, timestamp, tier, seq
+            FROM {updates_sql}
+        ),
+        totals AS (
+            SELECT count(*) AS total,
+                   count(*) FILTER (WHERE update_type = 'A') AS announcements,
+                   count(*) FILTER (WHERE update_type = 'W') AS withdrawals,
+                   count(DISTINCT as_path) FILTER (WHERE update_type = 'A') AS distinct_paths,
+                   count(DISTINCT prefix) AS prefix_count,
+                   count(DISTINCT (peer_address, peer_asn)) AS peer_count,
+                   min(timestamp) AS first_seen,
+                   max(timestamp) AS last_seen
+            FROM u
+        ),
+        changes AS (
+            SELECT count(*) FILTER (WHERE previous IS NOT NULL AND origin_as IS DISTINCT FROM previous)
+                   AS origin_changes
+            FROM (
+                SELECT origin_as, lag(origin_as) OVER (
+                    PARTITION BY prefix, peer_address, peer_asn ORDER BY timestamp, tier, seq
+                ) AS previous
+                FROM u
+                WHERE update_type = 'A'
+            )
+        ),
+        origins AS (
+            SELECT list({{'origin_as': origin_as, 'announcements': n, 'first_seen': f, 'last_seen': l}}
+                        ORDER BY n DESC)[1:?] AS origins
+            FROM (
+                SELECT origin_as, count(*) AS n, min(timestamp) AS f, max(timestamp) AS l
+                FROM u WHERE update_type = 'A'
+                GROUP BY origin_as
+            )
+        ),
+        active AS (
+            SELECT list({{'prefix': prefix, 'updates': n}} ORDER BY n DESC)[1:?] AS prefixes
+            FROM (SELECT prefix, count(*) AS n FROM u GROUP BY prefix)
+        )
+        SELECT * FROM totals, changes, origins, active
+    """, params + [top, top])
+    columns = [d[0] for d in cursor.description]
+    summary = dict(zip(columns, cursor.fetchone()))
+    summary["origins"] = summary["origins"] or []
+    summary["prefixes"] = summary["prefixes"] or []
+    summary.update(start=start, end=end)
+    return summary
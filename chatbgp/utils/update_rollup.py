@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Per-prefix, per-minute rollups of BGP updates for flap detection
+
+Every batch the UpdateWriter commits is also folded into prefix_minute_rollup,
+keyed by (minute, collector, prefix): announcement and withdrawal counts,
+state transitions (an update whose type differs from the previous update of
+the same prefix from the same peer), path changes (an announcement whose path
+differs from the peer's previous announcement) and the hashes of the distinct
+paths seen. The last state of each (collector, prefix, peer) is kept in
+prefix_peer_state so transitions spanning batches are counted too. Flap
+questions, for one prefix or the whole table, then read one row per active
+prefix and minute instead of the raw updates.
+"""
+
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence
+
+from .ip_prefix import inet_text
+
+ROLLUP_TABLE_NAME = "prefix_minute_rollup"
+PEER_STATE_TABLE_NAME = "prefix_peer_state"
+FLAP_WINDOW = timedelta(hours=1)
+MIN_FLAP_TRANSITIONS = 4
+
+# The batch's valid rows, keyed like the rollup; seq is the arrival order within the batch
+_BATCH_SQL = """
+    SELECT date_trunc('minute', timestamp) AS minute, timestamp, seq,
+           coalesce(collector, '') AS collector,
+           CAST(CAST(prefix AS INET) AS VARCHAR) AS prefix,
+           coalesce(CAST(peer_address AS VARCHAR), '') AS peer_address,
+           coalesce(peer_asn, -1) AS peer_asn,
+           update_type,
+           CASE WHEN update_type = 'A' THEN hash(as_path) END AS path_hash
+    FROM {view}
+    WHERE nullif(trim(prefix), '') IS NOT NULL AND update_type IN ('A', 'W')
+"""
+
+
+def create_rollup_tables(con):
+    """Creates the rollup and peer state tables if they don't exist."""
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {ROLLUP_TABLE_NAME} (
+            minute TIMESTAMP,
+            collector VARCHAR,
+            prefix VARCHAR,
+            announcements BIGINT,
+            withdrawals BIGINT,
+            transitions BIGINT,
+            path_changes BIGINT,
+            path_hashes UBIGINT[],
+            PRIMARY KEY (minute, collector, prefix)
+        );
+    """)
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {PEER_STATE_TABLE_NAME} (
+            collector VARCHAR,
+            prefix VARCHAR,
+            peer_address VARCHAR,
+            peer_asn BIGINT,
+            update_type CHAR(1),
+            path_hash UBIGINT,
+            PRIMARY KEY (collector, prefix, peer_address, peer_asn)
+        );
+    """)
+
+
+def rollup_batch(con, view: str = "update_batch"):
+    """
+    Fold a batch of updates (a registered frame or view with the update
+    columns and a seq column) into the rollup and the peer state. Runs in the
+    caller's transaction, so it commits together with the batch itself.
+    """
+    batch_sql = _BATCH_SQL.format(view=view)
+    con.execute(f"""
+        INSERT INTO {ROLLUP_TABLE_NAME}
+        WITH batch AS ({batch_sql}),
+        ordered AS (
+            SELECT *,
+                   lag(update_type) OVER w AS previous_type,
+                   lag(path_hash IGNORE NULLS) OVER w AS previous_path
+            FROM batch
+            WINDOW w AS (PARTITION BY collector, prefix, peer_address, peer_asn ORDER BY timestamp, seq)
+        ),
+        changes AS (
+            SELECT o.minute, o.collector, o.prefix, o.update_type, o.path_hash,
+                   coalesce(o.previous_type, s.update_type) AS previous_type,
+                   coalesce(o.previous_path, s.path_hash) AS previous_path
+            FROM ordered o
+            LEFT JOIN {PEER_STATE_TABLE_NAME} s
+              ON s.collector = o.collector AND s.prefix = o.prefix
+             AND s.peer_address = o.peer_address AND s.peer_asn = o.peer_asn
+        )
+        SELECT minute, collector, prefix,
+               count(*) FILTER (WHERE update_type = 'A'),
+               count(*) FILTER (WHERE update_type = 'W'),
+               count(*) FILTER (WHERE update_type != previous_type),
+               count(*) FILTER (WHERE update_type = 'A' AND path_hash != previous_path),
+               coalesce(list_distinct(list(path_hash)), [])
+        FROM changes
+        GROUP BY minute, collector, prefix
+        ON CONFLICT DO UPDATE SET
+            announcements = announcements + EXCLUDED.announcements,
+            withdrawals = withdrawals + EXCLUDED.withdrawals,
+            transitions = transitions + EXCLUDED.transitions,
+            path_changes = path_changes + EXCLUDED.path_changes,
+            path_hashes = list_distinct(list_concat(path_hashes, EXCLUDED.path_hashes))
+    """)
+    con.execute(f"""
+        INSERT INTO {PEER_STATE_TABLE_NAME}
+        WITH batch AS ({batch_sql})
+        SELECT collector, prefix, peer_address, peer_asn,
+               arg_max(update_type, (timestamp, seq)),
+               arg_max(path_hash, (timestamp, seq)) FILTER (WHERE path_hash IS NOT NULL)
+        FROM batch
+        GROUP BY collector, prefix, peer_address, peer_asn
+        ON CONFLICT DO UPDATE SET
+            update_type = EXCLUDED.update_type,
+            path_hash = coalesce(EXCLUDED.path_hash, path_hash)
+    """)
+
+
+def latest_rollup_minute(con) -> Optional[datetime]:
+    """The newest minute with rolled-up updates."""
+    return con.execute(f"SELECT max(minute) FROM {ROLLUP_TABLE_NAME}").fetchone()[0]
+
+
+def _window_filter(start: datetime, end: datetime, collectors: Optional[Sequence[str]]):
+    filters, params = ["minute > ?", "minute <= ?"], [start, end]
+    if collectors:
+        filters.append(f"collector IN ({', '.join('?' * len(collectors))})")
+        params.extend(collectors)
+    return " AND ".join(filters), params
+
+
+def flapping_prefixes(con, end: Optional[datetime] = None, window: timedelta = FLAP_WINDOW,
+                      min_transitions: int = MIN_FLAP_TRANSITIONS, collectors: Optional[Sequence[str]] = None,
+                      limit: int = 50) -> List[Dict[str, Any]]:
+    """Prefixes with at least min_transitions state transitions in the window ending at `end`, most first."""
+    end = end or latest_rollup_minute(con)
+    if end is None:
+        return []
+    where, params = _window_filter(end - window, end, collectors)
+    cursor = con.execute(f"""
+        SELECT prefix,
+               sum(transitions) AS transitions,
+               sum(announcements) AS announcements,
+               sum(withdrawals) AS withdrawals,
+               sum(path_changes) AS path_changes,
+               len(list_distinct(flatten(list(path_hashes)))) AS distinct_paths,
+               count(DISTINCT minute) AS active_minutes,
+               max(minute) AS last_minute
+        FROM {ROLLUP_TABLE_NAME}
+        WHERE {where}
+        GROUP BY prefix
+        HAVING sum(transitions) >= ?
+        ORDER BY sum(transitions) DESC, sum(announcements) + sum(withdrawals) DESC
+        LIMIT ?
+    """, params + [min_transitions, limit])
+    columns = [d[0] for d in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def prefix_flap_summary(con, prefix: str, end: Optional[datetime] = None, window: timedelta = FLAP_WINDOW,
+                        min_transitions: int = MIN_FLAP_TRANSITIONS,
+                        collectors: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+    """Per-minute activity and totals of one prefix in the window ending at `end`."""
+    end = end or latest_rollup_minute(con)
+    if end is None:
+        return {"prefix": prefix, "minutes": [], "flap_detected": False}
+    where, params = _window_filter(end - window, end, collectors)
+    rows = con.execute(f"""
+        SELECT minute, sum(announcements), sum(withdrawals), sum(transitions), sum(path_changes),
+               len(list_distinct(flatten(list(path_hashes))))
+        FROM {ROLLUP_TABLE_NAME}
+        WHERE {where} AND prefix = ?
+        GROUP BY minute
+        ORDER BY minute
+    """, params + [inet_text(prefix)]).fetchall()
+    minutes = [{"minute": minute, "announcements": a, "withdrawals": w, "transitions": t,
+                "path_changes": p, "distinct_paths": d} for minute, a, w, t, p, d in rows]
+    transitions = sum(m["transitions"] for m in minutes)
+    return {
+        "prefix": prefix,
+        "start": end - window,
+        "end": end,
+        "minutes": minutes,
+        "announcements": sum(m["announcements"] for m in minutes),
+        "withdrawals": sum(m["withdrawals"] for m in minutes),
+        "transitions": transitions,
+        "path_changes": sum(m["path_changes"] for m in minutes),
+        "flap_detected": transitions >= min_transitions,
+    }